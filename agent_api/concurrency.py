@@ -0,0 +1,102 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of agent turns running at once in this process.
+
+    Requests wait up to queue_timeout seconds for a free slot; after that they
+    are turned away so the caller can answer 429 with a Retry-After hint
+    instead of piling more work onto a saturated process.
+    """
+
+    def __init__(self, max_concurrency, queue_timeout, retry_after):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = None
+        self._loop = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """Wait up to queue_timeout for a slot; returns False when rejected."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def release_threadsafe(self):
+        """release() from any thread, e.g. a response's close() run by sync_to_async."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop or self._loop is None:
+            self.release()
+        else:
+            self._loop.call_soon_threadsafe(self.release)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Async context manager yielding True if a slot was acquired."""
+        acquired = await self.acquire()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+class LimitedStreamingResponse(StreamingHttpResponse):
+    """
+    Streaming response that holds a limiter slot until it is closed.
+
+    The server closes the response when the stream ends and also when the
+    client disconnects before the body generator has started, so the slot is
+    returned in both cases.
+    """
+
+    def __init__(self, *args, limiter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._limiter = limiter
+        self._released = False
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._limiter.release_threadsafe()
+        super().close()
+
+
+agent_limiter = ConcurrencyLimiter(
+    max_concurrency=settings.AGENT_MAX_CONCURRENCY,
+    queue_timeout=settings.AGENT_QUEUE_TIMEOUT,
+    retry_after=settings.AGENT_RETRY_AFTER,
+)
@@ -0,0 +1,275 @@
+"""
+Durable background jobs stored in the Django database (SQLite by default).
+
+Work that doesn't have to finish before the reply (history writes, order side
+effects) is stored as a Job row and run by worker processes
+(`python manage.py run_jobs`), or by JOB_WORKER_THREADS worker threads inside
+the API process. A queued job survives the process that enqueued it being
+killed.
+
+- Tasks are functions registered by name with @task; a job's payload (JSON)
+  is passed to them as keyword arguments.
+- enqueue() with an idempotency key returns the existing job instead of adding
+  another, so a retried request doesn't repeat its side effects.
+- Workers claim a job with a conditional UPDATE, so it runs on one worker at a
+  time even with several processes sharing the database. A job left running
+  by a worker that died is queued again after JOB_LOCK_TIMEOUT.
+- A failed attempt is retried with exponential backoff until max_attempts;
+  then (or on PermanentJobError) the job is marked failed and kept.
+"""
+
+import importlib
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from telemetry import registry, span
+
+from .models import Job
+
+logger = logging.getLogger("jobs")
+
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Delay before the first retry; doubled on every further attempt up to RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+# Seconds after which a running job is assumed to have lost its worker
+LOCK_TIMEOUT_SECONDS = float(os.getenv("JOB_LOCK_TIMEOUT", "300"))
+POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Worker threads started in a process on its first enqueue (0: leave jobs to run_jobs)
+WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", "0"))
+# Succeeded jobs are deleted after this many days; failed ones are kept
+RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+# Modules registering tasks, imported before a worker starts
+TASK_MODULES = [name.strip() for name in os.getenv("JOB_TASK_MODULES", "agent_api.tasks").split(",") if name.strip()]
+
+jobs_total = registry.counter(
+    "agent_jobs_total", "Background job attempts by task and outcome (succeeded/retried/failed)")
+job_duration = registry.histogram(
+    "agent_job_duration_seconds", "Run time of background job attempts by task")
+job_queue_delay = registry.histogram(
+    "agent_job_queue_delay_seconds", "Time jobs waited between becoming due and starting, by task")
+
+_tasks = {}
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+class PermanentJobError(Exception):
+    """Raised by a task when retrying can't help; the job is marked failed at once."""
+
+
+def task(name: str):
+    """Register a function as the task run for jobs enqueued under `name`."""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def load_tasks() -> None:
+    """Import the JOB_TASK_MODULES so their tasks are registered."""
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+
+
+def enqueue(task_name: str, payload: dict = None, *, idempotency_key: str = None, delay: float = 0,
+            max_attempts: int = MAX_ATTEMPTS) -> Job:
+    """
+    Store a job for the workers.
+
+    Args:
+        task_name: Name the task was registered with.
+        payload: JSON-serializable keyword arguments for the task.
+        idempotency_key: When a job with this key exists, it is returned instead
+                         of enqueuing another.
+        delay: Seconds before the job may run.
+        max_attempts: Runs before the job is given up.
+
+    Returns:
+        Job: The new job, or the existing one with the same idempotency key.
+    """
+    fields = {
+        "task": task_name,
+        "payload": payload or {},
+        "run_at": timezone.now() + timedelta(seconds=delay),
+        "max_attempts": max_attempts,
+    }
+    if idempotency_key is None:
+        job = Job.objects.create(**fields)
+    else:
+        job, created = Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+        if not created:
+            logger.debug(f"Job {idempotency_key} already enqueued as #{job.pk}")
+            return job
+    _ensure_workers()
+    _wakeup.set()
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before the next attempt of a job that has failed `attempts` times."""
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+class JobWorker:
+    """
+    Claims due jobs and runs them, one at a time.
+
+    Args:
+        name: Identifies the worker in locked_by (host:pid:thread by default).
+        poll_interval: Seconds to wait for new jobs when the queue is empty.
+        lock_timeout: Seconds after which another worker's running job is requeued.
+    """
+
+    def __init__(self, name: str = None, poll_interval: float = POLL_INTERVAL_SECONDS,
+                 lock_timeout: float = LOCK_TIMEOUT_SECONDS):
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self._last_purge = 0.0
+
+    def run_forever(self, stop: threading.Event = None) -> None:
+        """Run jobs until `stop` is set; waits for the current job to finish."""
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                if self.run_pending(stop) == 0:
+                    _wakeup.wait(self.poll_interval)
+                    _wakeup.clear()
+        finally:
+            close_old_connections()
+
+    def run_pending(self, stop: threading.Event = None) -> int:
+        """Run every job that is due now; returns how many ran."""
+        close_old_connections()
+        self.requeue_stale()
+        self._maybe_purge()
+        ran = 0
+        while stop is None or not stop.is_set():
+            job = self.claim()
+            if job is None:
+                break
+            self.run(job)
+            ran += 1
+        return ran
+
+    def claim(self):
+        """Lock the next due job for this worker, or return None when there is none."""
+        now = timezone.now()
+        candidates = list(
+            Job.objects.filter(status=Job.QUEUED, run_at__lte=now).values_list("id", flat=True)[:10]
+        )
+        for job_id in candidates:
+            # Another worker may have claimed it since the select; only one update wins
+            claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+                status=Job.RUNNING, locked_by=self.name, locked_at=now, attempts=F("attempts") + 1
+            )
+            if claimed:
+                return Job.objects.get(id=job_id)
+        return None
+
+    def run(self, job: Job) -> None:
+        job_queue_delay.observe(max((timezone.now() - job.run_at).total_seconds(), 0), task=job.task)
+        started = time.perf_counter()
+        try:
+            func = _tasks.get(job.task)
+            if func is None:
+                raise PermanentJobError(f"No task registered as {job.task}")
+            with span(f"job.{job.task}", job_id=job.pk, attempt=job.attempts):
+                func(**job.payload)
+        except Exception as e:
+            job_duration.observe(time.perf_counter() - started, task=job.task)
+            self._failed(job, e)
+            return
+        job_duration.observe(time.perf_counter() - started, task=job.task)
+        Job.objects.filter(id=job.pk).update(
+            status=Job.SUCCEEDED, finished_at=timezone.now(), locked_by="", locked_at=None, last_error=""
+        )
+        self.succeeded += 1
+        jobs_total.inc(task=job.task, outcome="succeeded")
+
+    def requeue_stale(self) -> int:
+        """Queue again the running jobs whose worker stopped reporting; returns how many."""
+        cutoff = timezone.now() - timedelta(seconds=self.lock_timeout)
+        stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+        exhausted = stale.filter(attempts__gte=F("max_attempts")).update(
+            status=Job.FAILED, finished_at=timezone.now(), locked_by="", locked_at=None,
+            last_error="Worker lost while running the job",
+        )
+        requeued = stale.update(status=Job.QUEUED, locked_by="", locked_at=None, run_at=timezone.now())
+        if exhausted or requeued:
+            logger.warning(f"Recovered stale jobs: {requeued} requeued, {exhausted} failed")
+        return requeued
+
+    def stats(self) -> dict:
+        return {"succeeded": self.succeeded, "retried": self.retried, "failed": self.failed}
+
+    def _failed(self, job: Job, error: Exception) -> None:
+        message = f"{type(error).__name__}: {str(error)}"[:2000]
+        if isinstance(error, PermanentJobError) or job.attempts >= job.max_attempts:
+            Job.objects.filter(id=job.pk).update(
+                status=Job.FAILED, finished_at=timezone.now(), locked_by="", locked_at=None, last_error=message
+            )
+            self.failed += 1
+            jobs_total.inc(task=job.task, outcome="failed")
+            logger.error(f"Job {job.task} #{job.pk} failed after {job.attempts} attempts: {message}")
+            return
+        delay = retry_delay(job.attempts)
+        Job.objects.filter(id=job.pk).update(
+            status=Job.QUEUED, run_at=timezone.now() + timedelta(seconds=delay), locked_by="", locked_at=None,
+            last_error=message,
+        )
+        self.retried += 1
+        jobs_total.inc(task=job.task, outcome="retried")
+        logger.warning(f"Job {job.task} #{job.pk} attempt {job.attempts} failed, retrying in {delay:g}s: {message}")
+
+    def _maybe_purge(self) -> None:
+        if time.monotonic() - self._last_purge < 3600:
+            return
+        self._last_purge = time.monotonic()
+        purge_succeeded()
+
+
+def purge_succeeded(older_than_days: float = RETENTION_DAYS) -> int:
+    """Delete succeeded jobs that finished more than `older_than_days` ago; returns how many."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = Job.objects.filter(status=Job.SUCCEEDED, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def job_stats() -> dict:
+    """Jobs per status, and how long the oldest due job has been waiting."""
+    counts = {status: 0 for status, _ in Job.STATUS_CHOICES}
+    for row in Job.objects.values("status").annotate(count=Count("id")):
+        counts[row["status"]] = row["count"]
+    oldest = Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now()).aggregate(oldest=Min("run_at"))["oldest"]
+    counts["oldest_due_seconds"] = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    counts["worker_threads"] = len(_workers)
+    return counts
+
+
+def _ensure_workers() -> None:
+    """Start the in-process worker threads (JOB_WORKER_THREADS) on first use."""
+    if _workers or WORKER_THREADS <= 0:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        load_tasks()
+        for index in range(WORKER_THREADS):
+            worker = JobWorker(name=f"{socket.gethostname()}:{os.getpid()}:thread-{index}")
+            thread = threading.Thread(target=worker.run_forever, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            _workers.append(worker)
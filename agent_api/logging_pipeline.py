@@ -0,0 +1,169 @@
+"""
+Non-blocking logging for the agent API.
+
+Request threads only put records on an in-memory queue (AsyncQueueHandler); a
+QueueListener thread formats them as JSON lines and writes them to a rotating
+file and to stderr. Verbose payload records (user messages and agent answers,
+logged with extra={"payload": True}) are sampled before they are queued, and
+long messages are truncated, so request latency no longer depends on disk
+flushes and the log file stays bounded.
+
+Wired up through settings.LOGGING (dictConfig) with a '()' factory entry, not
+'class': from Python 3.12 dictConfig builds QueueHandler subclasses given as
+'class' with a queue as their first argument. See vertex_api/settings.py.
+"""
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+import orjson
+
+from telemetry import current_span
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, trace ids and any
+    `extra` fields. Messages longer than max_chars are truncated.
+    """
+
+    def __init__(self, max_chars: int = 4000):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record):
+        message = record.getMessage()
+        if self.max_chars and len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}… [truncated {len(message) - self.max_chars} chars]"
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": message,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exception"] = record.exc_text
+        return orjson.dumps(data, default=str).decode()
+
+
+class PayloadSampler(logging.Filter):
+    """Keeps only a fraction of the records marked with extra={"payload": True}."""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if not getattr(record, "payload", False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class TraceContextFilter(logging.Filter):
+    """Stamps records with the current trace and span ids while still on the request thread."""
+
+    def filter(self, record):
+        current = current_span()
+        if current is not None:
+            record.trace_id = current.trace_id
+            record.span_id = current.span_id
+        return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a QueueListener thread that writes them out.
+
+    The queue is bounded; when the writer falls behind, records are dropped
+    (and counted) instead of blocking the request.
+
+    Args:
+        filename: Log file; rotated by size, or by time when `when` is set.
+        max_bytes: Size at which the file is rotated.
+        backup_count: Rotated files kept.
+        when: TimedRotatingFileHandler interval ("midnight", "H", ...).
+        max_chars: Messages are truncated beyond this length.
+        queue_size: Records buffered before new ones are dropped.
+        console: Also write records to stderr.
+    """
+
+    def __init__(self, filename: str = None, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                 when: str = None, max_chars: int = 4000, queue_size: int = 10000, console: bool = True):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        formatter = JsonFormatter(max_chars)
+        targets = []
+        if filename:
+            if when:
+                targets.append(logging.handlers.TimedRotatingFileHandler(
+                    filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True
+                ))
+            else:
+                targets.append(logging.handlers.RotatingFileHandler(
+                    filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+                ))
+        if console:
+            targets.append(logging.StreamHandler(sys.stderr))
+        for target in targets:
+            target.setFormatter(formatter)
+        self._exception_formatter = logging.Formatter()
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._targets = targets
+        self.listener = logging.handlers.QueueListener(self.queue, *targets, respect_handler_level=True)
+        self.listener.start()
+        # The listener thread doesn't survive a fork (gunicorn preload_app)
+        os.register_at_fork(after_in_child=self._restart_listener)
+        atexit.register(self.close)
+
+    def _restart_listener(self):
+        if self.listener is None:
+            return
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self._dropped_lock = threading.Lock()
+        self.listener = logging.handlers.QueueListener(self.queue, *self._targets, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        # The listener formats with JsonFormatter; only resolve the message and
+        # traceback here so the record can safely cross threads.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+            for target in listener.handlers:
+                target.close()
+        super().close()
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}
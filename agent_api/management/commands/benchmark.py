@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.fake_model import load_traces
+from benchmarks.load import component_stats, format_report, parse_prometheus, run_load, stage_breakdown
+from benchmarks.stub_tools import TOOL_NAMES, StubProfile, StubToolServer
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ("Offline load test: stub tool backends and a scripted model behind the real API, "
+            "driven at a fixed concurrency")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight")
+        parser.add_argument('--requests', type=int, default=200, help="Total requests to send")
+        parser.add_argument('--duration', type=float, help="Run for this many seconds instead of --requests")
+        parser.add_argument('--warmup-requests', type=int, default=10,
+                            help="Requests sent before measuring (excluded from the report)")
+        parser.add_argument('--turns-per-session', type=int, default=4)
+        parser.add_argument('--path', default='/api/chat/', help="Chat endpoint to load")
+        parser.add_argument('--target', help="Benchmark an already running server instead of starting one")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Uvicorn workers of the started server (/metrics then covers one worker)")
+        parser.add_argument('--model-latency-ms', type=float, default=400)
+        parser.add_argument('--model-latency-sigma', type=float, default=0.3)
+        parser.add_argument('--tool-latency-ms', type=float, default=150)
+        parser.add_argument('--tool-latency-sigma', type=float, default=0.4)
+        parser.add_argument('--tool-error-rate', type=float, default=0.0)
+        parser.add_argument('--tool-profile', action='append', default=[], metavar='TOOL=MS[:SIGMA[:ERROR_RATE]]',
+                            help="Per-tool override, e.g. consulta_clientes=800:0.5:0.05")
+        parser.add_argument('--traces', help="JSON file with the scripted model traces")
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                            help="Extra environment for the started server, e.g. TOOL_CACHE_ENABLED=false")
+        parser.add_argument('--json', dest='json_path', help="Also write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        prompts = [trace['prompt'] for trace in load_traces(options['traces'])]
+        stubs = server = None
+        try:
+            if options['target']:
+                base_url = options['target'].rstrip('/')
+            else:
+                stubs = StubToolServer(self._profiles(options), seed=options['seed']).start()
+                base_url, server = self._start_server(stubs, options)
+                self.stdout.write(f"Stub tools on {stubs.base_url}, API on {base_url}")
+            self._wait_ready(base_url)
+
+            if options['warmup_requests']:
+                asyncio.run(run_load(base_url, prompts, concurrency=min(options['concurrency'], options['warmup_requests']),
+                                     requests=options['warmup_requests'], path=options['path']))
+            before = self._scrape(base_url)
+            result = asyncio.run(run_load(
+                base_url, prompts,
+                concurrency=options['concurrency'],
+                requests=options['requests'],
+                duration=options['duration'],
+                turns_per_session=options['turns_per_session'],
+                path=options['path'],
+            ))
+            after = self._scrape(base_url)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+            if stubs is not None:
+                stubs.stop()
+
+        summary = result.summary()
+        stages = stage_breakdown(before, after)
+        self.stdout.write(format_report(summary, stages, options['concurrency']))
+        if stubs is not None:
+            self.stdout.write(f"Stub tool requests: {stubs.stats()['requests']}")
+        backends = component_stats(after, 'tool_backends')
+        if backends:
+            # Circuit breaker state (0 closed, 1 half-open, 2 open) and adaptive limits at the end of the run
+            self.stdout.write("Tool backends: " + ", ".join(
+                f"{stat}={value:g}" for stat, value in sorted(backends.items())
+                if stat.rsplit('.', 1)[-1] in ('state', 'opens', 'limit', 'rejected_circuit_open', 'rejected_overloaded')
+            ))
+        if options['json_path']:
+            report = {"summary": summary, "stages": stages, "options": {
+                k: options[k] for k in ('concurrency', 'requests', 'duration', 'path', 'seed',
+                                        'model_latency_ms', 'tool_latency_ms', 'tool_error_rate')
+            }}
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def _profiles(self, options):
+        default = StubProfile(options['tool_latency_ms'], options['tool_latency_sigma'], options['tool_error_rate'])
+        profiles = {name: default for name in TOOL_NAMES}
+        for spec in options['tool_profile']:
+            name, _, values = spec.partition('=')
+            if name not in profiles:
+                raise CommandError(f"Unknown tool {name}; expected one of {', '.join(TOOL_NAMES)}")
+            parts = [float(v) for v in values.split(':') if v]
+            profiles[name] = StubProfile(
+                parts[0] if parts else default.latency_ms,
+                parts[1] if len(parts) > 1 else default.latency_sigma,
+                parts[2] if len(parts) > 2 else default.error_rate,
+            )
+        return profiles
+
+    def _start_server(self, stubs, options):
+        port = _free_port()
+        env = os.environ.copy()
+        env.update(stubs.tool_urls())
+        env.update({
+            'AGENT_MODEL_BUILDER': 'benchmarks.fake_model:build_scripted_model',
+            'FAKE_MODEL_LATENCY_MS': str(options['model_latency_ms']),
+            'FAKE_MODEL_LATENCY_SIGMA': str(options['model_latency_sigma']),
+            'FAKE_MODEL_SEED': str(options['seed']),
+            'AUTH_TOKEN_ISSUER': 'fake',
+            'HISTORY_BACKEND': 'memory',
+        })
+        if options['traces']:
+            env['FAKE_MODEL_TRACES'] = os.path.abspath(options['traces'])
+        for assignment in options['env']:
+            name, _, value = assignment.partition('=')
+            env[name] = value
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'vertex_api.asgi:application',
+             '--host', '127.0.0.1', '--port', str(port), '--workers', str(options['workers']),
+             '--log-level', 'warning'],
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+        return f"http://127.0.0.1:{port}", server
+
+    def _wait_ready(self, base_url, timeout=120):
+        # Warming up also builds the agent, so the first measured request doesn't pay for it
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = httpx.get(f"{base_url}/api/warmup/", timeout=timeout)
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise CommandError(f"Server at {base_url} did not become ready within {timeout}s")
+            time.sleep(0.5)
+
+    def _scrape(self, base_url):
+        try:
+            return parse_prometheus(httpx.get(f"{base_url}/metrics", timeout=30).text)
+        except httpx.HTTPError as e:
+            self.stderr.write(f"Could not scrape /metrics: {e}")
+            return {}
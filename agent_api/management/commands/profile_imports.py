@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Report import time of a module (default: index) using python -X importtime"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='index', help="Module to import")
+        parser.add_argument('--top', type=int, default=25, help="Number of slowest imports to list")
+        parser.add_argument('--build-agent', action='store_true',
+                            help="Also build the agent, to measure the lazily deferred imports")
+
+    def handle(self, *args, **options):
+        code = f"import {options['module']}"
+        if options['build_agent']:
+            code += f"; {options['module']}.get_agent()"
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            self.stderr.write(result.stderr[-2000:])
+            return
+
+        # Lines look like "import time:       412 |       9876 |   package.module",
+        # with two extra spaces of indentation per nesting level
+        entries = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, raw_name = line[len('import time:'):].split('|')
+            depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+            entries.append((int(cumulative_us), int(self_us), depth, raw_name.strip()))
+
+        total_us = sum(cumulative for cumulative, _, depth, _ in entries if depth == 0)
+        action = f"Importing {options['module']}" + (" and building the agent" if options['build_agent'] else "")
+        self.stdout.write(f"{action}: {total_us / 1000:.1f} ms across {len(entries)} modules")
+        self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for cumulative, self_us, depth, name in sorted(entries, reverse=True)[:options['top']]:
+            self.stdout.write(f"{cumulative / 1000:>14.1f} {self_us / 1000:>9.1f}  {'  ' * depth}{name}")
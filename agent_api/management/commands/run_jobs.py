@@ -0,0 +1,44 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from agent_api.jobs import JobWorker, POLL_INTERVAL_SECONDS, job_stats, load_tasks
+
+
+class Command(BaseCommand):
+    help = "Run the durable background jobs (history writes and other post-reply work) until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1,
+                            help="Worker threads in this process (jobs are I/O bound)")
+        parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL_SECONDS,
+                            help="Seconds between checks for new jobs when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Run the jobs due now, then exit")
+
+    def handle(self, *args, **options):
+        load_tasks()
+        if options['once']:
+            ran = JobWorker(poll_interval=options['poll_interval']).run_pending()
+            self.stdout.write(f"Ran {ran} jobs; queue: {job_stats()}")
+            return
+
+        stop = threading.Event()
+        # SIGTERM (e.g. a container stop) lets the running jobs finish before exiting
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        threads = [
+            threading.Thread(target=JobWorker(poll_interval=options['poll_interval']).run_forever,
+                             args=(stop,), name=f"job-worker-{index}")
+            for index in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Running jobs with {len(threads)} worker threads")
+        try:
+            while any(thread.is_alive() for thread in threads):
+                stop.wait(1)
+        except KeyboardInterrupt:
+            stop.set()
+        for thread in threads:
+            thread.join()
+        self.stdout.write("Job workers stopped")
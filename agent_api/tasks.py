@@ -0,0 +1,13 @@
+"""
+Tasks run by the background job workers (see agent_api.jobs).
+
+Imported by the workers before they claim jobs; a task's name is part of the
+stored jobs, so renaming one strands the jobs already queued under the old name.
+"""
+
+from history_store import commit_history_document
+
+from .jobs import task
+
+# Session documents flushed by a HistoryStore with HISTORY_WRITE_QUEUE=true
+task("history.commit")(commit_history_document)
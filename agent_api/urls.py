@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import AgentEndpoint
+from .views import AgentEndpoint, AsyncAgentEndpoint, BatchChatEndpoint, WarmupEndpoint
 
 urlpatterns = [
-    path('chat/', AgentEndpoint.as_view(), name='chat'),
+    path('chat/', AsyncAgentEndpoint.as_view(), name='chat'),
+    path('chat/sync/', AgentEndpoint.as_view(), name='chat-sync'),
+    path('chat/batch/', BatchChatEndpoint.as_view(), name='chat-batch'),
+    path('warmup/', WarmupEndpoint.as_view(), name='warmup'),
 ]
@@ -1,8 +1,17 @@
+import asyncio
 import logging
-import json
+import time
+import uuid
 from datetime import datetime
 import pytz
 
+from django.conf import settings
+import orjson
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -11,19 +20,256 @@ from rest_framework import status
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from index import query_agent
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api_logs.log')),
-        logging.StreamHandler()
-    ]
+from index import (
+    query_agent, aquery_agent, astream_agent, get_session_scheduler, warm_up, prefetch_tool_tokens,
+    prefetch_first_interaction, model as agent_model,
 )
+from telemetry import registry, render_prometheus, span, traced_request
+
+from .concurrency import LimitedStreamingResponse, agent_limiter
+from .jobs import job_stats
+from .logging_pipeline import AsyncQueueHandler
+from .renderers import ORJSONResponse
+
+registry.register_collector("agent_limiter", agent_limiter.stats)
+registry.register_collector("jobs", job_stats)
+registry.register_collector("logging", lambda: next(
+    (h.stats() for h in logging.getLogger().handlers if isinstance(h, AsyncQueueHandler)), {}
+))
+
+# Logging is configured in settings.LOGGING (queued, JSON, rotated)
 logger = logging.getLogger("agent_api")
 
+class ChatRequestError(Exception):
+    """Raised when a chat request body is malformed; the message is returned as a 400."""
+
+def get_el_salvador_datetime():
+    """Get current date and time in El Salvador timezone"""
+    el_salvador_tz = pytz.timezone('America/El_Salvador')
+    current_time = datetime.now(el_salvador_tz)
+    return current_time.strftime("%Y-%m-%d %H:%M:%S")
+
+def parse_chat_request(data):
+    """
+    Validate a chat request body and pull out what the agent needs.
+
+    Args:
+        data: Parsed JSON body with a 'messages' array and optional
+              'session_id', 'isFirstInteraction' and 'metadata' (the
+              customer's 'phone' and 'name', when the channel knows them).
+
+    Returns:
+        dict: user_message, is_first_interaction, session_id (generated
+              when the request doesn't carry one), new_session, and
+              customer_phone / customer_name from the metadata.
+    """
+    with span("request.parse"):
+        if 'messages' not in data or not isinstance(data['messages'], list):
+            raise ChatRequestError("Invalid request format. 'messages' array is required.")
+
+        # Extract user message
+        user_messages = [msg for msg in data['messages'] if msg.get('role') == 'user']
+        if not user_messages:
+            raise ChatRequestError("No user message found in the request.")
+
+        # Get the last user message
+        user_message = user_messages[-1]['content']
+
+        # Check if it's the first interaction
+        is_first_interaction = data.get('isFirstInteraction', False)
+
+        # Get or generate session ID
+        session_id = data.get('session_id')
+        new_session = not session_id
+        if not session_id:
+            # Generate a unique session ID if not provided
+            session_id = str(uuid.uuid4())
+            logger.info(f"Generated new session ID: {session_id}")
+        else:
+            logger.info(f"Using provided session ID: {session_id}")
+
+        # Log the incoming request
+        logger.info(f"Received request - First Interaction: {is_first_interaction}")
+        logger.info(f"User message: {user_message}", extra={"payload": True})
+
+        metadata = data.get('metadata') if isinstance(data.get('metadata'), dict) else {}
+
+        return {
+            "user_message": user_message,
+            "is_first_interaction": is_first_interaction,
+            "session_id": session_id,
+            "new_session": new_session,
+            "customer_phone": metadata.get('phone'),
+            "customer_name": metadata.get('name'),
+        }
+
+def format_agent_input(user_message):
+    """Format the message for the agent"""
+    return f"""Mensaje del usuario: {user_message}"""
+
+def start_prefetch(chat_request):
+    """Prefetch what a conversation's first turn usually needs, while the model makes its first call"""
+    if chat_request["is_first_interaction"] or chat_request["new_session"]:
+        prefetch_first_interaction(
+            chat_request["session_id"], chat_request["customer_phone"], chat_request["customer_name"]
+        )
+
+def run_agent_turn(chat_request):
+    """
+    Run the agent for a chat request, blocking until it answers.
+
+    Goes through the session scheduler (when enabled), so turns of one session
+    run in order and rapid consecutive messages can be merged into one turn.
+    """
+    start_prefetch(chat_request)
+    scheduler = get_session_scheduler()
+    if scheduler is None:
+        return query_agent(
+            format_agent_input(chat_request["user_message"]), chat_request["session_id"],
+            question=chat_request["user_message"]
+        )
+    return scheduler.submit(chat_request["session_id"], chat_request["user_message"], format_agent_input).result()
+
+async def arun_agent_turn(chat_request):
+    """Async variant of run_agent_turn"""
+    start_prefetch(chat_request)
+    scheduler = get_session_scheduler()
+    if scheduler is None:
+        return await aquery_agent(
+            format_agent_input(chat_request["user_message"]), chat_request["session_id"],
+            question=chat_request["user_message"]
+        )
+    return await asyncio.wrap_future(
+        scheduler.submit(chat_request["session_id"], chat_request["user_message"], format_agent_input)
+    )
+
+def extract_response_content(agent_response):
+    """Extract only the output part from the agent response"""
+    response_content = ""
+    if isinstance(agent_response, dict) and agent_response.get("session_turn", {}).get("primary") is False:
+        # Merged into a later message's turn, whose response carries the answer
+        return response_content
+    if hasattr(agent_response, 'output'):
+        response_content = agent_response.output
+    elif isinstance(agent_response, dict) and 'output' in agent_response:
+        response_content = agent_response['output']
+    elif isinstance(agent_response, str):
+        # Try to parse string as JSON if it looks like a dictionary
+        if '{' in agent_response and '}' in agent_response:
+            try:
+                response_dict = eval(agent_response)
+                if isinstance(response_dict, dict) and 'output' in response_dict:
+                    response_content = response_dict['output']
+            except:
+                response_content = agent_response
+        else:
+            response_content = agent_response
+    else:
+        # Fallback to string representation if we can't extract output
+        response_content = str(agent_response)
+    return response_content
+
+def build_chat_metadata(chat_request, current_datetime):
+    """Metadata block attached to every chat response"""
+    return {
+        "timestamp": current_datetime,
+        "isFirstInteraction": chat_request["is_first_interaction"],
+        "session_id": chat_request["session_id"]
+    }
+
+def agent_response_metadata(agent_response):
+    """Metadata reported by the agent layer itself, e.g. answer cache hits and routed lookups"""
+    metadata = {}
+    if isinstance(agent_response, dict) and agent_response.get("answer_cache"):
+        metadata["answerCache"] = agent_response["answer_cache"]
+    if isinstance(agent_response, dict) and agent_response.get("session_turn"):
+        turn = agent_response["session_turn"]
+        # Only the primary (latest) message's response carries the answer
+        metadata["sessionTurn"] = {
+            "mergedMessages": turn["merged_messages"],
+            "primary": turn["primary"],
+            "queuedMs": turn["queued_ms"],
+        }
+    if isinstance(agent_response, dict) and agent_response.get("intent_route"):
+        route = agent_response["intent_route"]
+        metadata["intentRoute"] = {
+            "intent": route["intent"],
+            "confidence": route["confidence"],
+            "tool": route["tool"],
+            "savedMs": route["saved_ms"],
+        }
+    if isinstance(agent_response, dict) and agent_response.get("token_usage"):
+        metadata["tokenUsage"] = token_usage_metadata(agent_response["token_usage"])
+    return metadata
+
+def token_usage_metadata(usage):
+    """Token usage of the turn (and of the whole session) in the response's camelCase style"""
+    metadata = {
+        "inputTokens": usage["input_tokens"],
+        "outputTokens": usage["output_tokens"],
+        "totalTokens": usage["total_tokens"],
+        "estimated": usage["estimated"],
+        "costUsd": usage["cost_usd"],
+        "llmCalls": [
+            {"inputTokens": call["input_tokens"], "outputTokens": call["output_tokens"],
+             **({"tier": call["tier"]} if call.get("tier") else {})}
+            for call in usage["llm_calls"]
+        ],
+        "toolResults": [
+            {"tool": result["tool"], "tokens": result["tokens"]} for result in usage["tool_results"]
+        ],
+        "historyTokens": usage["history_tokens"],
+        "promptBudget": usage["prompt_budget"],
+        "budgetActions": usage["budget_actions"],
+    }
+    if usage.get("session"):
+        session = usage["session"]
+        metadata["session"] = {
+            "inputTokens": session["input_tokens"],
+            "outputTokens": session["output_tokens"],
+            "llmCalls": session["llm_calls"],
+            "turns": session["turns"],
+            "costUsd": session["cost_usd"],
+            "budget": session["budget"],
+        }
+    return metadata
+
+def build_chat_response(response_content, chat_request, current_datetime, extra_metadata=None):
+    """Format the response in the OpenAI API style format"""
+    return {
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": response_content
+                }
+            }
+        ],
+        "metadata": {**build_chat_metadata(chat_request, current_datetime), **(extra_metadata or {})}
+    }
+
+def build_chat_chunk(completion_id, created, delta, finish_reason=None):
+    """Format one streamed piece in the OpenAI chat.completion.chunk format"""
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": agent_model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason
+            }
+        ]
+    }
+
+def sse_event(data, event=None):
+    """Encode a payload as a Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {orjson.dumps(data, default=str).decode()}\n\n"
+
 class AgentEndpoint(APIView):
     """
     API endpoint for interacting with the Vertex AI agent
@@ -31,99 +277,28 @@ class AgentEndpoint(APIView):
     
     def get_el_salvador_datetime(self):
         """Get current date and time in El Salvador timezone"""
-        el_salvador_tz = pytz.timezone('America/El_Salvador')
-        current_time = datetime.now(el_salvador_tz)
-        return current_time.strftime("%Y-%m-%d %H:%M:%S")
+        return get_el_salvador_datetime()
     
+    @traced_request("chat-sync")
     def post(self, request, *args, **kwargs):
         try:
-            # Get data from the request
-            data = request.data
-            
-            if 'messages' not in data or not isinstance(data['messages'], list):
-                return Response(
-                    {"error": "Invalid request format. 'messages' array is required."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Extract user message
-            user_messages = [msg for msg in data['messages'] if msg.get('role') == 'user']
-            if not user_messages:
-                return Response(
-                    {"error": "No user message found in the request."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Get the last user message
-            user_message = user_messages[-1]['content']
-            
-            # Check if it's the first interaction
-            is_first_interaction = data.get('isFirstInteraction', False)
+            try:
+                chat_request = parse_chat_request(request.data)
+            except ChatRequestError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
             # Get current date and time in El Salvador
             current_datetime = self.get_el_salvador_datetime()
             
-            # Get or generate session ID
-            session_id = data.get('session_id')
-            if not session_id:
-                # Generate a unique session ID if not provided
-                import uuid
-                session_id = str(uuid.uuid4())
-                logger.info(f"Generated new session ID: {session_id}")
-            else:
-                logger.info(f"Using provided session ID: {session_id}")
-            
-            # Format the message for the agent
-            formatted_message = f"""Mensaje del usuario: {user_message}"""
-            
-            # Log the incoming request
-            logger.info(f"Received request - First Interaction: {is_first_interaction}")
-            logger.info(f"User message: {user_message}")
-            
             # Call the agent with session ID
-            agent_response = query_agent(formatted_message, session_id)
-            
-            # Extract only the output part from the response
-            response_content = ""
-            if hasattr(agent_response, 'output'):
-                response_content = agent_response.output
-            elif isinstance(agent_response, dict) and 'output' in agent_response:
-                response_content = agent_response['output']
-            elif isinstance(agent_response, str):
-                # Try to parse string as JSON if it looks like a dictionary
-                if '{' in agent_response and '}' in agent_response:
-                    try:
-                        response_dict = eval(agent_response)
-                        if isinstance(response_dict, dict) and 'output' in response_dict:
-                            response_content = response_dict['output']
-                    except:
-                        response_content = agent_response
-                else:
-                    response_content = agent_response
-            else:
-                # Fallback to string representation if we can't extract output
-                response_content = str(agent_response)
-            
-            # Format the response in the OpenAI API style format
-            response_data = {
-                "choices": [
-                    {
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": response_content
-                        }
-                    }
-                ],
-                "metadata": {
-                    "timestamp": current_datetime,
-                    "isFirstInteraction": is_first_interaction,
-                    "session_id": session_id
-                }
-            }
+            agent_response = run_agent_turn(chat_request)
+            response_content = extract_response_content(agent_response)
+            response_data = build_chat_response(
+                response_content, chat_request, current_datetime, agent_response_metadata(agent_response)
+            )
             
             # Log the response
-            logger.info(f"Agent response content: {response_content}")
+            logger.info(f"Agent response content: {response_content}", extra={"payload": True})
             
             return Response(response_data)
             
@@ -133,3 +308,263 @@ class AgentEndpoint(APIView):
                 {"error": f"An error occurred: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAgentEndpoint(View):
+    """
+    Async chat endpoint for ASGI deployments.
+
+    The agent turn is awaited instead of holding a worker for its whole
+    duration. In-flight turns per process are capped by agent_limiter; when
+    no slot frees up within AGENT_QUEUE_TIMEOUT the request gets a 429 with
+    Retry-After.
+
+    With "stream": true the answer is sent as Server-Sent Events in the
+    OpenAI chat.completion.chunk format as the model produces it. Setting
+    "stream_options": {"include_tool_progress": true} also emits named
+    "tool" events when each tool call starts and ends.
+    """
+
+    def busy_response(self):
+        logger.warning("Agent concurrency limit reached, rejecting request")
+        response = ORJSONResponse(
+            {"error": "Server is busy, please retry later."},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        response['Retry-After'] = str(agent_limiter.retry_after)
+        return response
+
+    @traced_request("chat")
+    async def post(self, request, *args, **kwargs):
+        try:
+            try:
+                data = orjson.loads(request.body or b'{}')
+            except ValueError:
+                return ORJSONResponse({"error": "Request body must be valid JSON."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+            try:
+                chat_request = parse_chat_request(data)
+            except ChatRequestError as e:
+                return ORJSONResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            current_datetime = get_el_salvador_datetime()
+
+            if data.get('stream'):
+                if not await agent_limiter.acquire():
+                    return self.busy_response()
+                include_tool_progress = bool((data.get('stream_options') or {}).get('include_tool_progress'))
+                try:
+                    # The slot is released when the response is closed, even if the
+                    # client disconnects before the stream starts
+                    response = LimitedStreamingResponse(
+                        self.stream_events(chat_request, current_datetime, include_tool_progress),
+                        content_type='text/event-stream',
+                        limiter=agent_limiter,
+                    )
+                except Exception:
+                    agent_limiter.release()
+                    raise
+                response['Cache-Control'] = 'no-cache'
+                response['X-Accel-Buffering'] = 'no'
+                return response
+
+            async with agent_limiter.slot() as acquired:
+                if not acquired:
+                    return self.busy_response()
+                agent_response = await arun_agent_turn(chat_request)
+
+            response_content = extract_response_content(agent_response)
+            response_data = build_chat_response(
+                response_content, chat_request, current_datetime, agent_response_metadata(agent_response)
+            )
+            logger.info(f"Agent response content: {response_content}", extra={"payload": True})
+            return ORJSONResponse(response_data)
+
+        except Exception as e:
+            logger.error(f"Error processing request: {str(e)}")
+            return ORJSONResponse(
+                {"error": f"An error occurred: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    async def stream_events(self, chat_request, current_datetime, include_tool_progress):
+        """Yield the SSE stream for one turn (the response releases the limiter slot)"""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        streamed = []
+        agent_response = None
+        scheduler = get_session_scheduler()
+        # Streamed turns wait for the session's earlier turns like the others
+        reservation = scheduler.reserve(chat_request["session_id"]) if scheduler is not None else None
+        try:
+            yield sse_event(build_chat_chunk(completion_id, created, {"role": "assistant", "content": ""}))
+            if reservation is not None:
+                await asyncio.wrap_future(reservation.ready)
+            start_prefetch(chat_request)
+            async for event in astream_agent(
+                format_agent_input(chat_request["user_message"]), chat_request["session_id"],
+                question=chat_request["user_message"]
+            ):
+                if event["type"] == "token":
+                    streamed.append(event["content"])
+                    yield sse_event(build_chat_chunk(completion_id, created, {"content": event["content"]}))
+                elif event["type"] in ("tool_start", "tool_end"):
+                    if include_tool_progress:
+                        yield sse_event({"id": completion_id, "type": event["type"], "tool": event["name"]}, event="tool")
+                elif event["type"] == "final":
+                    agent_response = event["output"]
+                    response_content = extract_response_content(agent_response) if agent_response is not None else ""
+                    if not streamed and response_content:
+                        # The model didn't stream tokens; send the whole answer at once
+                        yield sse_event(build_chat_chunk(completion_id, created, {"content": response_content}))
+                    logger.info(f"Agent response content: {response_content}", extra={"payload": True})
+            final_chunk = build_chat_chunk(completion_id, created, {}, finish_reason="stop")
+            final_chunk["metadata"] = {
+                **build_chat_metadata(chat_request, current_datetime), **agent_response_metadata(agent_response)
+            }
+            yield sse_event(final_chunk)
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            yield sse_event({"error": f"An error occurred: {str(e)}"})
+        finally:
+            if reservation is not None:
+                reservation.release()
+        yield "data: [DONE]\n\n"
+
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchChatEndpoint(View):
+    """
+    Processes many chat requests in one call, e.g. a backlog replayed after an outage.
+
+    Body: {"items": [{"session_id": ..., "messages": [...], "id": optional}, ...],
+    "stream": optional}. Each item has the same shape as a /api/chat/ request.
+    Sessions run in parallel, at most BATCH_MAX_PARALLEL at a time, while the
+    items of one session run one after another in the order given. The result
+    of each item (the usual chat response, or an error and its status) is
+    returned in item order, or streamed as NDJSON lines as items finish when
+    "stream" is true, followed by a summary line.
+
+    All items share the process-wide tokens, tool cache, transport and history
+    store; tool tokens are fetched once before the batch starts. Each item also
+    takes a slot of agent_limiter like an interactive request, and gets a 429
+    result when none frees up within AGENT_QUEUE_TIMEOUT.
+    """
+
+    @traced_request("chat-batch")
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = orjson.loads(request.body or b'{}')
+        except ValueError:
+            return ORJSONResponse({"error": "Request body must be valid JSON."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        items = data.get('items') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return ORJSONResponse({"error": "Invalid request format. 'items' array is required."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BATCH_MAX_ITEMS:
+            return ORJSONResponse({"error": f"A batch accepts at most {settings.BATCH_MAX_ITEMS} items."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            await sync_to_async(prefetch_tool_tokens, thread_sensitive=False)()
+        except Exception as e:
+            logger.warning(f"Token prefetch before batch failed: {str(e)}")
+
+        if data.get('stream'):
+            response = StreamingHttpResponse(self.stream_results(items), content_type='application/x-ndjson')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        results = [None] * len(items)
+        async for result in self.run_batch(items):
+            results[result["index"]] = result
+        return ORJSONResponse({"results": results, "summary": self.summarize(results)})
+
+    async def stream_results(self, items):
+        results = []
+        async for result in self.run_batch(items):
+            results.append(result)
+            yield orjson.dumps(result, default=str) + b"\n"
+        yield orjson.dumps({"summary": self.summarize(results)}) + b"\n"
+
+    async def run_batch(self, items):
+        """Yield each item's result as soon as it is ready"""
+        sessions = {}
+        for index, item in enumerate(items):
+            session_id = item.get('session_id') if isinstance(item, dict) else None
+            # Items without a session_id are independent conversations
+            sessions.setdefault(session_id or f"item-{index}", []).append(index)
+
+        semaphore = asyncio.Semaphore(settings.BATCH_MAX_PARALLEL)
+        finished = asyncio.Queue()
+
+        async def run_session(indexes):
+            async with semaphore:
+                for index in indexes:
+                    await finished.put(await self.run_item(index, items[index]))
+
+        tasks = [asyncio.create_task(run_session(indexes)) for indexes in sessions.values()]
+        try:
+            for _ in range(len(items)):
+                yield await finished.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run_item(self, index, item):
+        started = time.perf_counter()
+        result = {"index": index, "id": item.get('id') if isinstance(item, dict) else None}
+        try:
+            if not isinstance(item, dict):
+                raise ChatRequestError("Each item must be an object.")
+            chat_request = parse_chat_request(item)
+        except ChatRequestError as e:
+            return {**result, "status": status.HTTP_400_BAD_REQUEST, "error": str(e)}
+        result["session_id"] = chat_request["session_id"]
+        try:
+            # Batch items share the per-process cap with interactive requests
+            async with agent_limiter.slot() as acquired:
+                if not acquired:
+                    return {**result, "status": status.HTTP_429_TOO_MANY_REQUESTS,
+                            "error": "Server is busy, please retry later.",
+                            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+                agent_response = await arun_agent_turn(chat_request)
+            response_content = extract_response_content(agent_response)
+            logger.info(f"Agent response content: {response_content}", extra={"payload": True})
+            result.update(status=status.HTTP_200_OK, response=build_chat_response(
+                response_content, chat_request, get_el_salvador_datetime(), agent_response_metadata(agent_response)
+            ))
+        except Exception as e:
+            logger.error(f"Error processing batch item {index}: {str(e)}")
+            result.update(status=status.HTTP_500_INTERNAL_SERVER_ERROR, error=f"An error occurred: {str(e)}")
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def summarize(self, results):
+        succeeded = sum(1 for r in results if r and r["status"] == status.HTTP_200_OK)
+        return {"total": len(results), "succeeded": succeeded, "failed": len(results) - succeeded}
+
+class WarmupEndpoint(View):
+    """
+    Builds the agent, sets up its runnable and fetches tool tokens.
+
+    Point the Cloud Run startup probe (or a post-deploy hook) here so the
+    first real conversation doesn't pay for construction.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            timings = await sync_to_async(warm_up, thread_sensitive=False)()
+        except Exception as e:
+            logger.error(f"Warm-up failed: {str(e)}")
+            return ORJSONResponse({"status": "error", "error": str(e)},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        logger.info(f"Warm-up completed: {timings}")
+        return ORJSONResponse({"status": "ready", "timings": timings})
+
+class MetricsEndpoint(View):
+    """Prometheus metrics: latency histograms, token counts and component stats"""
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
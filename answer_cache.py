@@ -0,0 +1,286 @@
+"""
+Opt-in answer cache for repeated, session-independent questions.
+
+Much of the traffic is the same handful of FAQ-style questions ("¿qué pizzas
+tienen?", "¿cuál es el menú?") phrased slightly differently. AnswerCache keeps
+the final answer of such turns and serves it to later askers without running
+the model or the tools:
+
+- questions are normalized (accents, case, punctuation) for an exact lookup,
+  then embedded locally (hashed word and character n-grams) and matched by
+  cosine similarity against the cached questions with NumPy;
+- only questions without personal or conversational context are eligible, and
+  only answers produced at the start of a session using the menu tools alone
+  are stored;
+- an entry lives no longer than the shortest tool-cache TTL of the tools its
+  answer used, and is dropped when the tool cache invalidates one of them.
+
+Enabled with ANSWER_CACHE_ENABLED=true.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from tool_cache import TOOL_CACHE_TTLS, fold_text
+
+logger = logging.getLogger("answer_cache")
+
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "600"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "500"))
+# Minimum cosine similarity for a semantic hit
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.88"))
+EMBEDDING_DIMENSIONS = 512
+# Longer messages are rarely FAQ questions
+MAX_QUESTION_WORDS = 14
+
+# Answers may only depend on these tools (no customer data)
+SESSION_INDEPENDENT_TOOLS = frozenset(TOOL_CACHE_TTLS)
+
+# Markers of personal data or of a follow-up that depends on earlier turns
+_CONTEXT_MARKERS = frozenset({
+    "mi", "mis", "me", "soy", "llamo", "nombre", "telefono", "direccion", "pedido", "orden", "ordenar",
+    "agrega", "agregar", "quita", "quitar", "cambia", "cambiar", "ese", "esa", "eso", "esos",
+    "esas", "este", "esta", "esto", "mismo", "misma", "tambien", "otra", "otro", "anterior", "entonces",
+})
+# Function words and greetings that carry no meaning for matching questions
+_STOPWORDS = frozenset({
+    "que", "cual", "cuales", "como", "el", "la", "los", "las", "lo", "de", "del", "un", "una", "unos", "unas",
+    "y", "o", "a", "en", "con", "por", "para", "es", "son", "hay", "tienen", "tiene", "ustedes", "usted",
+    "hola", "buenas", "buenos", "dias", "tardes", "noches", "favor", "porfavor", "puedo", "puede", "podria",
+})
+_NON_WORD = re.compile(r"[^\w\s]")
+_DIGIT = re.compile(r"\d")
+
+
+def normalize_question(text: str) -> str:
+    """Fold accents and case and drop punctuation ("¿Qué pizzas tienen?" -> "que pizzas tienen")."""
+    return " ".join(_NON_WORD.sub(" ", fold_text(text)).split())
+
+
+def is_session_independent(question: str) -> bool:
+    """True for questions whose answer can't depend on who asks or on earlier turns."""
+    words = normalize_question(question).split()
+    if not words or len(words) > MAX_QUESTION_WORDS:
+        return False
+    if _DIGIT.search(question):
+        return False
+    return not _CONTEXT_MARKERS.intersection(words)
+
+
+class HashingEmbedder:
+    """
+    Local bag-of-n-grams embedding: content words and their character trigrams
+    hashed into a fixed number of dimensions and L2-normalized.
+    """
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def __call__(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in self._features(normalize_question(text)):
+            digest = zlib.crc32(feature.encode())
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dimensions] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _features(self, normalized: str):
+        words = [w for w in normalized.split() if w not in _STOPWORDS] or normalized.split()
+        for word in words:
+            yield f"w:{word}", 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield f"c:{padded[i:i + 3]}", 0.5
+
+
+class _Entry:
+    __slots__ = ("question", "vector", "answer", "tools", "expires_at", "latency", "hits")
+
+    def __init__(self, question: str, vector, answer, tools: frozenset, expires_at: float, latency: float):
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.tools = tools
+        self.expires_at = expires_at
+        self.latency = latency
+        self.hits = 0
+
+
+class AnswerCache:
+    """
+    Final answers of session-independent questions, matched exactly or by similarity.
+
+    Args:
+        embedder: Callable text -> L2-normalized vector.
+        threshold: Minimum cosine similarity for a semantic hit.
+        ttl: Maximum lifetime of an answer in seconds.
+        max_entries: Oldest entries are evicted beyond this count.
+        tool_ttls: TTL per tool; an answer expires with the shortest TTL of the
+                   tools it used.
+    """
+
+    def __init__(self, embedder=None, threshold: float = SIMILARITY_THRESHOLD, ttl: int = ANSWER_CACHE_TTL,
+                 max_entries: int = MAX_ENTRIES, tool_ttls: dict = None):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.tool_ttls = dict(TOOL_CACHE_TTLS if tool_ttls is None else tool_ttls)
+        self._entries = {}
+        self._keys = []
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def lookup(self, question: str):
+        """
+        Find a cached answer for the question.
+
+        Returns:
+            tuple: (answer, saved_seconds, similarity), or None on a miss or when
+                   the question isn't eligible.
+        """
+        if not is_session_independent(question):
+            with self._lock:
+                self.skipped += 1
+            return None
+        key = normalize_question(question)
+        vector = self.embedder(question)
+        now = time.time()
+        with self._lock:
+            entry, similarity = self._entries.get(key), 1.0
+            if entry is None and self._keys:
+                if self._matrix is None:
+                    self._matrix = np.vstack([self._entries[k].vector for k in self._keys])
+                scores = self._matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry, similarity = self._entries[self._keys[best]], float(scores[best])
+            if entry is None or entry.expires_at <= now:
+                if entry is not None:
+                    self._remove(normalize_question(entry.question))
+                self.misses += 1
+                return None
+            entry.hits += 1
+            if similarity >= 1.0:
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            self.saved_seconds += entry.latency
+        logger.info(f"Answer cache hit (similarity {similarity:.2f}) for: {question}")
+        return entry.answer, entry.latency, similarity
+
+    def store(self, question: str, answer, tools_used, latency: float) -> bool:
+        """
+        Cache the answer of an eligible question.
+
+        Args:
+            question: The user's message.
+            answer: The agent's final output.
+            tools_used: Names of the tools called while answering.
+            latency: Seconds the agent took; reported as saved on later hits.
+
+        Returns:
+            bool: Whether the answer was stored.
+        """
+        tools = frozenset(tools_used)
+        if not answer or not is_session_independent(question) or not tools <= SESSION_INDEPENDENT_TOOLS:
+            return False
+        ttl = min([self.ttl] + [self.tool_ttls[t] for t in tools if t in self.tool_ttls])
+        entry = _Entry(question, self.embedder(question), answer, tools, time.time() + ttl, latency)
+        key = normalize_question(question)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._keys) >= self.max_entries:
+                self._remove(self._keys[0])
+            self._entries[key] = entry
+            self._keys.append(key)
+            self._matrix = None
+            self.stores += 1
+        return True
+
+    def invalidate(self, tool: str = None, args: dict = None) -> int:
+        """
+        Drop answers that used a tool, or every answer when tool is None.
+
+        Matches ToolCache.on_invalidate's listener signature.
+        """
+        with self._lock:
+            doomed = [k for k in self._keys if tool is None or tool in self._entries[k].tools]
+            for key in doomed:
+                self._remove(key)
+            self.invalidations += len(doomed)
+        if doomed:
+            logger.info(f"Answer cache dropped {len(doomed)} answers after {tool or 'all tools'} changed")
+        return len(doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._keys),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "hit_ratio": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "saved_seconds_total": self.saved_seconds,
+            }
+
+    def _remove(self, key: str) -> None:
+        if self._entries.pop(key, None) is not None:
+            self._keys.remove(key)
+            self._matrix = None
+
+
+def tool_recorder():
+    """LangChain callback handler collecting the names of the tools a turn calls."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class ToolRecorder(BaseCallbackHandler):
+        def __init__(self):
+            self.tools = set()
+
+        def on_tool_start(self, serialized, input_str, **kwargs):
+            self.tools.add((serialized or {}).get("name") or kwargs.get("name", ""))
+
+    return ToolRecorder()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """
+    Process-wide AnswerCache, or None unless ANSWER_CACHE_ENABLED=true.
+
+    The cache follows the tool cache: invalidating a menu tool there drops the
+    answers built from it.
+    """
+    global _cache
+    if _cache is None and os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true":
+        with _cache_lock:
+            if _cache is None:
+                from tool_cache import get_tool_cache
+
+                cache = AnswerCache()
+                get_tool_cache().on_invalidate(cache.invalidate)
+                _cache = cache
+    return _cache
@@ -0,0 +1,292 @@
+"""
+Cached Google ID tokens for the Cloud Run tool backends.
+
+Cloud Run expects one ID token per target audience (the service URL). Fetching
+one goes through the metadata server or the OAuth endpoint, so tokens are cached
+per audience, refreshed in the background well before they go stale, and
+concurrent refreshes for the same audience are collapsed into a single fetch.
+When a refresh fails, the cached token keeps being served until it expires.
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("auth_tokens")
+
+# A token this many seconds from its "exp" claim is stale: callers refresh it
+REFRESH_MARGIN_SECONDS = 300
+# The background refresh runs this many seconds before "exp", ahead of the staleness margin
+BACKGROUND_REFRESH_SECONDS = 900
+# Wait between retries after a failed refresh, while the cached token is still valid
+REFRESH_RETRY_SECONDS = 30
+# Used when a token carries no readable "exp" claim
+DEFAULT_TOKEN_LIFETIME_SECONDS = 3600
+
+
+def google_id_token_issuer(audience: str) -> str:
+    """Fetch a Google-signed ID token for the given audience."""
+    from google.auth.transport.requests import Request
+    from google.oauth2 import id_token
+
+    return id_token.fetch_id_token(Request(), audience)
+
+
+def token_expiry(token: str) -> float:
+    """
+    Read the "exp" claim from a JWT without verifying its signature.
+
+    Args:
+        token: Encoded JWT.
+
+    Returns:
+        float: Expiry as a UNIX timestamp, or now + DEFAULT_TOKEN_LIFETIME_SECONDS
+               when the claim can't be read.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return time.time() + DEFAULT_TOKEN_LIFETIME_SECONDS
+
+
+class FakeIssuer:
+    """
+    Offline token issuer producing unsigned JWTs with a configurable lifetime.
+
+    Use it in place of google_id_token_issuer to exercise TokenProvider without
+    Google credentials. Every issued token is unique so refreshes are observable.
+    """
+
+    def __init__(self, lifetime: float = 3600, delay: float = 0.0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, audience: str) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(audience)
+            serial = len(self.calls)
+        now = time.time()
+        header = {"alg": "none", "typ": "JWT"}
+        claims = {"aud": audience, "iat": int(now), "exp": now + self.lifetime, "jti": serial}
+        return ".".join([_b64(header), _b64(claims), ""])
+
+
+def _b64(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+
+class _Entry:
+    __slots__ = ("token", "expires_at", "lock", "timer", "retry_at")
+
+    def __init__(self):
+        self.token = None
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+        self.timer = None
+        # After a failed refresh, callers don't try again before this time
+        self.retry_at = 0.0
+
+
+class TokenProvider:
+    """
+    Per-audience ID token cache with proactive background refresh.
+
+    Args:
+        issuer: Callable taking an audience and returning an encoded JWT.
+        refresh_margin: Seconds before expiry at which a token is stale and
+                        callers refresh it.
+        background_refresh: Schedule a timer to refresh each token before it
+                            goes stale, so callers don't wait on a fetch.
+        background_margin: Seconds before expiry at which the timer fires. For
+                           tokens that don't live much longer than that, it
+                           fires halfway to the staleness margin instead.
+    """
+
+    def __init__(self, issuer=google_id_token_issuer, refresh_margin: float = REFRESH_MARGIN_SECONDS,
+                 background_refresh: bool = True, background_margin: float = BACKGROUND_REFRESH_SECONDS):
+        self.issuer = issuer
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self.background_margin = background_margin
+        self._entries = {}
+        self._entries_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.refresh_seconds_total = 0.0
+        self.refresh_seconds_max = 0.0
+
+    def _entry(self, audience: str) -> _Entry:
+        with self._entries_lock:
+            entry = self._entries.get(audience)
+            if entry is None:
+                entry = self._entries[audience] = _Entry()
+            return entry
+
+    def _fresh(self, entry: _Entry) -> bool:
+        return entry.token is not None and time.time() < entry.expires_at - self.refresh_margin
+
+    def _usable(self, entry: _Entry) -> bool:
+        """Stale but not expired: still accepted by the backend if a refresh fails."""
+        return entry.token is not None and time.time() < entry.expires_at
+
+    def get_token(self, audience: str) -> str:
+        """
+        Return a valid ID token for the audience, fetching it only when needed.
+
+        Concurrent callers for the same audience wait on one fetch instead of
+        each issuing their own. If the fetch fails while the cached token has
+        not expired yet, the cached token is returned (and the fetch is retried
+        after REFRESH_RETRY_SECONDS) instead of failing the tool call.
+        """
+        entry = self._entry(audience)
+        if self._fresh(entry):
+            self._count("hits")
+            return entry.token
+        with entry.lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._fresh(entry):
+                self._count("hits")
+                return entry.token
+            if self._usable(entry) and time.time() < entry.retry_at:
+                self._count("hits")
+                return entry.token
+            self._count("misses")
+            try:
+                self._refresh(audience, entry)
+            except Exception as e:
+                if not self._usable(entry):
+                    raise
+                entry.retry_at = time.time() + REFRESH_RETRY_SECONDS
+                logger.warning(f"Token refresh failed for {audience}, using the cached token until it expires: {str(e)}")
+            return entry.token
+
+    def prefetch(self, *audiences: str) -> None:
+        """Fetch tokens for the given audiences ahead of the first tool call."""
+        for audience in audiences:
+            entry = self._entry(audience)
+            with entry.lock:
+                if not self._fresh(entry):
+                    self._refresh(audience, entry)
+
+    def invalidate(self, audience: str = None) -> None:
+        """Drop the cached token for one audience, or for all of them."""
+        with self._entries_lock:
+            audiences = [audience] if audience else list(self._entries)
+            for aud in audiences:
+                entry = self._entries.pop(aud, None)
+                if entry and entry.timer:
+                    entry.timer.cancel()
+
+    def close(self) -> None:
+        """Cancel all pending background refreshes."""
+        self._closed = True
+        self.invalidate()
+
+    def stats(self) -> dict:
+        """Counters for hits, misses and refresh latency."""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "refresh_seconds_avg": self.refresh_seconds_total / self.refreshes if self.refreshes else 0.0,
+                "refresh_seconds_max": self.refresh_seconds_max,
+                "audiences": len(self._entries),
+            }
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _refresh(self, audience: str, entry: _Entry) -> None:
+        # Caller must hold entry.lock
+        started = time.perf_counter()
+        try:
+            token = self.issuer(audience)
+        except Exception:
+            self._count("refresh_failures")
+            raise
+        elapsed = time.perf_counter() - started
+        entry.token = token
+        entry.expires_at = token_expiry(token)
+        entry.retry_at = 0.0
+        with self._stats_lock:
+            self.refreshes += 1
+            self.refresh_seconds_total += elapsed
+            self.refresh_seconds_max = max(self.refresh_seconds_max, elapsed)
+        self._schedule(audience, entry)
+
+    def _schedule(self, audience: str, entry: _Entry, delay: float = None) -> None:
+        if not self.background_refresh or self._closed:
+            return
+        if entry.timer:
+            entry.timer.cancel()
+        if delay is None:
+            remaining = entry.expires_at - time.time()
+            # Well before the token goes stale, so callers keep getting hits
+            delay = max(remaining - self.background_margin, (remaining - self.refresh_margin) / 2, 1.0)
+        entry.timer = threading.Timer(delay, self._background_refresh, args=(audience, entry, entry.token))
+        entry.timer.daemon = True
+        entry.timer.start()
+
+    def _background_refresh(self, audience: str, entry: _Entry, scheduled_token: str) -> None:
+        if self._closed:
+            return
+        with entry.lock:
+            if entry.token is not scheduled_token:
+                # Refreshed in the foreground meanwhile, which scheduled its own timer
+                return
+            try:
+                self._refresh(audience, entry)
+            except Exception as e:
+                logger.warning(f"Background token refresh failed for {audience}: {str(e)}")
+                if self._usable(entry):
+                    # Keep serving the cached token and try again shortly
+                    self._schedule(audience, entry, delay=REFRESH_RETRY_SECONDS)
+
+
+_default_provider = None
+_default_provider_lock = threading.Lock()
+
+
+def get_token_provider() -> TokenProvider:
+    """
+    Process-wide TokenProvider backed by Google's ID token issuer.
+
+    AUTH_TOKEN_ISSUER=fake switches to FakeIssuer, for running against local
+    stub backends without Google credentials.
+    """
+    global _default_provider
+    if _default_provider is None:
+        with _default_provider_lock:
+            if _default_provider is None:
+                if os.getenv("AUTH_TOKEN_ISSUER", "google") == "fake":
+                    _default_provider = TokenProvider(FakeIssuer())
+                else:
+                    _default_provider = TokenProvider()
+    return _default_provider
+
+
+def set_token_provider(provider: TokenProvider) -> None:
+    """Replace the process-wide provider, e.g. with one using FakeIssuer."""
+    global _default_provider
+    with _default_provider_lock:
+        if _default_provider is not None and _default_provider is not provider:
+            _default_provider.close()
+        _default_provider = provider
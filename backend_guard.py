@@ -0,0 +1,290 @@
+"""
+Circuit breakers and adaptive concurrency limits for the tool backends.
+
+When one Cloud Run function degrades, every turn that calls it waits on it and
+the model tends to retry failed tools, multiplying load on the sick service.
+Each backend gets a BackendGuard:
+
+- a CircuitBreaker opens after repeated failures (or a high failure rate over
+  the recent calls), fails calls fast while open, and after a cool-down lets a
+  single probe through (half-open) to decide whether to close again;
+- an AdaptiveLimiter caps concurrent calls with AIMD: the limit grows by about
+  one per round of fast successes and is cut multiplicatively on failures or
+  slow responses.
+
+Rejected calls raise BackendUnavailableError, whose message tells the model
+not to retry the tool in this turn.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from telemetry import registry
+
+logger = logging.getLogger("backend_guard")
+
+FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+WINDOW_SIZE = int(os.getenv("BREAKER_WINDOW", "20"))
+CONSECUTIVE_FAILURES = int(os.getenv("BREAKER_CONSECUTIVE_FAILURES", "5"))
+OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "120"))
+
+INITIAL_LIMIT = float(os.getenv("TOOL_CONCURRENCY_INITIAL", "10"))
+MIN_LIMIT = float(os.getenv("TOOL_CONCURRENCY_MIN", "1"))
+MAX_LIMIT = float(os.getenv("TOOL_CONCURRENCY_MAX", "50"))
+# Responses slower than this count as congestion and shrink the limit
+LATENCY_TARGET_SECONDS = float(os.getenv("TOOL_LATENCY_TARGET_MS", "3000")) / 1000
+DECREASE_FACTOR = 0.7
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+rejections_total = registry.counter(
+    "agent_tool_backend_rejections_total", "Tool backend calls failed fast by reason (circuit_open/overloaded)")
+
+
+class BackendUnavailableError(Exception):
+    """A call was rejected without reaching the backend."""
+
+    MESSAGES = {
+        "circuit_open": (
+            "El servicio de esta herramienta no está disponible en este momento. "
+            "No vuelvas a llamar esta herramienta en este turno; informa al cliente que por ahora "
+            "no es posible consultar esa información y continúa con lo demás."
+        ),
+        "overloaded": (
+            "El servicio de esta herramienta está saturado en este momento. "
+            "No vuelvas a llamar esta herramienta en este turno; informa al cliente que lo intente "
+            "de nuevo en unos minutos."
+        ),
+    }
+
+    def __init__(self, backend: str, reason: str, retry_after: float = None):
+        super().__init__(self.MESSAGES[reason])
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed -> open -> half-open state machine for one backend.
+
+    Args:
+        failure_rate: Failure ratio over the window that opens the circuit.
+        min_calls: Calls in the window before the failure rate is considered.
+        window_size: Most recent outcomes kept.
+        consecutive_failures: Failures in a row that open the circuit.
+        open_seconds: First cool-down; doubles each time a probe fails.
+        max_open_seconds: Longest cool-down.
+    """
+
+    def __init__(self, failure_rate: float = FAILURE_RATE, min_calls: int = MIN_CALLS,
+                 window_size: int = WINDOW_SIZE, consecutive_failures: int = CONSECUTIVE_FAILURES,
+                 open_seconds: float = OPEN_SECONDS, max_open_seconds: float = MAX_OPEN_SECONDS):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.consecutive_threshold = consecutive_failures
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self.opens = 0
+        self._outcomes = deque(maxlen=window_size)
+        self._consecutive = 0
+        self._cooldown = open_seconds
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self._cooldown:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def cancel_probe(self) -> None:
+        """Give back a half-open probe slot that was never used."""
+        with self._lock:
+            self._probing = False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(self._opened_at + self._cooldown - time.monotonic(), 0.0)
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success:
+                    self.state = CLOSED
+                    self._cooldown = self.open_seconds
+                    self._outcomes.clear()
+                    self._consecutive = 0
+                else:
+                    self._cooldown = min(self._cooldown * 2, self.max_open_seconds)
+                    self._open()
+                return
+            self._outcomes.append(success)
+            self._consecutive = 0 if success else self._consecutive + 1
+            failures = self._outcomes.count(False)
+            if self.state == CLOSED and (
+                self._consecutive >= self.consecutive_threshold
+                or (len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate)
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opens += 1
+        self._opened_at = time.monotonic()
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one backend.
+
+    Args:
+        initial: Starting limit.
+        min_limit: Floor of the limit.
+        max_limit: Ceiling of the limit.
+        latency_target: Successful calls slower than this (seconds) shrink the limit.
+        decrease: Multiplicative decrease factor.
+    """
+
+    def __init__(self, initial: float = INITIAL_LIMIT, min_limit: float = MIN_LIMIT, max_limit: float = MAX_LIMIT,
+                 latency_target: float = LATENCY_TARGET_SECONDS, decrease: float = DECREASE_FACTOR):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, success: bool, latency: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if success and latency <= self.latency_target:
+                # About +1 per `limit` fast successes, i.e. per round trip
+                self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+            else:
+                self.limit = max(self.limit * self.decrease, self.min_limit)
+
+
+class BackendGuard:
+    """Circuit breaker plus adaptive limiter in front of one backend."""
+
+    def __init__(self, name: str, breaker: CircuitBreaker = None, limiter: AdaptiveLimiter = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveLimiter()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = {"circuit_open": 0, "overloaded": 0}
+        self._stats_lock = threading.Lock()
+
+    def call(self, fn, is_failure=None):
+        """
+        Run fn() through the breaker and the limiter.
+
+        Args:
+            fn: Zero-argument callable performing the backend request.
+            is_failure: Optional predicate on fn's result (e.g. a 5xx response)
+                        counting it as a failure without raising.
+
+        Raises:
+            BackendUnavailableError: When the circuit is open or the backend is
+                                     at its concurrency limit.
+        """
+        if not self.breaker.allow():
+            self._reject("circuit_open", self.breaker.retry_after())
+        if not self.limiter.try_acquire():
+            # This call never reached the backend, so it can't serve as the probe
+            self.breaker.cancel_probe()
+            self._reject("overloaded")
+        started = time.monotonic()
+        success = False
+        try:
+            result = fn()
+            success = not (is_failure and is_failure(result))
+            return result
+        finally:
+            self.limiter.release(success, time.monotonic() - started)
+            self.breaker.record(success)
+            with self._stats_lock:
+                self.calls += 1
+                if not success:
+                    self.failures += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": STATE_VALUES[self.breaker.state],
+            "opens": self.breaker.opens,
+            "limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected_circuit_open": self.rejected["circuit_open"],
+            "rejected_overloaded": self.rejected["overloaded"],
+        }
+
+    def _reject(self, reason: str, retry_after: float = None):
+        with self._stats_lock:
+            self.rejected[reason] += 1
+        rejections_total.inc(backend=self.name, reason=reason)
+        logger.warning(f"Tool backend {self.name} call rejected: {reason}")
+        raise BackendUnavailableError(self.name, reason, retry_after)
+
+
+def backend_name(url: str) -> str:
+    """Short backend name from its URL (the Cloud Run service, or host and path for stubs)."""
+    parts = urlsplit(url)
+    host = parts.hostname or url
+    if host.endswith(".run.app"):
+        return host.split(".")[0]
+    return f"{host}{parts.path}".rstrip("/")
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_backend_guard(service_url: str) -> BackendGuard:
+    """Process-wide guard for a backend, keyed by its service URL."""
+    guard = _guards.get(service_url)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.get(service_url)
+            if guard is None:
+                guard = _guards[service_url] = BackendGuard(backend_name(service_url))
+    return guard
+
+
+def backend_guard_stats() -> dict:
+    """Stats of every guard, flattened as "<backend>.<stat>" for /metrics."""
+    return {
+        f"{guard.name}.{stat}": value
+        for guard in list(_guards.values())
+        for stat, value in guard.stats().items()
+    }
@@ -0,0 +1,12 @@
+"""
+Offline benchmark harness for the agent API.
+
+- stub_tools: local HTTP server emulating the four Cloud Run tool backends with
+  configurable latency and error distributions.
+- fake_model: scripted chat model standing in for Gemini, replaying
+  tool-calling traces (plugged in through AGENT_MODEL_BUILDER).
+- load: fixed-concurrency load generator for /api/chat/ and the report built
+  from its samples and the server's /metrics.
+
+Run everything together with `python manage.py benchmark`.
+"""
@@ -0,0 +1,206 @@
+"""
+Scripted chat model that replays tool-calling traces instead of calling Gemini.
+
+Each trace pairs a user prompt with the steps the model takes for it: zero or
+more steps of tool calls followed by a final answer. The model finds the trace
+for the latest user message, counts the tool-calling turns already in the
+scratchpad and returns the next step, so the real AgentExecutor, tools and
+history run exactly as they do in production.
+
+Traces come from FAKE_MODEL_TRACES (a JSON file with a list of traces) or
+DEFAULT_TRACES. Model latency is drawn from a log-normal distribution around
+FAKE_MODEL_LATENCY_MS.
+"""
+
+import math
+import os
+import random
+import time
+import uuid
+from typing import Any, List, Optional
+
+import orjson
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from tool_cache import fold_text
+
+LATENCY_MS = float(os.getenv("FAKE_MODEL_LATENCY_MS", "400"))
+# Spread of the log-normal latency (0 disables jitter)
+LATENCY_SIGMA = float(os.getenv("FAKE_MODEL_LATENCY_SIGMA", "0.3"))
+
+DEFAULT_TRACES = [
+    {
+        "prompt": "Hola, ¿qué pizzas tienen?",
+        "steps": [
+            {"tool_calls": [{"name": "consulta_productos_menu",
+                             "args": {"product_name": "pizza", "search_mode": "categories"}}]},
+            {"content": "Tenemos pizza de pepperoni, hawaiana y suprema. ¿Cuál te gustaría ordenar?"},
+        ],
+    },
+    {
+        "prompt": "Quiero ver el menú",
+        "steps": [
+            {"tool_calls": [{"name": "imagenes_menu", "args": {}}]},
+            {"content": "Aquí tienes las imágenes de nuestro menú. ¿Qué te gustaría pedir?"},
+        ],
+    },
+    {
+        "prompt": "¿Qué tamaños y precios tiene la pizza hawaiana?",
+        "steps": [
+            {"tool_calls": [
+                {"name": "consulta_productos_menu", "args": {"product_name": "pizza hawaiana"}},
+                {"name": "consulta_atributos", "args": {"category_name": "Pizza"}},
+            ]},
+            {"content": "La pizza hawaiana viene en tamaño personal, mediano y grande. ¿Cuál prefieres?"},
+        ],
+    },
+    {
+        "prompt": "Soy Juan Pérez, mi teléfono es 7777-1234",
+        "steps": [
+            {"tool_calls": [{"name": "consulta_clientes",
+                             "args": {"nombre_cliente": "Juan Pérez", "telefono_cliente": "77771234"}}]},
+            {"content": "Gracias, Juan. Encontré tu dirección registrada. ¿Deseas que enviemos el pedido ahí?"},
+        ],
+    },
+    {
+        "prompt": "¿Qué cafés tienen por menos de 3 dólares?",
+        "steps": [
+            {"tool_calls": [{"name": "consulta_productos_menu",
+                             "args": {"product_name": "3", "search_mode": "price", "max_results": 5}}]},
+            {"tool_calls": [{"name": "consulta_atributos", "args": {"category_name": "CAFES"}}]},
+            {"content": "Tenemos café americano y capuchino por menos de 3 dólares. ¿Te sirvo alguno?"},
+        ],
+    },
+    {
+        "prompt": "Gracias, eso es todo",
+        "steps": [
+            {"content": "¡Con gusto! Gracias por tu visita."},
+        ],
+    },
+]
+
+
+def load_traces(path: str = None) -> list:
+    """Traces from a JSON file, or DEFAULT_TRACES when no path is given."""
+    path = path or os.getenv("FAKE_MODEL_TRACES")
+    if not path:
+        return DEFAULT_TRACES
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part if isinstance(part, str) else str(part.get("text", "")) for part in content)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model replaying scripted traces.
+
+    Attributes:
+        traces: List of {"prompt": str, "steps": [...]} traces.
+        latency_ms: Median simulated latency per call.
+        latency_sigma: Log-normal spread of the latency.
+        seed: Seed for the latency jitter, for reproducible runs.
+    """
+
+    traces: List[dict] = DEFAULT_TRACES
+    latency_ms: float = LATENCY_MS
+    latency_sigma: float = LATENCY_SIGMA
+    seed: Optional[int] = None
+    _random: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-gemini"
+
+    def bind_tools(self, tools, **kwargs):
+        # Tool calls come from the trace, so the tool schemas aren't needed
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        time.sleep(self._latency())
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs):
+        time.sleep(self._latency())
+        message = self._next_message(messages)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": orjson.dumps(call["args"]).decode(), "id": call["id"], "index": i}
+                    for i, call in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            ))
+            return
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            chunk = AIMessageChunk(content=word if i == 0 else f" {word}")
+            if i == len(words) - 1:
+                chunk.usage_metadata = message.usage_metadata
+            yield ChatGenerationChunk(message=chunk)
+
+    def _latency(self) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return self._random.lognormvariate(math.log(max(self.latency_ms, 0.001)), self.latency_sigma) / 1000
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        last_user = max((i for i, m in enumerate(messages) if m.type == "human"), default=-1)
+        user_text = _text(messages[last_user]) if last_user >= 0 else ""
+        # Tool-calling turns already taken for this user message
+        step_index = sum(1 for m in messages[last_user + 1:] if m.type == "ai" and getattr(m, "tool_calls", None))
+        steps = self._trace_for(user_text)["steps"]
+        step = steps[min(step_index, len(steps) - 1)]
+        if step_index >= len(steps) - 1 and "tool_calls" in step:
+            step = {"content": "Listo."}
+
+        prompt_tokens = sum(math.ceil(len(_text(m)) / 4) + 4 for m in messages)
+        if "tool_calls" in step:
+            tool_calls = [
+                {"name": call["name"], "args": call.get("args", {}), "id": f"call_{uuid.uuid4().hex[:12]}",
+                 "type": "tool_call"}
+                for call in step["tool_calls"]
+            ]
+            completion_tokens = sum(math.ceil(len(orjson.dumps(call["args"])) / 4) + 4 for call in tool_calls)
+            message = AIMessage(content="", tool_calls=tool_calls)
+        else:
+            completion_tokens = math.ceil(len(step["content"]) / 4)
+            message = AIMessage(content=step["content"])
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return message
+
+    def _trace_for(self, user_text: str) -> dict:
+        folded = fold_text(user_text)
+        for trace in self.traces:
+            if fold_text(trace["prompt"]) == folded:
+                return trace
+        for trace in self.traces:
+            if fold_text(trace["prompt"]) in folded or folded in fold_text(trace["prompt"]):
+                return trace
+        # Unknown prompts still get a stable trace
+        return self.traces[sum(folded.encode()) % len(self.traces)]
+
+
+def build_scripted_model(model_name: str = None, *, model_kwargs: dict = None, **kwargs) -> ScriptedChatModel:
+    """model_builder for LangchainAgent; set AGENT_MODEL_BUILDER=benchmarks.fake_model:build_scripted_model."""
+    seed = os.getenv("FAKE_MODEL_SEED")
+    return ScriptedChatModel(traces=load_traces(), seed=int(seed) if seed else None)
@@ -0,0 +1,228 @@
+"""
+Fixed-concurrency load generator for /api/chat/ and the benchmark report.
+
+Latency percentiles, throughput and error counts come from the client-side
+samples; the per-stage breakdown (parse, history, llm, tool.*, ...) comes from
+the difference between two scrapes of the server's /metrics.
+"""
+
+import asyncio
+import math
+import re
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+
+_SAMPLE_LINE = re.compile(r'^(?P<name>[a-zA-Z_:][\w:]*)(?:\{(?P<labels>[^}]*)\})?\s+(?P<value>\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+@dataclass
+class LoadResult:
+    """Client-side samples of one load run."""
+
+    latencies: list = field(default_factory=list)
+    statuses: dict = field(default_factory=lambda: defaultdict(int))
+    failures: dict = field(default_factory=lambda: defaultdict(int))
+    elapsed: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return sum(self.statuses.values()) + sum(self.failures.values())
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile of the latencies, in seconds."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+    def summary(self) -> dict:
+        ok = self.statuses.get(200, 0)
+        return {
+            "requests": self.requests,
+            "ok": ok,
+            "error_rate": 1 - ok / self.requests if self.requests else 0.0,
+            "rps": self.requests / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": max(self.latencies, default=0.0) * 1000,
+            "statuses": dict(self.statuses),
+            "failures": dict(self.failures),
+        }
+
+
+def chat_body(message: str, session_id: str, first: bool) -> dict:
+    return {
+        "messages": [{"role": "user", "content": message}],
+        "session_id": session_id,
+        "isFirstInteraction": first,
+    }
+
+
+async def run_load(base_url: str, prompts: list, concurrency: int = 8, requests: int = 200,
+                   duration: float = None, turns_per_session: int = 4, path: str = "/api/chat/",
+                   timeout: float = 120.0) -> LoadResult:
+    """
+    Send chat requests at a fixed concurrency.
+
+    Each worker plays sessions of turns_per_session consecutive prompts, so
+    history grows the way it does for a real conversation.
+
+    Args:
+        base_url: Server root, e.g. http://127.0.0.1:8000.
+        prompts: User messages, cycled through in order.
+        concurrency: Requests in flight at any time.
+        requests: Total requests to send (ignored when duration is given).
+        duration: Seconds to keep sending requests instead of a fixed count.
+        turns_per_session: Consecutive requests sharing a session_id.
+        path: Chat endpoint path.
+        timeout: Per-request timeout in seconds.
+
+    Returns:
+        LoadResult: Latency samples and status counts.
+    """
+    result = LoadResult()
+    issued = 0
+    deadline = time.monotonic() + duration if duration else None
+
+    def next_index():
+        nonlocal issued
+        if deadline is not None:
+            if time.monotonic() >= deadline:
+                return None
+        elif issued >= requests:
+            return None
+        issued += 1
+        return issued - 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker(worker_id: int):
+            session_id, turn = None, 0
+            while (index := next_index()) is not None:
+                if session_id is None or turn >= turns_per_session:
+                    session_id, turn = f"bench-{worker_id}-{uuid.uuid4().hex[:8]}", 0
+                body = chat_body(prompts[index % len(prompts)], session_id, turn == 0)
+                turn += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, json=body)
+                    result.statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    result.failures[type(e).__name__] += 1
+                result.latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        result.elapsed = time.perf_counter() - started
+    return result
+
+
+def parse_prometheus(text: str) -> dict:
+    """Samples of a Prometheus text exposition as {(name, labels): value}."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE_LINE.match(line)
+        if not match:
+            continue
+        labels = tuple(sorted(_LABEL.findall(match.group("labels") or "")))
+        samples[(match.group("name"), labels)] = float(match.group("value"))
+    return samples
+
+
+def histogram_delta(before: dict, after: dict, metric: str, label: str) -> dict:
+    """
+    Per-label histogram series accumulated between two scrapes.
+
+    Returns:
+        dict: label value -> {"count", "sum", "buckets": [(le, cumulative)]}
+    """
+    series = defaultdict(lambda: {"count": 0.0, "sum": 0.0, "buckets": []})
+    for (name, labels), value in after.items():
+        if not name.startswith(metric):
+            continue
+        label_map = dict(labels)
+        key = label_map.get(label)
+        if key is None:
+            continue
+        delta = value - before.get((name, labels), 0.0)
+        if name == f"{metric}_count":
+            series[key]["count"] = delta
+        elif name == f"{metric}_sum":
+            series[key]["sum"] = delta
+        elif name == f"{metric}_bucket":
+            series[key]["buckets"].append((float(label_map["le"]), delta))
+    for data in series.values():
+        data["buckets"].sort()
+    return dict(series)
+
+
+def bucket_quantile(buckets: list, q: float) -> float:
+    """Quantile estimated from cumulative buckets by linear interpolation, like histogram_quantile."""
+    if not buckets or buckets[-1][1] <= 0:
+        return 0.0
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def stage_breakdown(before: dict, after: dict) -> list:
+    """Per-stage count, mean and estimated p50/p95 from agent_stage_duration_seconds."""
+    rows = []
+    for stage, data in histogram_delta(before, after, "agent_stage_duration_seconds", "stage").items():
+        if data["count"] <= 0:
+            continue
+        rows.append({
+            "stage": stage,
+            "count": int(data["count"]),
+            "mean_ms": data["sum"] / data["count"] * 1000,
+            "p50_ms": bucket_quantile(data["buckets"], 0.50) * 1000,
+            "p95_ms": bucket_quantile(data["buckets"], 0.95) * 1000,
+            "total_s": data["sum"],
+        })
+    return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+
+def component_stats(samples: dict, component: str) -> dict:
+    """The agent_component_stat gauges one component reported in a scrape."""
+    stats = {}
+    for (name, labels), value in samples.items():
+        label_map = dict(labels)
+        if name == "agent_component_stat" and label_map.get("component") == component:
+            stats[label_map["stat"]] = value
+    return stats
+
+
+def format_report(summary: dict, stages: list, concurrency: int) -> str:
+    lines = [
+        f"Requests: {summary['requests']} at concurrency {concurrency} "
+        f"({summary['ok']} ok, error rate {summary['error_rate']:.1%})",
+        f"Throughput: {summary['rps']:.2f} req/s",
+        f"Latency: p50 {summary['p50_ms']:.0f} ms | p95 {summary['p95_ms']:.0f} ms | "
+        f"p99 {summary['p99_ms']:.0f} ms | max {summary['max_ms']:.0f} ms",
+    ]
+    if summary["statuses"] or summary["failures"]:
+        outcomes = {**{str(k): v for k, v in summary["statuses"].items()}, **summary["failures"]}
+        lines.append("Outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+    if stages:
+        lines.append("")
+        lines.append(f"{'stage':<32}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}")
+        for row in stages:
+            lines.append(f"{row['stage']:<32}{row['count']:>8}{row['mean_ms']:>10.1f}"
+                         f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['total_s']:>10.2f}")
+    return "\n".join(lines)
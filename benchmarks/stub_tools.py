@@ -0,0 +1,223 @@
+"""
+Local HTTP server emulating the Cloud Run tool backends.
+
+One server answers all four tools under path prefixes, so each tool URL can be
+pointed at it, e.g. CONSULTA_PRODUCTOS_MENU_URL=http://127.0.0.1:8900/consulta_productos_menu.
+Every tool has its own latency and error profile; responses have the same
+shape as the real functions and are built from a small sample catalog.
+"""
+
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+
+from tool_cache import fold_text
+
+TOOL_NAMES = ("consulta_clientes", "imagenes_menu", "consulta_atributos", "consulta_productos_menu")
+
+# Environment variable pointing index.py at each tool
+TOOL_URL_VARIABLES = {
+    "consulta_clientes": "CONSULTA_CLIENTES_URL",
+    "imagenes_menu": "IMAGENES_MENU_URL",
+    "consulta_atributos": "CONSULTA_ATRIBUTOS_URL",
+    "consulta_productos_menu": "CONSULTA_PRODUCTOS_MENU_URL",
+}
+
+SAMPLE_PRODUCTS = [
+    {"productName": "Pizza Pepperoni", "categoryName": "Pizza", "price": "8.99"},
+    {"productName": "Pizza Hawaiana", "categoryName": "Pizza", "price": "9.49"},
+    {"productName": "Pizza Suprema", "categoryName": "Pizza", "price": "10.99"},
+    {"productName": "Café Americano", "categoryName": "CAFES", "price": "1.75"},
+    {"productName": "Capuchino", "categoryName": "CAFES", "price": "2.50"},
+    {"productName": "Latte de Vainilla", "categoryName": "CAFES", "price": "3.25"},
+    {"productName": "Alitas BBQ", "categoryName": "Entradas", "price": "6.50"},
+]
+
+SAMPLE_ATTRIBUTES = {
+    "pizza": {"tamaño": ["Personal", "Mediana", "Grande"], "masa": ["Delgada", "Tradicional"]},
+    "cafes": {"tamaño": ["12 oz", "16 oz"], "leche": ["Entera", "Deslactosada", "Almendra"]},
+}
+
+
+@dataclass
+class StubProfile:
+    """
+    Latency and error distribution of one stub tool.
+
+    Attributes:
+        latency_ms: Median response latency.
+        latency_sigma: Log-normal spread of the latency (0 for a fixed latency).
+        error_rate: Fraction of requests answered with error_status.
+        error_status: HTTP status of injected errors.
+    """
+
+    latency_ms: float = 150
+    latency_sigma: float = 0.4
+    error_rate: float = 0.0
+    error_status: int = 503
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return rng.lognormvariate(math.log(max(self.latency_ms, 0.001)), self.latency_sigma) / 1000
+
+
+def _price(product: dict) -> float:
+    return float(product["price"])
+
+
+def consulta_clientes_response(payload: dict) -> dict:
+    phone = "".join(ch for ch in str(payload.get("telefonoCliente", "")) if ch.isdigit())
+    if not phone:
+        return {"isExistent": False}
+    return {
+        "isExistent": True,
+        "codigo": f"CLI-{phone[-4:]}",
+        "nombre": payload.get("nombreCliente", ""),
+        "telefono": phone,
+        "direccion": "Colonia Escalón, San Salvador",
+    }
+
+
+def imagenes_menu_response(payload: dict) -> dict:
+    return {
+        "success": True,
+        "images": [{"name": f"menu_{i}", "url": f"https://example.com/menu/{i}.jpg"} for i in range(1, 7)],
+    }
+
+
+def consulta_atributos_response(payload: dict) -> dict:
+    attributes = SAMPLE_ATTRIBUTES.get(fold_text(payload.get("categoryName", "")))
+    if attributes is None:
+        return {"success": False, "message": "Categoría no encontrada"}
+    return {"success": True, "categoryName": payload.get("categoryName"), "attributes": attributes}
+
+
+def consulta_productos_menu_response(payload: dict) -> dict:
+    query = fold_text(str(payload.get("productName", "")))
+    mode = payload.get("searchMode", "products")
+    if mode == "categories":
+        results = [p for p in SAMPLE_PRODUCTS if query in fold_text(p["categoryName"])]
+    elif mode == "price":
+        try:
+            budget = float(query.replace(",", "."))
+        except ValueError:
+            budget = 0.0
+        results = sorted((p for p in SAMPLE_PRODUCTS if _price(p) <= budget), key=_price, reverse=True)
+    else:
+        results = [p for p in SAMPLE_PRODUCTS if all(t in fold_text(p["productName"]) for t in query.split())]
+    results = results[:1] if payload.get("singleResult") else results[:int(payload.get("maxResults", 5))]
+    return {
+        "success": True,
+        "searchMode": mode,
+        "query": payload.get("productName"),
+        "totalResults": len(results),
+        "results": results,
+    }
+
+
+RESPONDERS = {
+    "consulta_clientes": consulta_clientes_response,
+    "imagenes_menu": imagenes_menu_response,
+    "consulta_atributos": consulta_atributos_response,
+    "consulta_productos_menu": consulta_productos_menu_response,
+}
+
+
+class StubToolServer:
+    """
+    Threaded HTTP server answering all stub tools.
+
+    Args:
+        profiles: StubProfile per tool name; tools without one use the default.
+        host: Interface to bind.
+        port: Port to bind (0 picks a free one).
+        seed: Seed for latency and error sampling.
+    """
+
+    def __init__(self, profiles: dict = None, host: str = "127.0.0.1", port: int = 0, seed: int = None):
+        self.profiles = {name: (profiles or {}).get(name, StubProfile()) for name in TOOL_NAMES}
+        self.requests = {name: 0 for name in TOOL_NAMES}
+        self.errors = {name: 0 for name in TOOL_NAMES}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tool_urls(self) -> dict:
+        """Environment variables pointing each tool at this server."""
+        return {variable: f"{self.base_url}/{name}" for name, variable in TOOL_URL_VARIABLES.items()}
+
+    def start(self) -> "StubToolServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-tools", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+    def _plan(self, tool: str):
+        """Latency and whether to fail for one request."""
+        profile = self.profiles[tool]
+        with self._lock:
+            self.requests[tool] += 1
+            delay = profile.sample_latency(self._rng)
+            failed = self._rng.random() < profile.error_rate
+            if failed:
+                self.errors[tool] += 1
+        return delay, failed
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                tool = self.path.strip("/").split("/")[0]
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if tool not in RESPONDERS:
+                    self._send(404, {"error": f"Unknown tool {tool}"})
+                    return
+                delay, failed = server._plan(tool)
+                time.sleep(delay)
+                if failed:
+                    self._send(server.profiles[tool].error_status, {"error": "Injected stub error"})
+                    return
+                try:
+                    payload = orjson.loads(body) if body else {}
+                except orjson.JSONDecodeError:
+                    self._send(400, {"error": "Invalid JSON"})
+                    return
+                self._send(200, RESPONDERS[tool](payload or {}))
+
+            def _send(self, status: int, data: dict):
+                encoded = orjson.dumps(data)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format, *args):
+                # Keep benchmark output readable
+                pass
+
+        return Handler
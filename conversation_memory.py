@@ -0,0 +1,182 @@
+"""
+Bounded conversation memory for the prompt's {history} placeholder.
+
+Long-lived sessions would otherwise inject their entire history into every
+prompt. MemoryManager keeps the last K turns verbatim, folds older turns into a
+running summary stored with the session, shortens stale tool payloads (e.g. big
+imagenes_menu results from earlier turns) and enforces a token budget for the
+history block.
+"""
+
+import logging
+import math
+import os
+import threading
+
+from langchain_core.messages import SystemMessage
+
+logger = logging.getLogger("conversation_memory")
+
+KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+TOOL_PAYLOAD_CHARS = int(os.getenv("HISTORY_TOOL_PAYLOAD_CHARS", "500"))
+SUMMARY_MAX_CHARS = int(os.getenv("HISTORY_SUMMARY_MAX_CHARS", "2000"))
+
+SUMMARY_PREFIX = "Resumen de la conversación anterior con el cliente:"
+OMITTED_TOOL_PAYLOAD = "[Resultado de herramienta de un turno anterior omitido]"
+
+_SPEAKERS = {"human": "Cliente", "ai": "Asistente"}
+
+
+def message_text(message) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part if isinstance(part, str) else str(part.get("text", "")) for part in content)
+
+
+def estimate_tokens(messages) -> int:
+    """Rough token count (about four characters per token) for a list of messages."""
+    return sum(math.ceil(len(message_text(m)) / 4) + 4 for m in messages)
+
+
+def split_turns(messages) -> list:
+    """Group messages into turns, each starting at a user message."""
+    turns = []
+    for message in messages:
+        if message.type == "human" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def extractive_summarizer(previous: str, messages) -> str:
+    """
+    Default summarizer: appends a shortened line per user/assistant message.
+
+    Costs no model call; the oldest lines are dropped once the summary exceeds
+    SUMMARY_MAX_CHARS.
+    """
+    lines = previous.splitlines() if previous else []
+    for message in messages:
+        speaker = _SPEAKERS.get(message.type)
+        text = " ".join(message_text(message).split())
+        if speaker and text:
+            lines.append(f"- {speaker}: {text[:160]}{'…' if len(text) > 160 else ''}")
+    while lines and len("\n".join(lines)) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def model_summarizer(model):
+    """Summarizer that asks a chat model to update the running summary."""
+    def summarize(previous: str, messages) -> str:
+        transcript = "\n".join(
+            f"{_SPEAKERS[m.type]}: {message_text(m)}" for m in messages if m.type in _SPEAKERS
+        )
+        prompt = (
+            "Actualiza el resumen de una conversación entre un cliente y el asistente de un restaurante. "
+            "Conserva datos del cliente, productos elegidos y pedidos pendientes. Responde solo con el resumen.\n\n"
+            f"Resumen actual:\n{previous or '(vacío)'}\n\nNuevos mensajes:\n{transcript}"
+        )
+        return message_text(model.invoke(prompt)).strip()[:SUMMARY_MAX_CHARS]
+    return summarize
+
+
+class MemoryManager:
+    """
+    Compacts a session's messages before they are injected into the prompt.
+
+    Args:
+        keep_turns: Most recent turns kept verbatim.
+        token_budget: Maximum estimated tokens for the whole history block;
+                      older verbatim turns are summarized until it fits.
+        tool_payload_chars: Tool results longer than this are replaced by a
+                            placeholder outside the latest turn.
+        summarizer: Callable (previous_summary, messages) -> new summary.
+    """
+
+    def __init__(self, keep_turns: int = KEEP_TURNS, token_budget: int = TOKEN_BUDGET,
+                 tool_payload_chars: int = TOOL_PAYLOAD_CHARS, summarizer=extractive_summarizer):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.tool_payload_chars = tool_payload_chars
+        self.summarizer = summarizer
+        self._lock = threading.Lock()
+        self.compactions = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.last_tokens_before = 0
+        self.last_tokens_after = 0
+
+    def compact(self, messages, summary: dict = None, token_budget: int = None):
+        """
+        Build the history view for the prompt.
+
+        Args:
+            messages: Every stored message of the session, oldest first.
+            summary: Stored running summary {"text": str, "messages": int}, where
+                     "messages" counts how many leading messages it covers.
+            token_budget: Override of the manager's budget for this call.
+
+        Returns:
+            tuple: (messages for the prompt, updated summary dict or None)
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        turns = split_turns(messages)
+        recent = [self._strip_tool_payloads(turn) for turn in turns[-self.keep_turns:]] if self.keep_turns else []
+        if recent:
+            # The latest turn keeps its tool results intact
+            recent[-1] = turns[-1]
+        older_count = len(messages) - sum(len(turn) for turn in recent)
+
+        summary_text = (summary or {}).get("text", "")
+        while len(recent) > 1 and self._tokens(summary_text, recent) > budget:
+            older_count += len(recent.pop(0))
+
+        covered = (summary or {}).get("messages", 0)
+        # Never repeat verbatim what the stored summary already covers
+        while len(recent) > 1 and older_count < covered:
+            older_count += len(recent.pop(0))
+        if older_count > covered:
+            summary_text = self.summarizer(summary_text, messages[covered:older_count])
+            summary = {"text": summary_text, "messages": older_count}
+
+        view = [m for turn in recent for m in turn]
+        if summary_text:
+            view.insert(0, SystemMessage(content=f"{SUMMARY_PREFIX}\n{summary_text}"))
+        self._record(estimate_tokens(messages), estimate_tokens(view))
+        return view, summary
+
+    def stats(self) -> dict:
+        """Prompt history tokens before and after compaction."""
+        with self._lock:
+            return {
+                "compactions": self.compactions,
+                "tokens_before_total": self.tokens_before,
+                "tokens_after_total": self.tokens_after,
+                "last_tokens_before": self.last_tokens_before,
+                "last_tokens_after": self.last_tokens_after,
+                "reduction_ratio": 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0,
+            }
+
+    def _tokens(self, summary_text: str, turns) -> int:
+        tokens = estimate_tokens([m for turn in turns for m in turn])
+        return tokens + (math.ceil(len(summary_text) / 4) if summary_text else 0)
+
+    def _strip_tool_payloads(self, turn) -> list:
+        stripped = []
+        for message in turn:
+            if message.type == "tool" and len(message_text(message)) > self.tool_payload_chars:
+                message = message.model_copy(update={"content": OMITTED_TOOL_PAYLOAD})
+            stripped.append(message)
+        return stripped
+
+    def _record(self, before: int, after: int) -> None:
+        with self._lock:
+            self.compactions += 1
+            self.tokens_before += before
+            self.tokens_after += after
+            self.last_tokens_before = before
+            self.last_tokens_after = after
+        logger.debug(f"History compacted from ~{before} to ~{after} tokens")
@@ -0,0 +1,29 @@
+"""
+Gunicorn hooks for the agent API.
+
+The agent is built lazily on first use. With AGENT_WARMUP_ON_FORK=true each
+worker builds it right after forking, in a background thread, so the worker
+starts accepting connections immediately and the first conversation finds the
+agent ready. Building happens after the fork because gRPC channels created in
+the master process don't survive it.
+"""
+
+import os
+import threading
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+
+def post_fork(server, worker):
+    if os.getenv("AGENT_WARMUP_ON_FORK", "false").lower() != "true":
+        return
+
+    def warm():
+        from index import warm_up
+
+        try:
+            server.log.info(f"Worker {worker.pid} warm-up: {warm_up()}")
+        except Exception as e:
+            server.log.warning(f"Worker {worker.pid} warm-up failed: {str(e)}")
+
+    threading.Thread(target=warm, name="agent-warmup", daemon=True).start()
@@ -0,0 +1,737 @@
+"""
+Chat history storage with a shared Firestore client and write-behind batching.
+
+Session documents use the same layout as langchain_google_firestore's
+FirestoreChatMessageHistory ({"messages": [message dicts]} in one document per
+session, plus optional "summary" and "usage" fields written by the memory
+manager and the token accounting), so
+existing conversations keep loading. Differences:
+
+- one Firestore client (and gRPC channel) is shared by the whole process,
+- a turn reads its session history once, and recently active sessions are
+  served from an in-process cache,
+- messages added during a turn are buffered and committed shortly after, for
+  all sessions touched in the meantime, in a single batched write,
+- a commit appends the flushed messages to the stored ones (see
+  apply_history_writes) instead of overwriting the document, so workers
+  sharing a session don't drop each other's messages,
+- pending writes are flushed when the process exits,
+- with HISTORY_WRITE_QUEUE=true, flushes are stored as durable background jobs
+  (agent_api.jobs) and written to the backend by the job workers, so they
+  survive the process being killed and are retried when the backend fails.
+  Some worker must run them: JOB_WORKER_THREADS in the API process, or
+  `python manage.py run_jobs`. Until one does, the stored history lags behind.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import orjson
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from telemetry import span
+from token_accounting import current_turn_usage
+
+logger = logging.getLogger("history_store")
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+CACHE_MAX_SESSIONS = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "2000"))
+CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("HISTORY_CACHE_TTL", "600"))
+CACHE_VERIFY_VERSIONS = os.getenv("HISTORY_CACHE_VERIFY_VERSIONS", "true").lower() == "true"
+# A cached session's stored version is checked at most once per this many seconds
+CACHE_VERIFY_INTERVAL_SECONDS = float(os.getenv("HISTORY_CACHE_VERIFY_INTERVAL", "5"))
+WRITE_QUEUE_ENABLED = os.getenv("HISTORY_WRITE_QUEUE", "false").lower() == "true"
+# Firestore accepts at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+# Ids of the latest flushes applied to a session, kept to skip retried ones
+FLUSH_IDS_KEPT = 50
+
+_firestore_clients = {}
+_firestore_clients_lock = threading.Lock()
+
+
+def get_firestore_client(project: str):
+    """Process-wide Firestore client for a project (honors FIRESTORE_EMULATOR_HOST)."""
+    client = _firestore_clients.get(project)
+    if client is None:
+        with _firestore_clients_lock:
+            client = _firestore_clients.get(project)
+            if client is None:
+                from google.cloud import firestore
+
+                client = _firestore_clients[project] = firestore.Client(project=project)
+    return client
+
+
+def decode_message_dicts(stored: list) -> list:
+    """Turn stored entries (dicts, or JSON strings/bytes when encode_message was on) into messages."""
+    dicts = []
+    for entry in stored:
+        if isinstance(entry, (bytes, str)):
+            entry = json.loads(entry)
+        dicts.append(entry)
+    return messages_from_dict(dicts)
+
+
+class MinuteHitRate:
+    """Hit/lookup counts bucketed per wall-clock minute; logs each finished minute."""
+
+    def __init__(self, name: str, minutes: int = 60):
+        self.name = name
+        self._buckets = deque(maxlen=minutes)
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool) -> None:
+        minute = int(time.time() // 60) * 60
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != minute:
+                if self._buckets:
+                    self._log(self._buckets[-1])
+                self._buckets.append([minute, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += int(hit)
+            bucket[2] += 1
+
+    def history(self) -> list:
+        with self._lock:
+            return [
+                {"minute": minute, "hits": hits, "lookups": lookups, "hit_rate": hits / lookups}
+                for minute, hits, lookups in self._buckets
+            ]
+
+    def _log(self, bucket) -> None:
+        minute, hits, lookups = bucket
+        logger.info(f"{self.name} hit rate {hits}/{lookups} ({hits / lookups:.0%}) "
+                    f"for minute {time.strftime('%H:%M', time.localtime(minute))}")
+
+
+def _copy_document(document: dict) -> dict:
+    copied = dict(document)
+    copied["messages"] = list(document.get("messages", []))
+    return copied
+
+
+def apply_history_writes(stored: dict, writes: list):
+    """
+    Apply a session's flush writes to its stored document.
+
+    A write is {"flush_id": str, "messages": [message dicts], "fields": {...}}.
+    Its messages are appended to the stored ones whatever version the writer
+    had cached, so flushes from several workers interleave instead of
+    overwriting each other; its fields (summary, usage) replace the stored
+    ones. A write whose flush_id was already applied (a retried flush or job)
+    is skipped.
+
+    Returns:
+        dict: The fields to store, with "version" bumped, or None when every
+              write was already applied.
+    """
+    applied = list(stored.get("flush_ids", []))
+    messages = list(stored.get("messages", []))
+    fields = {}
+    changed = False
+    for write in writes:
+        if write["flush_id"] in applied:
+            continue
+        messages.extend(write.get("messages", []))
+        fields.update(write.get("fields") or {})
+        applied.append(write["flush_id"])
+        changed = True
+    if not changed:
+        return None
+    fields["messages"] = messages
+    fields["version"] = stored.get("version", 0) + 1
+    fields["flush_ids"] = applied[-FLUSH_IDS_KEPT:]
+    return fields
+
+
+class FirestoreHistoryBackend:
+    """Session documents in a Firestore collection."""
+
+    def __init__(self, client, collection: str):
+        self.client = client
+        self.collection = collection
+
+    def _doc(self, session_id: str):
+        return self.client.collection(self.collection).document(session_id)
+
+    def load(self, session_id: str) -> dict:
+        snapshot = self._doc(session_id).get()
+        if not snapshot.exists:
+            return {"messages": []}
+        document = snapshot.to_dict() or {}
+        document.setdefault("messages", [])
+        return document
+
+    def version(self, session_id: str) -> int:
+        snapshot = self._doc(session_id).get(field_paths=["version"])
+        if not snapshot.exists:
+            return 0
+        return (snapshot.to_dict() or {}).get("version", 0)
+
+    def commit(self, writes: dict) -> dict:
+        """
+        Apply flush writes ({session_id: [write, ...]}) in transactions of up to 500 sessions.
+
+        Returns:
+            dict: Stored version of each session after the commit.
+        """
+        from google.cloud import firestore
+
+        versions = {}
+        items = list(writes.items())
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            apply = firestore.transactional(self._apply)
+            versions.update(apply(self.client.transaction(), items[start:start + MAX_BATCH_WRITES]))
+        return versions
+
+    def _apply(self, transaction, items: list) -> dict:
+        # Reads the current documents in the transaction, so a concurrent
+        # commit for the same session makes Firestore retry this one
+        refs = {session_id: self._doc(session_id) for session_id, _ in items}
+        stored = {
+            snapshot.id: snapshot.to_dict() or {}
+            for snapshot in self.client.get_all(list(refs.values()), transaction=transaction)
+            if snapshot.exists
+        }
+        versions = {}
+        for session_id, session_writes in items:
+            current = stored.get(session_id, {})
+            document = apply_history_writes(current, session_writes)
+            if document is None:
+                versions[session_id] = current.get("version", 0)
+                continue
+            transaction.set(refs[session_id], document, merge=True)
+            versions[session_id] = document["version"]
+        return versions
+
+    def delete(self, session_id: str) -> None:
+        self._doc(session_id).delete()
+
+
+class MemoryHistoryBackend:
+    """In-memory stand-in for Firestore, for tests and local runs."""
+
+    def __init__(self):
+        self.documents = {}
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> dict:
+        with self._lock:
+            document = dict(self.documents.get(session_id, {}))
+        document["messages"] = list(document.get("messages", []))
+        return document
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            return self.documents.get(session_id, {}).get("version", 0)
+
+    def commit(self, writes: dict) -> dict:
+        versions = {}
+        with self._lock:
+            self.commits += 1
+            for session_id, session_writes in writes.items():
+                stored = self.documents.setdefault(session_id, {})
+                document = apply_history_writes(stored, session_writes)
+                if document is not None:
+                    stored.update(document)
+                versions[session_id] = stored.get("version", 0)
+        return versions
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self.documents.pop(session_id, None)
+
+
+class QueuedHistoryBackend:
+    """
+    Backend whose commits become durable background jobs.
+
+    Reads and deletes go to the wrapped backend. Each flush write is enqueued
+    as a "history.commit" job (see agent_api.tasks) keyed by its flush id, so
+    re-enqueuing a failed flush doesn't add a second job, and every new flush
+    gets its own.
+
+    Args:
+        backend: Backend the jobs write to.
+        enqueue: agent_api.jobs.enqueue.
+        project: Firestore project, for the workers to build their backend.
+        collection: Firestore collection of the session documents.
+    """
+
+    def __init__(self, backend, enqueue, project: str, collection: str):
+        self.backend = backend
+        self.enqueue = enqueue
+        self.project = project
+        self.collection = collection
+
+    def load(self, session_id: str) -> dict:
+        return self.backend.load(session_id)
+
+    def version(self, session_id: str) -> int:
+        return self.backend.version(session_id)
+
+    def commit(self, writes: dict) -> None:
+        # Stored versions are only known once the jobs run
+        for session_id, session_writes in writes.items():
+            for write in session_writes:
+                self.enqueue(
+                    "history.commit",
+                    {
+                        "project": self.project,
+                        "collection": self.collection,
+                        "session_id": session_id,
+                        # Through orjson so the payload is plain JSON
+                        "write": orjson.loads(orjson.dumps(write, default=str)),
+                    },
+                    idempotency_key=f"history:{self.collection}:{session_id}:{write['flush_id']}",
+                )
+        return None
+
+    def delete(self, session_id: str) -> None:
+        self.backend.delete(session_id)
+
+
+class _CachedSession:
+    __slots__ = ("document", "version", "size", "loaded_at", "verified_at")
+
+    def __init__(self, document: dict, loaded_at: float):
+        self.document = document
+        self.version = document.get("version", 0)
+        self.size = len(orjson.dumps(document, default=str))
+        self.loaded_at = loaded_at
+        self.verified_at = loaded_at
+
+
+class HistoryStore:
+    """
+    Hot-session cache and write-behind buffer in front of a history backend.
+
+    Recently used session documents are kept in an LRU bounded by entry count,
+    serialized size and age, so a follow-up message for the same session
+    (sticky routing usually sends it to the same worker) is served from
+    memory. New messages are applied to the cached document immediately and
+    written to the backend by the background flusher. Sessions with unflushed
+    changes are never evicted.
+
+    A flush sends each dirty session's new messages (and its summary and
+    usage) as a write with a unique flush id; the backend appends them to the
+    stored messages, and a write that fails is retried with the same id. Every
+    commit bumps the document's "version". When a commit shows that another
+    worker also wrote to the session, the cached copy is reloaded once our
+    own changes are flushed. On a cache hit the store checks the stored
+    version (a single-field read when verify_versions is on, at most once per
+    verify_interval) and reloads the session if another worker has advanced
+    it. Sessions with unflushed changes of our own are served from the cache
+    as-is, and a reload never replaces a cached copy that gained local
+    changes or a newer version while it was loading.
+
+    Args:
+        backend: FirestoreHistoryBackend or MemoryHistoryBackend.
+        flush_interval: Seconds between background flushes.
+        max_sessions: Most sessions kept in the cache.
+        max_bytes: Most serialized bytes kept in the cache.
+        ttl: Seconds after which a cached session is reloaded.
+        verify_versions: Check the stored version on cache hits.
+        verify_interval: Seconds a verified session is served without checking again.
+    """
+
+    def __init__(self, backend, flush_interval: float = FLUSH_INTERVAL_SECONDS,
+                 max_sessions: int = CACHE_MAX_SESSIONS, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL_SECONDS, verify_versions: bool = CACHE_VERIFY_VERSIONS,
+                 verify_interval: float = CACHE_VERIFY_INTERVAL_SECONDS):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.verify_versions = verify_versions
+        self.verify_interval = verify_interval
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        # Messages added since the last flush write was formed
+        self._unflushed = {}
+        # Flush writes not confirmed by the backend yet, in order, per session
+        self._writes = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = None
+        self.reads = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.messages_written = 0
+        self.stale_reloads = 0
+        self.version_checks = 0
+        self.hit_rate = MinuteHitRate("history cache")
+
+    def read(self, session_id: str) -> dict:
+        """Stored document for a session, including unflushed changes."""
+        now = time.time()
+        with self._lock:
+            cached = self._sessions.get(session_id)
+            # While our own changes are unflushed the cached copy is authoritative
+            local_changes = self._has_local_changes(session_id)
+            if cached is not None and not local_changes and now - cached.loaded_at > self.ttl:
+                self._drop(session_id)
+                cached = None
+            verify = cached is not None and not local_changes and self.verify_versions \
+                and now - cached.verified_at >= self.verify_interval
+        if verify:
+            self.version_checks += 1
+            if self.backend.version(session_id) > cached.version:
+                self.stale_reloads += 1
+                cached = None
+            else:
+                cached.verified_at = now
+        if cached is not None:
+            with self._lock:
+                if session_id in self._sessions:
+                    self._sessions.move_to_end(session_id)
+                self.hit_rate.record(True)
+                return _copy_document(cached.document)
+
+        self.hit_rate.record(False)
+        self.reads += 1
+        document = self.backend.load(session_id)
+        with self._lock:
+            current = self._sessions.get(session_id)
+            if current is not None and (
+                self._has_local_changes(session_id) or current.version >= document.get("version", 0)
+            ):
+                # Appended to or reloaded by another thread while we were loading
+                return _copy_document(current.document)
+            self._put(session_id, document)
+            return _copy_document(document)
+
+    def append(self, session_id: str, base: dict, new: list) -> None:
+        """
+        Add new message dicts to a session (cached immediately, persisted shortly after).
+
+        Args:
+            session_id: Session the messages belong to.
+            base: The stored document the caller read this turn.
+            new: Message dicts to add after its messages.
+        """
+        with self._lock:
+            cached = self._cached(session_id, base)
+            cached.document["messages"].extend(new)
+            added = len(orjson.dumps(new, default=str))
+            cached.size += added
+            self._bytes += added
+            self._unflushed.setdefault(session_id, []).extend(new)
+            self._dirty.add(session_id)
+            self.messages_written += len(new)
+            self._evict()
+        self._schedule_flush()
+
+    def set_summary(self, session_id: str, base: dict, summary: dict) -> None:
+        """Store a new running summary for a session."""
+        with self._lock:
+            self._cached(session_id, base).document["summary"] = summary
+            self._dirty.add(session_id)
+        self._schedule_flush()
+
+    def set_usage(self, session_id: str, base: dict, usage: dict) -> None:
+        """Store a session's cumulative token usage."""
+        with self._lock:
+            self._cached(session_id, base).document["usage"] = usage
+            self._dirty.add(session_id)
+        self._schedule_flush()
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+            self._unflushed.pop(session_id, None)
+            self._writes.pop(session_id, None)
+            self._dirty.discard(session_id)
+        self.backend.delete(session_id)
+
+    def flush(self) -> int:
+        """Commit every dirty session in one batched write; returns sessions written."""
+        with self._lock:
+            for session_id in self._dirty:
+                document = self._sessions[session_id].document
+                self._writes.setdefault(session_id, []).append({
+                    "flush_id": uuid.uuid4().hex,
+                    "messages": self._unflushed.pop(session_id, []),
+                    "fields": {key: document[key] for key in ("summary", "usage") if key in document},
+                })
+            self._dirty.clear()
+            if not self._writes:
+                return 0
+            # Writes that failed before are sent again, with their flush ids
+            pending = {session_id: list(writes) for session_id, writes in self._writes.items()}
+            base_versions = {session_id: self._sessions[session_id].version for session_id in pending}
+        try:
+            with span("history.write", sessions=len(pending)):
+                versions = self.backend.commit(pending)
+        except Exception as e:
+            self.flush_failures += 1
+            logger.error(f"History flush failed for {len(pending)} sessions: {str(e)}")
+            return 0
+        with self._lock:
+            for session_id, sent in pending.items():
+                remaining = self._writes.get(session_id, [])[len(sent):]
+                if remaining:
+                    self._writes[session_id] = remaining
+                else:
+                    self._writes.pop(session_id, None)
+                cached = self._sessions.get(session_id)
+                version = versions.get(session_id) if versions else None
+                if cached is None or version is None:
+                    continue
+                if version != base_versions[session_id] + len(sent):
+                    # Another worker wrote to the session too and our copy lacks
+                    # its messages: reload on the first read without local changes
+                    cached.loaded_at = 0.0
+                cached.version = version
+                cached.document["version"] = version
+            self._evict()
+        self.flushes += 1
+        return len(pending)
+
+    def close(self) -> None:
+        """Stop the background flusher and write out anything still pending."""
+        self._closed = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._dirty | set(self._writes))
+            cached = len(self._sessions)
+            cached_bytes = self._bytes
+        return {
+            "reads": self.reads,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "messages_written": self.messages_written,
+            "pending_sessions": pending,
+            "cached_sessions": cached,
+            "cached_bytes": cached_bytes,
+            "stale_reloads": self.stale_reloads,
+            "version_checks": self.version_checks,
+            "hit_rate_per_minute": self.hit_rate.history(),
+        }
+
+    def _cached(self, session_id: str, base: dict) -> _CachedSession:
+        # Caller must hold self._lock
+        cached = self._sessions.get(session_id)
+        if cached is None:
+            cached = self._put(session_id, _copy_document(base))
+        return cached
+
+    def _put(self, session_id: str, document: dict) -> _CachedSession:
+        # Caller must hold self._lock
+        self._drop(session_id)
+        cached = self._sessions[session_id] = _CachedSession(document, time.time())
+        self._bytes += cached.size
+        self._evict()
+        return cached
+
+    def _drop(self, session_id: str) -> None:
+        # Caller must hold self._lock
+        cached = self._sessions.pop(session_id, None)
+        if cached is not None:
+            self._bytes -= cached.size
+
+    def _evict(self) -> None:
+        # Caller must hold self._lock; sessions with unflushed changes stay
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and self._bytes <= self.max_bytes:
+                break
+            if not self._has_local_changes(session_id):
+                self._drop(session_id)
+
+    def _has_local_changes(self, session_id: str) -> bool:
+        # Caller must hold self._lock
+        return session_id in self._dirty or session_id in self._unflushed or session_id in self._writes
+
+    def _schedule_flush(self) -> None:
+        self._ensure_flusher()
+        self._wakeup.set()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="history-flusher", daemon=True)
+                self._flusher.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closed:
+                break
+            # Let the rest of the turn (and other turns) add to the same batch
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+class BufferedChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat history for one session backed by a HistoryStore.
+
+    Messages are read from the store once, on first access; added messages are
+    buffered in the store and written in the background.
+
+    When a memory manager is given, `messages` (what the prompt's {history}
+    placeholder receives) is its compacted view: recent turns verbatim plus a
+    running summary of older ones, which is stored with the session. The full
+    message list is still what gets persisted. During an accounted agent turn
+    the view is compacted further when the turn's token budget requires it.
+    """
+
+    def __init__(self, store: HistoryStore, session_id: str, memory=None):
+        self.store = store
+        self.session_id = session_id
+        self.memory = memory
+        self._stored = None
+        self._messages = None
+
+    def _load(self) -> None:
+        if self._stored is None:
+            with span("history.load", session_id=self.session_id) as current:
+                self._stored = self.store.read(self.session_id)
+                self._messages = decode_message_dicts(self._stored["messages"])
+                current.set_attribute("messages", len(self._messages))
+
+    @property
+    def messages(self) -> list:
+        self._load()
+        usage = current_turn_usage()
+        if usage is not None:
+            usage.load_session(self._stored.get("usage"))
+        if self.memory is None:
+            view = list(self._messages)
+        else:
+            budget = usage.history_budget(self.memory.token_budget) if usage is not None else None
+            view, summary = self.memory.compact(self._messages, self._stored.get("summary"), token_budget=budget)
+            if summary != self._stored.get("summary"):
+                self.store.set_summary(self.session_id, self._stored, summary)
+                self._stored["summary"] = summary
+        if usage is not None:
+            usage.record_history(view)
+        return view
+
+    def add_usage(self, usage) -> dict:
+        """
+        Add a finished turn's tokens to the session's cumulative usage.
+
+        Args:
+            usage: The turn's TurnUsage.
+
+        Returns:
+            dict: The session's usage including the turn.
+        """
+        self._load()
+        totals = usage.session_totals(self._stored.get("usage"))
+        self.store.set_usage(self.session_id, self._stored, totals)
+        self._stored["usage"] = totals
+        return totals
+
+    @property
+    def all_messages(self) -> list:
+        """Every stored message, regardless of the memory manager."""
+        self._load()
+        return list(self._messages)
+
+    def add_message(self, message) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages) -> None:
+        self._load()
+        new = [message_to_dict(message) for message in messages]
+        self.store.append(self.session_id, self._stored, new)
+        self._stored["messages"] = self._stored["messages"] + new
+        self._messages.extend(messages)
+
+    def clear(self) -> None:
+        self.store.clear(self.session_id)
+        self._stored = {"messages": []}
+        self._messages = []
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def build_history_backend(project: str, collection: str):
+    """Firestore backend for a collection, or MemoryHistoryBackend when HISTORY_BACKEND=memory."""
+    if os.getenv("HISTORY_BACKEND", "firestore") == "memory":
+        return MemoryHistoryBackend()
+    return FirestoreHistoryBackend(get_firestore_client(project), collection)
+
+
+def commit_history_document(project: str, collection: str, session_id: str, write: dict) -> bool:
+    """
+    Apply one queued flush write to its backend (the "history.commit" job).
+
+    The write's messages are appended to the stored ones (see
+    apply_history_writes); a write that was already applied (a retried job)
+    is skipped.
+
+    Returns:
+        bool: Whether the write was applied.
+    """
+    store = current_history_store()
+    if store is not None and isinstance(store.backend, QueuedHistoryBackend):
+        # Worker thread inside the API process: write to the store's own backend
+        backend = store.backend.backend
+    else:
+        backend = build_history_backend(project, collection)
+    before = backend.version(session_id)
+    with span("history.write", sessions=1):
+        versions = backend.commit({session_id: [write]})
+    return versions[session_id] != before
+
+
+def get_history_store(project: str, collection: str) -> HistoryStore:
+    """
+    Process-wide HistoryStore.
+
+    Uses Firestore unless HISTORY_BACKEND=memory; pending writes are flushed
+    at interpreter exit, through the job queue when HISTORY_WRITE_QUEUE=true.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = build_history_backend(project, collection)
+                if WRITE_QUEUE_ENABLED:
+                    from agent_api.jobs import WORKER_THREADS, enqueue
+
+                    if WORKER_THREADS <= 0:
+                        logger.warning("HISTORY_WRITE_QUEUE is on with JOB_WORKER_THREADS=0: chat history "
+                                       "is only written while `python manage.py run_jobs` is running")
+                    backend = QueuedHistoryBackend(backend, enqueue, project, collection)
+                _store = HistoryStore(backend)
+                atexit.register(_store.close)
+    return _store
+
+
+def current_history_store():
+    """The process-wide store if it has been created, else None."""
+    return _store
+
+
+def set_history_store(store: HistoryStore) -> None:
+    """Replace the process-wide store, e.g. with one using MemoryHistoryBackend."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -1,62 +1,161 @@
-import vertexai
-from vertexai import agent_engines
-from langchain_google_vertexai import HarmBlockThreshold, HarmCategory
+import asyncio
+import contextvars
+import functools
 import os
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from dotenv import load_dotenv
-from google.auth.transport.requests import Request
-from google.oauth2 import id_token
-from langchain_google_firestore import FirestoreChatMessageHistory
-from google.cloud import firestore
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+from auth_tokens import get_token_provider
+from tool_transport import get_tool_transport
+from tool_cache import get_tool_cache
+from menu_index import MenuEngine, file_catalog_loader
+from telemetry import llm_callback_handler, registry, span, traced_tool
+from single_flight import coalesced, tool_flights
+from backend_guard import backend_guard_stats, get_backend_guard
+from token_accounting import estimate_text_tokens, fit_tool_messages, turn_accounting, usage_callback_handler
+from tool_projection import projected
+from prefetch import PREFETCH_ENABLED, claim_prefetched, phone_key, prefetcher
+from model_tiering import MODEL_TIERING_ENABLED, ModelTiering
+
+# vertexai, langchain and the Firestore client are imported lazily (see
+# get_agent), so importing this module stays cheap for workers, tests and tools.
 
 load_dotenv()
 
 model = "gemini-2.0-flash"
 
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_UNSPECIFIED: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_ONLY_HIGH,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-}
-
-model_kwargs = {
-    # temperature (float): The sampling temperature controls the degree of
-    # randomness in token selection.
-    "temperature": 0.28,
-    # max_output_tokens (int): The token limit determines the maximum amount of
-    # text output from one prompt.
-    "max_output_tokens": 1000,
-    # top_p (float): Tokens are selected from most probable to least until
-    # the sum of their probabilities equals the top-p value.
-    "top_p": 0.95,
-    # top_k (int): The next token is selected from among the top-k most
-    # probable tokens. This is not supported by all model versions. See
-    # https://cloud.google.com/vertex-ai/generative-ai/docs/multimodal/image-understanding#valid_parameter_values
-    # for details.
-    "top_k": None,
-    # safety_settings (Dict[HarmCategory, HarmBlockThreshold]): The safety
-    # settings to use for generating content.
-    # (you must create your safety settings using the previous step first).
-    "safety_settings": safety_settings,
-}
-
-vertexai.init(
-    project="project-gcp-tst",
-    location="us-central1",
-    staging_bucket="gs://logs-middleware-chatwoot-tst",
-)
+def build_safety_settings():
+    """Safety thresholds for the model, keyed by harm category."""
+    from langchain_google_vertexai import HarmBlockThreshold, HarmCategory
+
+    return {
+        HarmCategory.HARM_CATEGORY_UNSPECIFIED: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_ONLY_HIGH,
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    }
+
+def build_model_kwargs():
+    """Generation parameters passed to the model."""
+    return {
+        # temperature (float): The sampling temperature controls the degree of
+        # randomness in token selection.
+        "temperature": 0.28,
+        # max_output_tokens (int): The token limit determines the maximum amount of
+        # text output from one prompt.
+        "max_output_tokens": 1000,
+        # top_p (float): Tokens are selected from most probable to least until
+        # the sum of their probabilities equals the top-p value.
+        "top_p": 0.95,
+        # top_k (int): The next token is selected from among the top-k most
+        # probable tokens. This is not supported by all model versions. See
+        # https://cloud.google.com/vertex-ai/generative-ai/docs/multimodal/image-understanding#valid_parameter_values
+        # for details.
+        "top_k": None,
+        # safety_settings (Dict[HarmCategory, HarmBlockThreshold]): The safety
+        # settings to use for generating content.
+        "safety_settings": build_safety_settings(),
+    }
+
+# Cloud Run services backing each tool (the service URL is also the token audience).
+# Each can be overridden through the environment, e.g. to point at a local stub.
+CONSULTA_CLIENTES_URL = os.getenv("CONSULTA_CLIENTES_URL", "https://fn-consultaclientes-547721852192.us-central1.run.app")
+IMAGENES_MENU_URL = os.getenv("IMAGENES_MENU_URL", "https://fn-imagenesmenu-547721852192.us-central1.run.app")
+CONSULTA_ATRIBUTOS_URL = os.getenv("CONSULTA_ATRIBUTOS_URL", "https://fn-consultaatributos-547721852192.us-central1.run.app")
+CONSULTA_PRODUCTOS_MENU_URL = os.getenv("CONSULTA_PRODUCTOS_MENU_URL", "https://fn-consultaproductosmenu-547721852192.us-central1.run.app")
 
 # Get authenticated Google Cloud identity token
-def get_auth_token():
-    """Get an authentication token for Google Cloud Run functions."""
-    auth_req = Request()
-    return id_token.fetch_id_token(auth_req, "https://fn-consultaproductosmenu-547721852192.us-central1.run.app")
+def get_auth_token(audience: str = CONSULTA_PRODUCTOS_MENU_URL):
+    """
+    Get an authentication token for a Google Cloud Run function.
+
+    Tokens are cached per audience and refreshed in the background before they
+    expire, so most calls return without a network round trip.
+
+    Args:
+        audience: URL of the Cloud Run service the token is for.
+    """
+    with span("auth.token", audience=audience):
+        return get_token_provider().get_token(audience)
+
+# Call a tool backend over the shared, pooled transport
+def call_tool_backend(service_url: str, payload: dict = None, path: str = "") -> dict:
+    """
+    POST a payload to a Cloud Run tool backend and return its JSON response.
+
+    Calls go through the backend's circuit breaker and adaptive concurrency
+    limit; when either rejects the call, BackendUnavailableError is raised
+    without contacting the backend and its message tells the model not to
+    retry the tool.
+
+    Args:
+        service_url: Base URL of the Cloud Run service (also the token audience).
+        payload: JSON body, or None to send an empty body.
+        path: Optional path appended to the service URL.
+
+    Returns:
+        dict: Parsed JSON response from the backend (decoded with orjson).
+    """
+    headers = {
+        "Authorization": f"Bearer {get_auth_token(service_url)}",
+        "Content-Type": "application/json"
+    }
+    response = get_backend_guard(service_url).call(
+        lambda: get_tool_transport().post(f"{service_url}{path}", headers=headers, json=payload),
+        is_failure=lambda r: r.status_code >= 500 or r.status_code == 429,
+    )
+    return orjson.loads(response.content)
+
+# Optional in-process menu index: when enabled, consulta_productos_menu (and
+# consulta_atributos, for categories in the catalog) is answered locally from a
+# catalog loaded from MENU_CATALOG_PATH (a JSON file) or MENU_CATALOG_URL (a
+# Cloud Run function returning the full catalog).
+MENU_CATALOG_PATH = os.getenv("MENU_CATALOG_PATH")
+MENU_CATALOG_URL = os.getenv("MENU_CATALOG_URL")
+LOCAL_MENU_INDEX = (os.getenv("LOCAL_MENU_INDEX", "false").lower() == "true"
+                    and bool(MENU_CATALOG_PATH or MENU_CATALOG_URL))
+
+_menu_engine = None
+_menu_engine_lock = threading.Lock()
+
+def get_menu_engine():
+    """
+    Return this process's MenuEngine, starting it on first use; None when LOCAL_MENU_INDEX is off.
+
+    The engine refreshes from a timer thread, and threads started in the
+    gunicorn master (GUNICORN_PRELOAD) don't exist in the forked workers, so
+    each process starts its own engine after the fork.
+    """
+    global _menu_engine
+    if not LOCAL_MENU_INDEX:
+        return None
+    if _menu_engine is None:
+        with _menu_engine_lock:
+            if _menu_engine is None:
+                engine = MenuEngine(
+                    file_catalog_loader(MENU_CATALOG_PATH) if MENU_CATALOG_PATH
+                    else lambda: call_tool_backend(MENU_CATALOG_URL),
+                    refresh_interval=float(os.getenv("MENU_REFRESH_SECONDS", "900")),
+                )
+                engine.start()
+                _menu_engine = engine
+    return _menu_engine
+
+def _reset_menu_engine():
+    # A forked child inherits the parent's engine without its refresh thread
+    global _menu_engine, _menu_engine_lock
+    _menu_engine = None
+    _menu_engine_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_menu_engine)
 
 # Tool 1: Query customer information
+@traced_tool
+@coalesced
+@projected
 def consulta_clientes(nombre_cliente: str, telefono_cliente: str) -> dict:
     """
     Busca información de clientes basado en el nombre y teléfono.
@@ -70,22 +169,21 @@ def consulta_clientes(nombre_cliente: str, telefono_cliente: str) -> dict:
               También incluye un campo 'isExistent' que indica si el cliente existe.
     """
     try:
-        token = get_auth_token()
-        url = "https://fn-consultaclientes-547721852192.us-central1.run.app"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        prefetched = claim_prefetched("consulta_clientes", phone_key(telefono_cliente))
+        if prefetched is not None:
+            return prefetched
         payload = {
             "nombreCliente": nombre_cliente,
             "telefonoCliente": telefono_cliente
         }
-        response = requests.post(url, headers=headers, json=payload)
-        return response.json()
+        return call_tool_backend(CONSULTA_CLIENTES_URL, payload)
     except Exception as e:
         return {"error": str(e), "isExistent": False}
 
 # Tool 2: Get menu images
+@traced_tool
+@coalesced
+@projected
 def imagenes_menu() -> dict:
     """
     Obtiene las imágenes disponibles del menú.
@@ -94,18 +192,21 @@ def imagenes_menu() -> dict:
         dict: Información sobre las imágenes disponibles del menú.
     """
     try:
-        token = get_auth_token()
-        url = "https://fn-imagenesmenu-547721852192.us-central1.run.app"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        response = requests.post(url, headers=headers)
-        return response.json()
+        prefetched = claim_prefetched("imagenes_menu")
+        if prefetched is not None:
+            return prefetched
+        return load_imagenes_menu()
     except Exception as e:
         return {"error": str(e)}
 
+def load_imagenes_menu():
+    """Menu images from the tool cache, fetched from the backend on a miss."""
+    return get_tool_cache().get_or_load("imagenes_menu", {}, lambda: call_tool_backend(IMAGENES_MENU_URL))
+
 # Tool 3: Query product attributes
+@traced_tool
+@coalesced
+@projected
 def consulta_atributos(category_name: str) -> dict:
     """
     Consulta los atributos disponibles para una categoría de producto.
@@ -117,23 +218,27 @@ def consulta_atributos(category_name: str) -> dict:
         dict: Atributos y valores aceptables para esa categoría de producto.
     """
     try:
-        token = get_auth_token()
-        url = "https://fn-consultaatributos-547721852192.us-central1.run.app/searchCategory"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        menu_engine = get_menu_engine()
+        if menu_engine is not None and menu_engine.ready:
+            attributes = menu_engine.attributes_for(category_name)
+            if attributes is not None:
+                return attributes
         payload = {
             "categoryName": category_name,
             "sheetNames": ["AtributosMenu"],
             "tabSheet": "CATEGORIA"
         }
-        response = requests.post(url, headers=headers, json=payload)
-        return response.json()
+        return get_tool_cache().get_or_load(
+            "consulta_atributos", {"category_name": category_name},
+            lambda: call_tool_backend(CONSULTA_ATRIBUTOS_URL, payload, path="/searchCategory")
+        )
     except Exception as e:
         return {"error": str(e)}
 
 # Tool 4: Query menu products
+@traced_tool
+@coalesced
+@projected
 def consulta_productos_menu(
     product_name: str, 
     search_mode: str = "products", 
@@ -155,82 +260,548 @@ def consulta_productos_menu(
         dict: Lista de productos que coinciden con la búsqueda.
     """
     try:
-        token = get_auth_token()
-        url = "https://fn-consultaproductosmenu-547721852192.us-central1.run.app"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+        menu_engine = get_menu_engine()
+        if menu_engine is not None and menu_engine.ready:
+            return menu_engine.search(product_name, search_mode, max_results, single_result)
         payload = {
             "productName": product_name,
             "searchMode": search_mode,
             "maxResults": max_results,
             "singleResult": single_result
         }
-        response = requests.post(url, headers=headers, json=payload)
-        return response.json()
+        args = {
+            "product_name": product_name,
+            "search_mode": search_mode,
+            "max_results": max_results,
+            "single_result": single_result
+        }
+        return get_tool_cache().get_or_load(
+            "consulta_productos_menu", args,
+            lambda: call_tool_backend(CONSULTA_PRODUCTOS_MENU_URL, payload)
+        )
     except Exception as e:
         return {"error": str(e)}
 
+# Keeps the {history} block bounded: recent turns verbatim, older ones summarized
+_memory_manager = None
+
+def get_memory_manager():
+    """Process-wide MemoryManager, or None when HISTORY_MEMORY_ENABLED is false."""
+    global _memory_manager
+    if _memory_manager is None and os.getenv("HISTORY_MEMORY_ENABLED", "true").lower() == "true":
+        from conversation_memory import MemoryManager
+
+        _memory_manager = MemoryManager()
+    return _memory_manager
+
+# Opt-in cache of final answers (ANSWER_CACHE_ENABLED); NumPy is only imported when enabled
+def get_answer_cache():
+    """Process-wide AnswerCache, or None when ANSWER_CACHE_ENABLED is not set."""
+    if os.getenv("ANSWER_CACHE_ENABLED", "false").lower() != "true":
+        return None
+    from answer_cache import get_answer_cache as _get_answer_cache
+
+    return _get_answer_cache()
+
 # Chat history integration with Firestore
 def get_session_history(session_id: str):
     """
     Get chat message history from Firestore for a specific session.
     
+    The Firestore client is shared by the whole process. History is read once
+    per turn and new messages are committed in a batched write after the
+    response has been produced. The messages handed to the prompt are
+    compacted by the memory manager.
+    
     Args:
         session_id: Unique identifier for the chat session
         
     Returns:
-        FirestoreChatMessageHistory: Chat history manager for the session
-    """
-    client = firestore.Client(project="project-gcp-tst")
-    return FirestoreChatMessageHistory(
-        client=client,
-        session_id=session_id,
-        collection="restaurant-chat-history",
-        encode_message=False,
-    )
+        BufferedChatMessageHistory: Chat history manager for the session
+    """
+    from history_store import BufferedChatMessageHistory, get_history_store
+
+    store = get_history_store(project="project-gcp-tst", collection="restaurant-chat-history")
+    return BufferedChatMessageHistory(store, session_id, memory=get_memory_manager())
+
+SYSTEM_INSTRUCTION = "Eres un asistente de restaurante que ayuda a los clientes a pedir comida, consultar el menú y obtener información sobre productos. Usa las herramientas disponibles para obtener información precisa."
+
+def build_scratchpad(x):
+    """Tool calls and results of the turn so far, trimmed to fit the turn's token budget, if any."""
+    from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+    from conversation_memory import estimate_tokens
+
+    # Compact orjson text instead of json.dumps' spaced output: fewer prompt tokens
+    steps = [
+        (action, observation if isinstance(observation, str) else orjson.dumps(observation, default=str).decode())
+        for action, observation in x["intermediate_steps"]
+    ]
+    reserved = estimate_text_tokens(SYSTEM_INSTRUCTION) + estimate_text_tokens(x["input"]) + estimate_tokens(x["history"])
+    return fit_tool_messages(format_to_tool_messages(steps), reserved)
 
 # Custom prompt template for the agent
-custom_prompt_template = {
-    "user_input": lambda x: x["input"],
-    "history": lambda x: x["history"],
-    "agent_scratchpad": lambda x: format_to_tool_messages(x["intermediate_steps"]),
-} | ChatPromptTemplate.from_messages([
-    ("system", "Eres un asistente de restaurante que ayuda a los clientes a pedir comida, consultar el menú y obtener información sobre productos. Usa las herramientas disponibles para obtener información precisa."),
-    ("placeholder", "{history}"),
-    ("user", "{user_input}"),
-    ("placeholder", "{agent_scratchpad}"),
-])
+def build_prompt_template():
+    """Prompt with the system instruction, session history and tool scratchpad."""
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return {
+        "user_input": lambda x: x["input"],
+        "history": lambda x: x["history"],
+        "agent_scratchpad": build_scratchpad,
+    } | ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_INSTRUCTION),
+        ("placeholder", "{history}"),
+        ("user", "{user_input}"),
+        ("placeholder", "{agent_scratchpad}"),
+    ])
+
+# Optional replacement for the Gemini model, as "module:callable" (e.g. the
+# scripted model of the benchmark harness); called like LangchainAgent's model_builder.
+AGENT_MODEL_BUILDER = os.getenv("AGENT_MODEL_BUILDER")
+
+def load_model_builder(spec: str = AGENT_MODEL_BUILDER):
+    """Resolve a "module:callable" model builder, or None to use Gemini."""
+    if not spec:
+        return None
+    import importlib
+
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+def build_tier_model(model_name, *, model_kwargs=None):
+    """Chat model of a model tier: built by AGENT_MODEL_BUILDER when set, else Gemini."""
+    builder = load_model_builder()
+    if builder is not None:
+        return builder(model_name, model_kwargs=model_kwargs)
+    from langchain_google_vertexai import ChatVertexAI
+
+    return ChatVertexAI(model_name=model_name, **(model_kwargs or {}))
+
+# Fast model for routine steps, the agent's model for complex ones (MODEL_TIERING=true)
+_model_tiering = None
+
+def get_model_tiering():
+    """Process-wide ModelTiering, or None when MODEL_TIERING is off."""
+    global _model_tiering
+    if _model_tiering is None and MODEL_TIERING_ENABLED:
+        _model_tiering = ModelTiering(model_builder=build_tier_model, model_kwargs=build_model_kwargs())
+    return _model_tiering
+
+def build_runnable_builder():
+    """runnable_builder for the agent, routing model calls through the model tiers when enabled."""
+    from tool_executor import build_agent_runnable
+
+    tiering = get_model_tiering()
+    if tiering is None:
+        return build_agent_runnable
+    return functools.partial(build_agent_runnable, tiering=tiering)
 
 # Initialize the agent with chat history and custom prompt
-agent = agent_engines.LangchainAgent(
-    model=model,
-    tools=[
-        consulta_clientes,
-        imagenes_menu,
-        consulta_atributos,
-        consulta_productos_menu
-    ],
-    model_kwargs=model_kwargs,
-    chat_history=get_session_history,
-    prompt=custom_prompt_template,
-)
+def build_agent():
+    """Initialize Vertex AI and construct the LangchainAgent."""
+    import vertexai
+    from vertexai import agent_engines
+    from tool_executor import MAX_PARALLEL_TOOLS, TOOL_TIMEOUT_SECONDS
+
+    vertexai.init(
+        project="project-gcp-tst",
+        location="us-central1",
+        staging_bucket="gs://logs-middleware-chatwoot-tst",
+    )
+    return agent_engines.LangchainAgent(
+        model=model,
+        model_builder=load_model_builder(),
+        tools=[
+            consulta_clientes,
+            imagenes_menu,
+            consulta_atributos,
+            consulta_productos_menu
+        ],
+        model_kwargs=build_model_kwargs(),
+        chat_history=get_session_history,
+        prompt=build_prompt_template(),
+        # Run the tool calls of a single model step concurrently
+        runnable_builder=build_runnable_builder(),
+        agent_executor_kwargs={
+            "max_parallel_tools": MAX_PARALLEL_TOOLS,
+            "tool_timeout": TOOL_TIMEOUT_SECONDS,
+        },
+    )
+
+_agent = None
+_agent_lock = threading.Lock()
+
+def get_agent():
+    """
+    Return the process-wide agent, building it on first use.
+
+    Building pulls in vertexai and langchain, so it is deferred until the
+    first request (or warm_up) instead of happening at import time.
+    """
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = build_agent()
+    return _agent
+
+def warm_up():
+    """
+    Build and set up the agent, start the menu index and fetch tool tokens ahead of the first request.
+
+    Returns:
+        dict: Milliseconds spent on each step, plus any token prefetch error.
+    """
+    timings = {}
+    started = time.perf_counter()
+    get_agent()
+    timings["agent_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    started = time.perf_counter()
+    get_agent_runnable()
+    timings["agent_setup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    # Starts the catalog load in the background; the index is used once ready
+    get_menu_engine()
+    started = time.perf_counter()
+    try:
+        prefetch_tool_tokens()
+    except Exception as e:
+        timings["token_prefetch_error"] = str(e)
+    timings["token_prefetch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+def prefetch_tool_tokens():
+    """Fetch (or reuse) the ID tokens of every tool backend ahead of the tool calls."""
+    get_token_provider().prefetch(
+        CONSULTA_CLIENTES_URL, IMAGENES_MENU_URL, CONSULTA_ATRIBUTOS_URL, CONSULTA_PRODUCTOS_MENU_URL
+    )
+
+# Speculative prefetch while the model makes the first call of a conversation
+def prefetch_first_interaction(session_id, customer_phone=None, customer_name=None):
+    """
+    Start background fetches of what a conversation's first turn usually needs.
+
+    Fetches the tool ID tokens and the menu images, plus the customer lookup
+    when the request carries the customer's phone. The tools claim the results
+    when the model asks for them (see prefetch.py).
+
+    Args:
+        session_id: The new conversation's session.
+        customer_phone: Phone number from the request metadata, if any.
+        customer_name: Customer name from the request metadata, if any.
+    """
+    if not PREFETCH_ENABLED:
+        return
+    prefetcher.run(prefetch_tool_tokens)
+    prefetcher.submit(session_id, "imagenes_menu", "", load_imagenes_menu)
+    if phone_key(customer_phone):
+        payload = {"nombreCliente": customer_name or "", "telefonoCliente": customer_phone}
+        prefetcher.submit(
+            session_id, "consulta_clientes", phone_key(customer_phone), call_tool_backend, CONSULTA_CLIENTES_URL, payload
+        )
+
+def __getattr__(name):
+    # Keep `from index import agent` (and friends) working without eager construction
+    if name == "agent":
+        return get_agent()
+    if name == "model_kwargs":
+        return build_model_kwargs()
+    if name == "safety_settings":
+        return build_safety_settings()
+    if name == "custom_prompt_template":
+        return build_prompt_template()
+    if name == "memory_manager":
+        return get_memory_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Opt-in answers for repeated FAQ-style questions, served without the model
+def _cached_answer(user_input, session_id, question):
+    """
+    Answer from the answer cache, as an agent response, or None on a miss.
+
+    The turn is still appended to the session's history so later turns see it.
+    """
+    cache = get_answer_cache() if question else None
+    hit = cache.lookup(question) if cache is not None else None
+    if hit is None:
+        return None
+    answer, saved_seconds, similarity = hit
+    _append_turn(session_id, user_input, answer)
+    return {
+        "input": user_input,
+        "output": answer,
+        "answer_cache": {"hit": True, "similarity": round(similarity, 3), "saved_ms": round(saved_seconds * 1000, 1)},
+    }
+
+def _append_turn(session_id, user_input, answer):
+    """Record a turn answered without the agent in the session's history, so later turns see it."""
+    if session_id:
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        get_session_history(session_id).add_messages([HumanMessage(content=user_input), AIMessage(content=answer)])
+
+# Deterministic routing of simple menu lookups (INTENT_ROUTER=shadow|on)
+_intent_router = None
+_intent_router_lock = threading.Lock()
+
+def get_intent_router():
+    """Process-wide IntentRouter over the agent's tools, or None when INTENT_ROUTER is off."""
+    global _intent_router
+    if _intent_router is None and os.getenv("INTENT_ROUTER", "off").lower() in ("on", "shadow"):
+        with _intent_router_lock:
+            if _intent_router is None:
+                from intent_router import IntentRouter
+
+                _intent_router = IntentRouter(tools={
+                    "consulta_productos_menu": consulta_productos_menu,
+                    "consulta_atributos": consulta_atributos,
+                    "imagenes_menu": imagenes_menu,
+                })
+    return _intent_router
+
+def _routed_answer(user_input, session_id, question):
+    """Templated answer for a high-confidence lookup, as an agent response, or None to use the agent."""
+    router = get_intent_router() if question else None
+    route = router.route(question) if router is not None else None
+    if route is None:
+        return None
+    _append_turn(session_id, user_input, route.answer)
+    return {"input": user_input, "output": route.answer, "intent_route": route.metadata()}
+
+def _observe_agent_turn(started):
+    if _intent_router is not None:
+        _intent_router.observe_agent_turn(time.perf_counter() - started)
+
+def _answer_cache_recorder(session_id, question):
+    """Tool recorder for a turn whose answer may be cached, or None when it can't be."""
+    if not question or get_answer_cache() is None:
+        return None
+    # Only answers given at the start of a session are free of earlier context
+    if session_id and get_session_history(session_id).all_messages:
+        return None
+    from answer_cache import tool_recorder
+
+    return tool_recorder()
+
+def _store_answer(question, response, recorder, started):
+    if recorder is None or not isinstance(response, dict):
+        return
+    get_answer_cache().store(question, response.get("output"), recorder.tools, time.perf_counter() - started)
+
+# Token usage of the turn, added to the session's totals and to the response
+def _record_turn_usage(session_id, response, usage):
+    usage.finish()
+    session = get_session_history(session_id).add_usage(usage) if session_id else None
+    if isinstance(response, dict):
+        response["token_usage"] = usage.to_dict(session)
 
 # Helper function for making queries with session ID
-def query_agent(user_input, session_id=None):
+def query_agent(user_input, session_id=None, question=None):
     """
     Query the agent with user input and optional session ID for conversation memory.
     
     Args:
         user_input: The user's message or question
         session_id: Optional session identifier for maintaining conversation context
+        question: The user's raw message; when given, repeated FAQ-style
+                  questions can be answered from the answer cache
+                  (ANSWER_CACHE_ENABLED) and simple menu lookups by the
+                  intent router (INTENT_ROUTER=on) without calling the model
         
     Returns:
-        The agent's response
+        The agent's response, with the turn's token usage under "token_usage"
     """
+    cached = _shortcut_answer(user_input, session_id, question)
+    if cached is not None:
+        return cached
     config = {}
     if session_id:
         config = {"configurable": {"session_id": session_id}}
-    
-    return agent.query(input=user_input, config=config)
\ No newline at end of file
+    with turn_accounting(session_id) as usage:
+        # Records a span (with token counts) for every LLM call of the turn
+        config["callbacks"] = [llm_callback_handler(), usage_callback_handler(usage)]
+        recorder = _answer_cache_recorder(session_id, question)
+        if recorder is not None:
+            config["callbacks"].append(recorder)
+
+        started = time.perf_counter()
+        response = get_agent().query(input=user_input, config=config)
+    _finish_turn(session_id, question, response, recorder, usage, started)
+    return response
+
+def _shortcut_answer(user_input, session_id, question):
+    """Answer from the answer cache or the intent router, or None when the agent is needed."""
+    return _cached_answer(user_input, session_id, question) or _routed_answer(user_input, session_id, question)
+
+def _finish_turn(session_id, question, response, recorder, usage, started):
+    """Bookkeeping after an agent turn: latency baseline, answer cache and token usage (reads history)."""
+    _observe_agent_turn(started)
+    _store_answer(question, response, recorder, started)
+    _record_turn_usage(session_id, response, usage)
+
+# Threads running the blocking agent loop on behalf of async callers
+agent_executor_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AGENT_WORKER_THREADS", "200")),
+    thread_name_prefix="agent-query",
+)
+
+# Async variant of query_agent for ASGI views
+async def aquery_agent(user_input, session_id=None, question=None):
+    """
+    Query the agent without blocking the event loop.
+
+    Uses the agent's native async_query when available and otherwise runs
+    the blocking query in agent_executor_pool. On the async_query path the
+    blocking steps around the model loop (building the agent, answer cache
+    and intent router lookups with their tool calls and history reads and
+    writes, and the usage bookkeeping) also run in
+    agent_executor_pool, so they don't stall the event loop.
+
+    Args:
+        user_input: The user's message or question
+        session_id: Optional session identifier for maintaining conversation context
+        question: The user's raw message, for the answer cache and the intent
+                  router (see query_agent)
+
+    Returns:
+        The agent's response
+    """
+    agent = _agent if _agent is not None else await _in_agent_pool(get_agent)
+    if hasattr(agent, "async_query"):
+        cached = await _in_agent_pool(_shortcut_answer, user_input, session_id, question)
+        if cached is not None:
+            return cached
+        # Reads the session history, so it runs off the loop as well
+        recorder = await _in_agent_pool(_answer_cache_recorder, session_id, question)
+        config = {"configurable": {"session_id": session_id}} if session_id else {}
+        with turn_accounting(session_id) as usage:
+            config["callbacks"] = [llm_callback_handler(), usage_callback_handler(usage)]
+            if recorder is not None:
+                config["callbacks"].append(recorder)
+            started = time.perf_counter()
+            response = await agent.async_query(input=user_input, config=config)
+        await _in_agent_pool(_finish_turn, session_id, question, response, recorder, usage, started)
+        return response
+    return await _in_agent_pool(query_agent, user_input, session_id, question)
+
+async def _in_agent_pool(func, *args):
+    """Run a blocking call in agent_executor_pool, carrying the request's trace context into the thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(agent_executor_pool, contextvars.copy_context().run, func, *args)
+
+# Turns of one session run in order (rapid messages merged), sessions round-robin
+_session_scheduler = None
+_session_scheduler_lock = threading.Lock()
+
+def get_session_scheduler():
+    """Process-wide SessionScheduler running query_agent, or None when SESSION_SCHEDULER_ENABLED is false."""
+    global _session_scheduler
+    if _session_scheduler is None and os.getenv("SESSION_SCHEDULER_ENABLED", "true").lower() == "true":
+        with _session_scheduler_lock:
+            if _session_scheduler is None:
+                from session_scheduler import RedisSessionLock, SessionScheduler
+
+                # Serializes a session across workers and instances sharing the Redis
+                lock_url = os.getenv("SESSION_LOCK_REDIS_URL")
+                _session_scheduler = SessionScheduler(
+                    query_agent, session_lock=RedisSessionLock(lock_url) if lock_url else None
+                )
+    return _session_scheduler
+
+def get_agent_runnable():
+    """Return the agent's underlying LangChain runnable, setting the agent up if needed."""
+    agent = get_agent()
+    runnable = getattr(agent, "_tmpl_attrs", {}).get("runnable") or getattr(agent, "_runnable", None)
+    if runnable is None:
+        agent.set_up()
+        runnable = getattr(agent, "_tmpl_attrs", {}).get("runnable") or getattr(agent, "_runnable", None)
+    return runnable
+
+def _chunk_text(chunk):
+    """Text carried by a streamed model chunk (content may be a str or a list of parts)."""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, str) or part.get("type") == "text"
+        )
+    return ""
+
+# Streaming variant of query_agent
+async def astream_agent(user_input, session_id=None, runnable=None, question=None):
+    """
+    Stream an agent turn as it happens.
+
+    Goes through the same steps as query_agent around the model loop: the
+    answer cache and the intent router can answer first, and the turn's token
+    usage, latency and cacheable answer are recorded afterwards. Blocking
+    steps (building the agent, the shortcuts, history reads and writes) run
+    in agent_executor_pool.
+
+    Args:
+        user_input: The user's message or question
+        session_id: Optional session identifier for maintaining conversation context
+        runnable: Runnable to stream from; defaults to the agent's own. Tests
+                  can pass one built around a fake streaming chat model.
+        question: The user's raw message, for the answer cache and the intent
+                  router (see query_agent)
+
+    Yields:
+        dict: {"type": "token", "content": str} for each piece of model text,
+              {"type": "tool_start" | "tool_end", "name": str} around each tool
+              call, and a last {"type": "final", "output": ...} event whose
+              output is the agent response (with "token_usage" when the
+              model ran).
+    """
+    cached = await _in_agent_pool(_shortcut_answer, user_input, session_id, question)
+    if cached is not None:
+        yield {"type": "final", "output": cached}
+        return
+    runnable = runnable or await _in_agent_pool(get_agent_runnable)
+    recorder = await _in_agent_pool(_answer_cache_recorder, session_id, question)
+    config = {"configurable": {"session_id": session_id}} if session_id else {}
+    output = None
+    with turn_accounting(session_id) as usage:
+        config["callbacks"] = [llm_callback_handler(), usage_callback_handler(usage)]
+        if recorder is not None:
+            config["callbacks"].append(recorder)
+        started = time.perf_counter()
+        async for event in runnable.astream_events({"input": user_input}, config=config, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                text = _chunk_text(event["data"].get("chunk"))
+                if text:
+                    yield {"type": "token", "content": text}
+            elif kind == "on_tool_start":
+                yield {"type": "tool_start", "name": event["name"]}
+            elif kind == "on_tool_end":
+                yield {"type": "tool_end", "name": event["name"]}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = event["data"].get("output")
+    if isinstance(output, dict):
+        output = dict(output)
+    await _in_agent_pool(_finish_turn, session_id, question, output, recorder, usage, started)
+    yield {"type": "final", "output": output}
+
+# Component stats exposed as gauges on /metrics
+def _history_store_stats():
+    from history_store import current_history_store
+
+    store = current_history_store()
+    return store.stats() if store is not None else {}
+
+registry.register_collector("auth_tokens", lambda: get_token_provider().stats())
+registry.register_collector("tool_transport", lambda: get_tool_transport().stats_snapshot())
+registry.register_collector("tool_cache", lambda: get_tool_cache().stats())
+registry.register_collector("single_flight", tool_flights.stats)
+registry.register_collector("tool_backends", backend_guard_stats)
+registry.register_collector("menu_index", lambda: _menu_engine.stats() if _menu_engine else {})
+registry.register_collector("history_store", _history_store_stats)
+registry.register_collector("memory", lambda: get_memory_manager().stats() if get_memory_manager() else {})
+registry.register_collector("answer_cache", lambda: get_answer_cache().stats() if get_answer_cache() else {})
+registry.register_collector("prefetch", prefetcher.stats)
+registry.register_collector("model_tiering", lambda: _model_tiering.stats() if _model_tiering else {})
+registry.register_collector("intent_router", lambda: _intent_router.stats() if _intent_router else {})
+registry.register_collector("session_scheduler", lambda: _session_scheduler.stats() if _session_scheduler else {})
@@ -0,0 +1,489 @@
+"""
+Deterministic pre-router for simple menu lookups.
+
+Many messages are plain lookups: prices under an amount, the products of a
+category, the attributes of a category, the menu images, or one product's
+details. For these the model only picks a tool, calls it and rephrases the
+result, which costs two Gemini round trips. IntentRouter classifies each
+message with:
+
+- rules: one pattern per intent, which also extracts the tool arguments;
+- a small multinomial naive Bayes classifier trained on example messages,
+  whose probability for the rule's intent is the routing confidence.
+
+When both agree with enough confidence, the router calls the tool directly
+and answers from a template. Anything else goes to the agent. This includes
+orders, personal data, follow-ups, empty results and tool errors.
+
+INTENT_ROUTER=shadow logs the decisions without acting on them; on routes;
+off (the default) disables the router.
+
+The templates read these tool result fields, which are assumed and have not
+been checked against recorded backend responses (see menu_index):
+
+- consulta_productos_menu: {"success", "results": [{PRODUCT_NAME_FIELD,
+  CATEGORY_FIELD, PRICE_FIELD, "description"}]};
+- consulta_atributos: {"success", "categoryName", "attributes": {name: [values]}};
+- imagenes_menu: {"images": [{"url"}]}.
+
+A result without the fields its template needs goes to the agent, and a
+warning is logged with the keys the result did have. Shadow mode makes no
+tool calls, so run with INTENT_ROUTER=on for some traffic and check these
+warnings before relying on the router.
+"""
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from menu_index import CATEGORY_FIELD, PRICE_FIELD, PRODUCT_NAME_FIELD
+from telemetry import registry
+from tool_cache import fold_text
+
+logger = logging.getLogger("intent_router")
+
+ROUTER_MODE = os.getenv("INTENT_ROUTER", "off").lower()
+# Minimum confidence (rule and classifier combined) to answer without the agent
+CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8"))
+# Comma-separated subset of intents the router may answer; empty means all
+ENABLED_INTENTS = frozenset(filter(None, os.getenv("INTENT_ROUTER_INTENTS", "").split(",")))
+MAX_MESSAGE_WORDS = 20
+MAX_LISTED_PRODUCTS = 5
+
+INTENTS = ("price", "category", "attributes", "menu_images", "product", "other")
+
+routed_total = registry.counter(
+    "agent_intent_router_total", "Router decisions by intent and outcome (routed/shadow/agent)")
+saved_seconds_total = registry.counter(
+    "agent_intent_router_saved_seconds_total", "Estimated agent time saved by routed answers")
+
+_NON_WORD = re.compile(r"[^\w\s.,$]")
+_AMOUNT = re.compile(r"(?:\$\s*)?(\d+(?:[.,]\d{1,2})?)")
+
+# Messages with these words need the agent: orders, personal data, follow-ups
+_AGENT_MARKERS = frozenset({
+    "pedir", "pedido", "ordenar", "orden", "llevar", "agrega", "agregame", "agregale", "quita", "cambia",
+    "mi", "mis", "nombre", "telefono", "direccion", "cliente", "entrega", "domicilio",
+    "ese", "esa", "eso", "esos", "esas", "mismo", "misma", "anterior", "tambien", "entonces",
+})
+_STOPWORDS = frozenset({
+    "que", "cual", "cuales", "como", "el", "la", "los", "las", "lo", "de", "del", "un", "una", "unos", "unas",
+    "y", "o", "a", "en", "con", "por", "para", "es", "son", "hay", "tienen", "tiene", "ustedes", "usted",
+    "hola", "buenas", "buenos", "dias", "tardes", "noches", "favor", "me", "puedes", "puede", "podria",
+    "podrias", "tu", "su", "sus", "al",
+})
+# The only words allowed in a request for the menu images
+_MENU_REQUEST_WORDS = frozenset({
+    "menu", "carta", "ver", "quiero", "quisiera", "enviar", "envia", "enviame", "manda", "mandame", "mandar",
+    "comparte", "compartes", "compartir", "muestrame", "muestra", "fotos", "foto", "imagenes", "imagen",
+})
+# Words around the subject of a lookup that are not part of it
+_QUERY_WORDS = frozenset({
+    "precio", "precios", "cuesta", "cuestan", "vale", "valen", "menos", "menor", "menores", "mas", "hasta",
+    "debajo", "maximo", "bajo", "dolares", "dolar", "productos", "producto", "opciones", "categoria",
+    "categorias", "atributos", "atributo", "extras", "extra", "agregar", "ponerle", "informacion", "sobre",
+    "muestrame", "muestra", "dime", "ver", "cuanto", "tipos", "tipo", "puedo", "hay", "barato", "baratos",
+    "algo", "cosas", "comer", "tomar",
+})
+
+_PATTERNS = {
+    "price": re.compile(r"\b(menos de|menor(?:es)? a|hasta|por debajo de|maximo|bajo|no mas de)\s*\$?\s*\d"),
+    "category": re.compile(r"\bcategorias?\b(?: de)?\s+(?P<subject>[\w ]+)"),
+    "attributes": re.compile(r"\b(atributos?|extras?|ingredientes adicionales)\b.*\b(?:a|para|de|en|tiene|tienen|lleva)\s+(?:las|los|una?|la|el|mi)?\s*(?P<subject>[\w ]+)$"),
+    "menu_images": re.compile(r"\b(menu|carta)\b"),
+    "product": re.compile(r"\b(informacion sobre|cuanto cuesta|cuanto vale|precio de|detalles de)\s+(?:las|los|una?|la|el)?\s*(?P<subject>[\w ]+)$"),
+}
+
+# Example messages per intent for the classifier
+TRAINING_EXAMPLES = {
+    "price": [
+        "que pizzas tienen un precio menor a 15 dolares",
+        "productos de menos de 10 dolares",
+        "que puedo comer con 5 dolares",
+        "opciones baratas hasta 8 dolares",
+        "que cafes cuestan menos de 3",
+        "tienen algo por debajo de 6 dolares",
+        "cosas que cuesten maximo 12",
+        "bebidas de menos de 2 dolares",
+    ],
+    "category": [
+        "que productos tienen en la categoria de cafes",
+        "que hay en la categoria pizzas",
+        "muestrame la categoria de bebidas",
+        "productos de la categoria postres",
+        "que tienen en la categoria de entradas",
+        "lista de la categoria hamburguesas",
+        "categoria de ensaladas",
+    ],
+    "attributes": [
+        "que atributos o extras puedo agregar a una pizza",
+        "que extras tiene la hamburguesa",
+        "que tamanos hay para el cafe",
+        "que ingredientes adicionales puedo ponerle a la pizza",
+        "atributos de los cafes",
+        "que opciones de masa tienen para pizza",
+        "que extras hay para las alitas",
+    ],
+    "menu_images": [
+        "me puedes enviar el menu",
+        "quiero ver el menu",
+        "tienen carta",
+        "mandame fotos del menu",
+        "muestrame la carta",
+        "cual es el menu",
+        "me compartes el menu por favor",
+    ],
+    "product": [
+        "muestrame informacion sobre la pizza margarita",
+        "cuanto cuesta la pizza pepperoni",
+        "cuanto vale el cafe americano",
+        "precio de las alitas bbq",
+        "detalles de la pizza hawaiana",
+        "informacion sobre el capuchino",
+        "cuanto cuesta un latte",
+    ],
+    "other": [
+        "hola buenas tardes",
+        "quiero pedir una pizza grande",
+        "mi nombre es juan y mi telefono es 7777 8888",
+        "agregale queso extra a mi pedido",
+        "a que hora cierran",
+        "cuanto tarda la entrega a domicilio",
+        "gracias muy amable",
+        "quiero cambiar mi orden",
+        "la pizza llego fria",
+        "si esa misma por favor",
+        "hacen entregas en san salvador",
+        "quiero hablar con una persona",
+    ],
+}
+
+
+def normalize_message(text: str) -> str:
+    """Fold accents and case and drop punctuation other than amounts ("¿Qué pizzas?" -> "que pizzas")."""
+    return " ".join(_NON_WORD.sub(" ", fold_text(text)).split())
+
+
+def content_words(text: str) -> list:
+    return [word for word in re.findall(r"[a-z]+", text) if word not in _STOPWORDS]
+
+
+def subject_words(text: str) -> str:
+    """What a lookup is about, without the words that frame the question."""
+    return " ".join(word for word in content_words(text) if word not in _QUERY_WORDS)
+
+
+def _stem(word: str) -> str:
+    for suffix in ("es", "s"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 3:
+            return word[:-len(suffix)]
+    return word
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over stemmed content words, with Laplace smoothing."""
+
+    def __init__(self, examples: dict):
+        self.word_counts = defaultdict(Counter)
+        self.class_counts = Counter()
+        for intent, messages in examples.items():
+            for message in messages:
+                self.class_counts[intent] += 1
+                self.word_counts[intent].update(self.features(message))
+        self.vocabulary = {word for counts in self.word_counts.values() for word in counts}
+        self.totals = {intent: sum(counts.values()) for intent, counts in self.word_counts.items()}
+
+    @staticmethod
+    def features(message: str) -> list:
+        return [_stem(word) for word in content_words(normalize_message(message))]
+
+    def predict(self, message: str) -> dict:
+        """Probability of each intent for a message."""
+        features = self.features(message)
+        examples = sum(self.class_counts.values())
+        scores = {}
+        for intent, count in self.class_counts.items():
+            denominator = self.totals[intent] + len(self.vocabulary)
+            scores[intent] = math.log(count / examples) + sum(
+                math.log((self.word_counts[intent][word] + 1) / denominator)
+                for word in features if word in self.vocabulary
+            )
+        top = max(scores.values())
+        exp = {intent: math.exp(score - top) for intent, score in scores.items()}
+        total = sum(exp.values())
+        return {intent: value / total for intent, value in exp.items()}
+
+
+class Route:
+    """A routing decision for one message."""
+
+    __slots__ = ("intent", "confidence", "tool", "args", "answer", "elapsed", "saved")
+
+    def __init__(self, intent: str, confidence: float, tool: str = None, args: dict = None):
+        self.intent = intent
+        self.confidence = confidence
+        self.tool = tool
+        self.args = args or {}
+        self.answer = None
+        self.elapsed = 0.0
+        self.saved = None
+
+    def metadata(self) -> dict:
+        return {
+            "intent": self.intent,
+            "confidence": round(self.confidence, 3),
+            "tool": self.tool,
+            "saved_ms": round(self.saved * 1000, 1) if self.saved is not None else None,
+        }
+
+
+class IntentRouter:
+    """
+    Answers high-confidence menu lookups without the agent.
+
+    Args:
+        tools: Tool functions by name (consulta_productos_menu, consulta_atributos,
+               imagenes_menu), normally the agent's own.
+        mode: "on" to answer, "shadow" to only log decisions.
+        threshold: Minimum combined confidence to route.
+        intents: Intents the router may answer; None for all.
+    """
+
+    def __init__(self, tools: dict, mode: str = ROUTER_MODE, threshold: float = CONFIDENCE_THRESHOLD,
+                 intents=ENABLED_INTENTS):
+        self.tools = tools
+        self.mode = mode
+        self.threshold = threshold
+        self.intents = frozenset(intents) if intents else None
+        self.classifier = NaiveBayesClassifier(TRAINING_EXAMPLES)
+        self._lock = threading.Lock()
+        self.decisions = Counter()
+        self.saved_seconds = 0.0
+        # Moving average of agent turn latency, the baseline for time saved
+        self.agent_turn_seconds = None
+
+    def classify(self, message: str) -> Route:
+        """Intent, confidence and tool arguments for a message (intent "other" when it needs the agent)."""
+        text = normalize_message(message)
+        words = text.split()
+        probabilities = self.classifier.predict(message)
+        if not words or len(words) > MAX_MESSAGE_WORDS or _AGENT_MARKERS.intersection(words):
+            return Route("other", probabilities.get("other", 0.0))
+        for intent, pattern in _PATTERNS.items():
+            match = pattern.search(text)
+            if match is None:
+                continue
+            route = self._with_arguments(intent, text, match)
+            if route is None:
+                continue
+            # The rule is the gate; the classifier's agreement sets the confidence
+            route.confidence = 0.5 + 0.5 * probabilities.get(intent, 0.0)
+            return route
+        intent = max(probabilities, key=probabilities.get)
+        return Route(intent, probabilities[intent] * 0.5)
+
+    def route(self, message: str):
+        """
+        Answer a message directly when it is a high-confidence lookup.
+
+        Returns:
+            Route or None: The route with its templated answer, or None when
+                           the message should go to the agent.
+        """
+        started = time.perf_counter()
+        route = self.classify(message)
+        routable = (
+            route.tool is not None and route.confidence >= self.threshold
+            and (self.intents is None or route.intent in self.intents)
+        )
+        if routable and self.mode == "on":
+            try:
+                route.answer = self._answer(route)
+            except Exception as e:
+                logger.warning(f"Routed {route.intent} lookup failed, using the agent: {str(e)}")
+        route.elapsed = time.perf_counter() - started
+
+        if route.answer is not None:
+            outcome = "routed"
+            baseline = self.agent_turn_seconds
+            route.saved = max(baseline - route.elapsed, 0.0) if baseline is not None else None
+        else:
+            outcome = "shadow" if routable and self.mode == "shadow" else "agent"
+        self._record(route, outcome)
+        return route if route.answer is not None else None
+
+    def observe_agent_turn(self, seconds: float) -> None:
+        """Feed the latency of a turn the agent answered, for the time-saved estimate."""
+        with self._lock:
+            previous = self.agent_turn_seconds
+            self.agent_turn_seconds = seconds if previous is None else 0.9 * previous + 0.1 * seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(self.decisions.values())
+            return {
+                "decisions": total,
+                "routed": self.decisions["routed"],
+                "shadow": self.decisions["shadow"],
+                "agent": self.decisions["agent"],
+                "routed_ratio": self.decisions["routed"] / total if total else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "agent_turn_seconds": self.agent_turn_seconds or 0.0,
+            }
+
+    def _record(self, route: Route, outcome: str) -> None:
+        with self._lock:
+            self.decisions[outcome] += 1
+            if route.saved:
+                self.saved_seconds += route.saved
+        routed_total.inc(intent=route.intent, outcome=outcome)
+        if route.saved:
+            saved_seconds_total.inc(route.saved)
+        logger.info(
+            f"Intent {route.intent} ({route.confidence:.2f}) -> {outcome}",
+            extra={
+                "intent": route.intent,
+                "confidence": round(route.confidence, 3),
+                "route_outcome": outcome,
+                "route_args": route.args,
+                "route_ms": round(route.elapsed * 1000, 1),
+                "saved_ms": round(route.saved * 1000, 1) if route.saved is not None else None,
+            },
+        )
+
+    def _with_arguments(self, intent: str, text: str, match):
+        if intent == "price":
+            amounts = _AMOUNT.findall(text[match.start():])
+            if not amounts:
+                return None
+            subject = subject_words(text[:match.start()] + " " + text[match.end():])
+            return Route(intent, 0.0, "consulta_productos_menu", {
+                "amount": amounts[0].replace(",", "."), "subject": subject,
+            })
+        if intent == "menu_images":
+            # Only a request for the menu itself, not questions about what is on it
+            if not set(content_words(text)) <= _MENU_REQUEST_WORDS:
+                return None
+            return Route(intent, 0.0, "imagenes_menu")
+        words = match.group("subject").split()
+        subject = subject_words(match.group("subject"))
+        # "la pizza y el cafe" asks about more than one thing
+        if not subject or "y" in words or "o" in words:
+            return None
+        tool = "consulta_atributos" if intent == "attributes" else "consulta_productos_menu"
+        return Route(intent, 0.0, tool, {"subject": subject})
+
+    def _answer(self, route: Route):
+        """Call the route's tool and fill its template; None when the result isn't a clean answer."""
+        args = route.args
+        if route.intent == "price":
+            result = self.tools["consulta_productos_menu"](args["amount"], "price", 20)
+            products = _products(result, route.intent)
+            if args["subject"]:
+                products = [p for p in products if _mentions(
+                    f"{p.get(PRODUCT_NAME_FIELD, '')} {p.get(CATEGORY_FIELD, '')}", args["subject"]
+                )]
+            if not products:
+                return None
+            return "\n".join(
+                [f"Estas son algunas opciones de hasta ${args['amount']}:"]
+                + [_product_line(p) for p in products[:MAX_LISTED_PRODUCTS]]
+                + ["¿Te gustaría ordenar alguna?"]
+            )
+        if route.intent == "category":
+            products = _products(self.tools["consulta_productos_menu"](args["subject"], "categories", 10), route.intent)
+            if not products:
+                return None
+            category = products[0].get(CATEGORY_FIELD) or args["subject"]
+            return "\n".join(
+                [f"En {category} tenemos:"] + [_product_line(p) for p in products]
+                + ["¿Te gustaría ordenar alguno?"]
+            )
+        if route.intent == "attributes":
+            result = self.tools["consulta_atributos"](args["subject"])
+            if not _succeeded(result):
+                return None
+            attributes = result.get("attributes")
+            if not isinstance(attributes, dict):
+                _log_unusable(route.intent, "consulta_atributos", result, "attributes")
+                return None
+            if not attributes:
+                return None
+            category = result.get("categoryName") or args["subject"]
+            lines = [f"Para {category} puedes elegir:"]
+            for name, values in attributes.items():
+                values = ", ".join(str(v) for v in values) if isinstance(values, list) else str(values)
+                lines.append(f"- {name.capitalize()}: {values}")
+            return "\n".join(lines + ["¿Con qué opciones lo quieres?"])
+        if route.intent == "menu_images":
+            result = self.tools["imagenes_menu"]()
+            if not _succeeded(result):
+                return None
+            images = result.get("images")
+            if not isinstance(images, list):
+                _log_unusable(route.intent, "imagenes_menu", result, "images")
+                return None
+            urls = [image.get("url") for image in images if isinstance(image, dict) and image.get("url")]
+            if not urls:
+                if images:
+                    _log_unusable(route.intent, "imagenes_menu", result, "images[].url")
+                return None
+            return "\n".join(["¡Claro! Aquí tienes nuestro menú:"] + urls + ["¿Qué te gustaría ordenar?"])
+        if route.intent == "product":
+            products = _products(self.tools["consulta_productos_menu"](args["subject"], "products", 3), route.intent)
+            # The search is fuzzy: only answer about a product that is what was asked for
+            products = [p for p in products if _mentions(p.get(PRODUCT_NAME_FIELD, ""), args["subject"])]
+            if not products:
+                return None
+            product = products[0]
+            description = product.get("description")
+            return "\n".join(filter(None, [
+                _product_line(product).lstrip("- "),
+                description,
+                "¿Te gustaría ordenarlo?",
+            ]))
+        return None
+
+
+def _mentions(text: str, subject: str) -> bool:
+    """Whether every word of a lookup's subject appears (stemmed) in a product's text."""
+    folded = fold_text(text)
+    return all(_stem(word) in folded for word in subject.split())
+
+
+def _succeeded(result) -> bool:
+    """Whether a tool returned a payload to read, rather than an error or a non-dict."""
+    if not isinstance(result, dict):
+        logger.warning(f"Routed lookup got a {type(result).__name__} tool result instead of an object")
+        return False
+    return "error" not in result and result.get("success") is not False
+
+
+def _log_unusable(intent: str, tool: str, result: dict, field: str) -> None:
+    """Warn that a tool result lacks the field a template reads: its schema may differ from the assumed one."""
+    logger.warning(
+        f"{tool} result has no usable {field} for the {intent} template; check the assumed payload schema",
+        extra={"intent": intent, "tool": tool, "result_keys": sorted(map(str, result))},
+    )
+
+
+def _products(result, intent: str) -> list:
+    if not _succeeded(result):
+        return []
+    items = result.get("results")
+    if not isinstance(items, list):
+        _log_unusable(intent, "consulta_productos_menu", result, "results")
+        return []
+    products = [p for p in items if isinstance(p, dict) and p.get(PRODUCT_NAME_FIELD)]
+    if items and not products:
+        _log_unusable(intent, "consulta_productos_menu", result, f"results[].{PRODUCT_NAME_FIELD}")
+    return products
+
+
+def _product_line(product: dict) -> str:
+    name, price = product[PRODUCT_NAME_FIELD], product.get(PRICE_FIELD)
+    return f"- {name}: ${price}" if price not in (None, "") else f"- {name}"
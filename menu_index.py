@@ -0,0 +1,278 @@
+"""
+In-process menu index answering consulta_productos_menu without a network hop.
+
+The full catalog is bulk-loaded once and then on a refresh schedule into an
+immutable MenuIndex snapshot with:
+
+- a sorted name list for prefix lookups and a trigram index for fuzzy matches,
+- an accent-insensitive token index,
+- a category map,
+- a sorted price array for range queries,
+- the attributes catalog per category, for consulta_atributos.
+
+A failed refresh keeps serving the previous snapshot, so searches keep working
+while the catalog backend is briefly unavailable.
+
+The catalog is expected as {"products": [...], "attributes": {...}}: each
+product carries the same fields consulta_productos_menu's remote function
+returns, and "attributes" maps a category name to the payload consulta_atributos
+returns for it (categories missing from it are still asked to the backend).
+These shapes, the field names used for indexing (PRODUCT_NAME_FIELD,
+CATEGORY_FIELD, PRICE_FIELD) and the search payload keys are assumed, not
+verified against recorded backend responses; compare them with real payloads
+before turning LOCAL_MENU_INDEX on.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+import orjson
+
+from tool_cache import fold_text
+
+logger = logging.getLogger("menu_index")
+
+PRODUCT_NAME_FIELD = "productName"
+CATEGORY_FIELD = "categoryName"
+PRICE_FIELD = "price"
+
+# Minimum trigram similarity for a fuzzy name match
+TRIGRAM_THRESHOLD = 0.3
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _price(value):
+    try:
+        return float(str(value).replace("$", "").replace(",", ".").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+class MenuIndex:
+    """Immutable search structures built from one catalog snapshot."""
+
+    def __init__(self, catalog: dict):
+        self.products = list(catalog.get("products", []))
+        self.attributes = {fold_text(k): v for k, v in (catalog.get("attributes") or {}).items()}
+        self.loaded_at = time.time()
+        self.names = [fold_text(p.get(PRODUCT_NAME_FIELD, "")) for p in self.products]
+
+        self.sorted_names = sorted((name, i) for i, name in enumerate(self.names))
+        self.tokens = defaultdict(set)
+        self.trigrams = defaultdict(set)
+        for i, name in enumerate(self.names):
+            for token in name.split():
+                self.tokens[token].add(i)
+            for gram in trigrams(name):
+                self.trigrams[gram].add(i)
+
+        self.categories = defaultdict(list)
+        for i, product in enumerate(self.products):
+            self.categories[fold_text(product.get(CATEGORY_FIELD, ""))].append(i)
+
+        prices = ((_price(p.get(PRICE_FIELD)), i) for i, p in enumerate(self.products))
+        self.prices = sorted((price, i) for price, i in prices if price is not None)
+        self.price_values = [price for price, _ in self.prices]
+
+    def __len__(self):
+        return len(self.products)
+
+    def search(self, product_name: str, search_mode: str = "products", max_results: int = 5,
+               single_result: bool = False) -> dict:
+        """
+        Answer a consulta_productos_menu call from the index.
+
+        Returns:
+            dict: success, searchMode, query, totalResults and results, the
+                  payload shape assumed for the remote function (unverified,
+                  see the module docstring).
+        """
+        if search_mode == "categories":
+            ids = self._by_category(product_name)
+        elif search_mode == "price":
+            ids = self._by_price(product_name)
+        else:
+            ids = self._by_name(product_name)
+        limit = 1 if single_result else max(int(max_results), 0)
+        results = [self.products[i] for i in ids[:limit]]
+        return {
+            "success": True,
+            "searchMode": search_mode,
+            "query": product_name,
+            # Matches before the limit, as the remote function reports them
+            "totalResults": len(ids),
+            "results": results,
+        }
+
+    def attributes_for(self, category_name: str):
+        """Attributes payload loaded for a category, or None if the catalog has none."""
+        return self.attributes.get(fold_text(category_name))
+
+    def _by_name(self, query: str) -> list:
+        folded = fold_text(query)
+        if not folded:
+            return []
+        ranked = []
+        seen = set()
+
+        def add(ids):
+            for i in ids:
+                if i not in seen:
+                    seen.add(i)
+                    ranked.append(i)
+
+        add(i for i, name in enumerate(self.names) if name == folded)
+        start = bisect.bisect_left(self.sorted_names, (folded,))
+        prefixed = []
+        for name, i in self.sorted_names[start:]:
+            if not name.startswith(folded):
+                break
+            prefixed.append(i)
+        add(prefixed)
+
+        token_sets = [self.tokens.get(token, set()) for token in folded.split()]
+        if token_sets and all(token_sets):
+            add(sorted(set.intersection(*token_sets)))
+
+        query_grams = trigrams(folded)
+        overlap = defaultdict(int)
+        for gram in query_grams:
+            for i in self.trigrams.get(gram, ()):
+                overlap[i] += 1
+        scored = []
+        for i, shared in overlap.items():
+            score = shared / (len(query_grams) + len(trigrams(self.names[i])) - shared)
+            if score >= TRIGRAM_THRESHOLD:
+                scored.append((-score, i))
+        add(i for _, i in sorted(scored))
+        return ranked
+
+    def _by_category(self, query: str) -> list:
+        folded = fold_text(query)
+        if not folded:
+            return []
+        if folded in self.categories:
+            return list(self.categories[folded])
+        best, best_score = None, 0.0
+        query_grams = trigrams(folded)
+        for category in self.categories:
+            if category.startswith(folded) or folded in category.split():
+                return list(self.categories[category])
+            grams = trigrams(category)
+            score = len(query_grams & grams) / len(query_grams | grams)
+            if score > best_score:
+                best, best_score = category, score
+        if best is not None and best_score >= TRIGRAM_THRESHOLD:
+            return list(self.categories[best])
+        return []
+
+    def _by_price(self, query: str) -> list:
+        numbers = [float(n.replace(",", ".")) for n in _NUMBER.findall(str(query))]
+        if not numbers:
+            return []
+        if len(numbers) >= 2:
+            low, high = sorted(numbers[:2])
+            start = bisect.bisect_left(self.price_values, low)
+            end = bisect.bisect_right(self.price_values, high)
+            return [i for _, i in self.prices[start:end]]
+        # A single amount is a budget: closest prices at or under it come first
+        end = bisect.bisect_right(self.price_values, numbers[0])
+        return [i for _, i in reversed(self.prices[:end])]
+
+
+class MenuEngine:
+    """
+    Keeps a MenuIndex loaded and periodically refreshed.
+
+    Args:
+        loader: Zero-argument callable returning the catalog dict.
+        refresh_interval: Seconds between background reloads.
+    """
+
+    def __init__(self, loader, refresh_interval: float = 900):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self.last_error = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._timer = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    @property
+    def ready(self) -> bool:
+        return self.index is not None
+
+    def refresh(self) -> bool:
+        """Reload the catalog; on failure the previous snapshot stays in place."""
+        with self._lock:
+            try:
+                index = MenuIndex(self.loader())
+            except Exception as e:
+                self.refresh_failures += 1
+                self.last_error = str(e)
+                logger.warning(f"Menu catalog refresh failed: {str(e)}")
+                return False
+            self.index = index
+            self.refreshes += 1
+            self.last_error = None
+            logger.info(f"Menu index loaded with {len(index)} products")
+            return True
+
+    def start(self) -> None:
+        """Load the catalog in the background and keep refreshing it."""
+        self._stopped = False
+        self._schedule(0)
+
+    def stop(self) -> None:
+        self._stopped = True
+        if self._timer:
+            self._timer.cancel()
+
+    def search(self, *args, **kwargs) -> dict:
+        return self.index.search(*args, **kwargs)
+
+    def attributes_for(self, category_name: str):
+        return self.index.attributes_for(category_name)
+
+    def stats(self) -> dict:
+        index = self.index
+        return {
+            "ready": index is not None,
+            "products": len(index) if index else 0,
+            "loaded_at": index.loaded_at if index else None,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "last_error": self.last_error,
+        }
+
+    def _schedule(self, delay: float) -> None:
+        if self._stopped:
+            return
+        self._timer = threading.Timer(delay, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self) -> None:
+        self.refresh()
+        # Retry sooner while no snapshot has been loaded yet
+        self._schedule(self.refresh_interval if self.ready else min(self.refresh_interval, 30))
+
+
+def file_catalog_loader(path: str):
+    """Loader reading the catalog from a local JSON file."""
+    def load():
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    return load
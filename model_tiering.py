@@ -0,0 +1,252 @@
+"""
+Model tiering: a fast model for routine agent steps, the full model when needed.
+
+Most model calls of a turn either select tools (pick the lookup and its
+arguments) or write a short reply from a tool result. Those calls run on the
+fast tier (MODEL_FAST, a smaller Gemini) with per-step generation overrides
+such as a lower temperature. A call escalates to the strong tier (the
+agent's own model) when the message looks like a complex order, when the turn
+has already taken MODEL_ESCALATE_AFTER_STEPS tool rounds, or when the last tool
+answered with an error.
+
+Every call carries its tier and step in the callback metadata, so the per-tier
+latency and token metrics and the turn's token usage can tell them apart. Tests
+can pass their own tier models (e.g. benchmarks.fake_model's ScriptedChatModel)
+instead of building Gemini ones.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+import orjson
+
+from telemetry import registry, token_usage
+from tool_cache import fold_text
+
+logger = logging.getLogger("model_tiering")
+
+MODEL_TIERING_ENABLED = os.getenv("MODEL_TIERING", "false").lower() == "true"
+FAST_MODEL = os.getenv("MODEL_FAST", "gemini-2.0-flash-lite")
+# Tool rounds after which the rest of the turn runs on the strong tier
+ESCALATE_AFTER_STEPS = int(os.getenv("MODEL_ESCALATE_AFTER_STEPS", "2"))
+# Item quantities in one order message that make it a complex order
+COMPLEX_ORDER_ITEMS = int(os.getenv("MODEL_COMPLEX_ORDER_ITEMS", "2"))
+# Messages longer than this always go to the strong tier
+COMPLEX_MESSAGE_CHARS = int(os.getenv("MODEL_COMPLEX_MESSAGE_CHARS", "280"))
+
+TIERS = ("fast", "strong")
+# tool_selection: no tool results yet in the turn; answer: the model has tool results to use
+STEPS = ("tool_selection", "answer")
+
+# Generation overrides per tier and step, on top of the agent's model_kwargs.
+# MODEL_STEP_PARAMS (JSON of the same shape) replaces individual entries.
+# max_output_tokens is left at the agent's value: a tool_selection call may
+# also be the final reply, and a truncated reply isn't retried on the strong tier.
+DEFAULT_STEP_PARAMS = {
+    "fast": {
+        "tool_selection": {"temperature": 0.1},
+        "answer": {},
+    },
+    "strong": {},
+}
+
+_ORDER_WORDS = frozenset({
+    "pedido", "pedir", "ordenar", "orden", "llevar", "quiero", "quisiera", "agregar", "agregale", "agrega",
+    "domicilio", "envio", "entrega", "cambiar", "quitar", "quitale",
+})
+_QUANTITY = re.compile(r"\b(\d+|un|una|dos|tres|cuatro|cinco|seis|siete|ocho|nueve|diez|media|docena)\b")
+
+tier_calls_total = registry.counter(
+    "agent_model_tier_calls_total", "Model calls by tier, agent step and the reason for the tier")
+tier_call_duration = registry.histogram(
+    "agent_model_tier_duration_seconds", "Latency of model calls by tier and agent step")
+tier_tokens_total = registry.counter(
+    "agent_model_tier_tokens_total", "Tokens used by model calls by tier and kind (prompt/completion)")
+
+
+def load_step_params(raw: str = None) -> dict:
+    """DEFAULT_STEP_PARAMS with the per-tier, per-step overrides of MODEL_STEP_PARAMS applied."""
+    params = {tier: {step: dict(values) for step, values in steps.items()}
+              for tier, steps in DEFAULT_STEP_PARAMS.items()}
+    raw = raw if raw is not None else os.getenv("MODEL_STEP_PARAMS")
+    if raw:
+        for tier, steps in orjson.loads(raw).items():
+            for step, values in steps.items():
+                params.setdefault(tier, {})[step] = dict(values)
+    return params
+
+
+def is_complex_order(message: str, min_items: int = COMPLEX_ORDER_ITEMS,
+                     max_chars: int = COMPLEX_MESSAGE_CHARS) -> bool:
+    """Whether a message is long, or places an order naming several item quantities."""
+    if len(message) > max_chars:
+        return True
+    text = fold_text(message)
+    if not _ORDER_WORDS.intersection(re.findall(r"\w+", text)):
+        return False
+    return len(_QUANTITY.findall(text)) >= min_items
+
+
+def _tool_failed(observation) -> bool:
+    if isinstance(observation, dict):
+        return "error" in observation
+    return isinstance(observation, str) and observation.lstrip().startswith('{"error"')
+
+
+def tool_rounds(intermediate_steps) -> int:
+    """Model calls that requested tools so far; parallel calls of one step share their message."""
+    messages = set()
+    for action, _ in intermediate_steps:
+        message_log = getattr(action, "message_log", None)
+        messages.add(id(message_log[0]) if message_log else id(action))
+    return len(messages)
+
+
+class ModelTiering:
+    """
+    Picks the model tier of each model call in the agent loop.
+
+    Args:
+        model_builder: Called as model_builder(model_name, model_kwargs=...) to
+                       build a tier's model when it isn't given in `models`.
+        fast_model: Model name of the fast tier.
+        model_kwargs: Generation parameters for built tier models.
+        step_params: {tier: {step: generation overrides}} (see load_step_params).
+        models: Prebuilt models by tier, e.g. fake models in tests. The strong
+                tier defaults to the agent's own model.
+        escalate_after_steps: Tool rounds after which a turn uses the strong tier.
+    """
+
+    def __init__(self, model_builder=None, fast_model: str = FAST_MODEL, model_kwargs: dict = None,
+                 step_params: dict = None, models: dict = None, escalate_after_steps: int = ESCALATE_AFTER_STEPS):
+        self.model_builder = model_builder
+        self.fast_model = fast_model
+        self.model_kwargs = model_kwargs or {}
+        self.step_params = step_params if step_params is not None else load_step_params()
+        self.models = dict(models or {})
+        self.escalate_after_steps = escalate_after_steps
+        self._lock = threading.Lock()
+        self._stats = {f"{tier}_{stat}": 0 for tier in TIERS
+                       for stat in ("calls", "errors", "seconds", "prompt_tokens", "completion_tokens")}
+        self.escalations = 0
+
+    def select(self, inputs: dict) -> tuple:
+        """
+        Tier for the next model call.
+
+        Args:
+            inputs: The agent's inputs for the call ("input", "intermediate_steps").
+
+        Returns:
+            tuple: (tier, step, reason)
+        """
+        steps = inputs.get("intermediate_steps") or []
+        step = "answer" if steps else "tool_selection"
+        if is_complex_order(str(inputs.get("input") or "")):
+            return "strong", step, "complex_order"
+        if steps and _tool_failed(steps[-1][1]):
+            return "strong", step, "tool_error"
+        if self.escalate_after_steps and tool_rounds(steps) >= self.escalate_after_steps:
+            return "strong", step, "many_steps"
+        return "fast", step, "default"
+
+    def build_agent(self, model, *, tools=None, prompt, output_parser, model_tool_kwargs: dict = None):
+        """
+        The agent runnable: prompt | <tier model> | output_parser, with the tier picked per call.
+
+        Args:
+            model: The agent's own model, used as the strong tier.
+            tools: Tools to bind to every tier model.
+            prompt: The agent's prompt.
+            output_parser: Parser of the model's tool calls.
+            model_tool_kwargs: Extra bind_tools arguments.
+        """
+        from langchain_core.runnables import RunnableLambda
+
+        models = {"strong": model, **self.models}
+        if "fast" not in models:
+            models["fast"] = self.model_builder(self.fast_model, model_kwargs=self.model_kwargs)
+        handler = tier_metrics_handler(self)
+        chains = {}
+        for tier in TIERS:
+            tier_model = models[tier]
+            if tools:
+                tier_model = tier_model.bind_tools(tools=tools, **(model_tool_kwargs or {}))
+            for step in STEPS:
+                params = self.step_params.get(tier, {}).get(step) or {}
+                bound = tier_model.bind(**params) if params else tier_model
+                bound = bound.with_config(
+                    metadata={"model_tier": tier, "model_step": step}, callbacks=[handler], run_name=f"model.{tier}")
+                chains[(tier, step)] = prompt | bound | output_parser
+
+        def route(inputs):
+            tier, step, reason = self.select(inputs)
+            tier_calls_total.inc(tier=tier, step=step, reason=reason)
+            if tier == "strong":
+                with self._lock:
+                    self.escalations += 1
+                logger.debug(f"Model call escalated to the strong tier ({reason})")
+            # A runnable returned by a RunnableLambda is invoked with the same input
+            return chains[(tier, step)]
+
+        return RunnableLambda(route, name="tiered_model")
+
+    def record(self, tier: str, step: str, seconds: float, prompt_tokens=None, completion_tokens=None,
+               error: bool = False) -> None:
+        tier_call_duration.observe(seconds, tier=tier, step=step)
+        if prompt_tokens is not None:
+            tier_tokens_total.inc(prompt_tokens, tier=tier, kind="prompt")
+        if completion_tokens is not None:
+            tier_tokens_total.inc(completion_tokens, tier=tier, kind="completion")
+        with self._lock:
+            self._stats[f"{tier}_calls"] += 1
+            self._stats[f"{tier}_seconds"] += seconds
+            self._stats[f"{tier}_prompt_tokens"] += prompt_tokens or 0
+            self._stats[f"{tier}_completion_tokens"] += completion_tokens or 0
+            if error:
+                self._stats[f"{tier}_errors"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            escalations = self.escalations
+        for tier in TIERS:
+            calls, seconds = stats[f"{tier}_calls"], stats.pop(f"{tier}_seconds")
+            stats[f"{tier}_mean_latency_ms"] = round(seconds / calls * 1000, 1) if calls else 0.0
+        total = stats["fast_calls"] + stats["strong_calls"]
+        stats["escalations"] = escalations
+        stats["fast_share"] = stats["fast_calls"] / total if total else 0.0
+        return stats
+
+
+def tier_metrics_handler(tiering: ModelTiering):
+    """LangChain callback handler recording latency and tokens of tiered model calls into a ModelTiering."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TierMetricsRecorder(BaseCallbackHandler):
+        def __init__(self):
+            self._started = {}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            metadata = metadata or {}
+            if "model_tier" in metadata:
+                self._started[run_id] = (metadata["model_tier"], metadata["model_step"], time.perf_counter())
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            started = self._started.pop(run_id, None)
+            if started is None:
+                return
+            tier, step, started_at = started
+            prompt_tokens, completion_tokens = token_usage(response)
+            tiering.record(tier, step, time.perf_counter() - started_at, prompt_tokens, completion_tokens)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            started = self._started.pop(run_id, None)
+            if started is not None:
+                tier, step, started_at = started
+                tiering.record(tier, step, time.perf_counter() - started_at, error=True)
+
+    return TierMetricsRecorder()
@@ -0,0 +1,168 @@
+"""
+Speculative prefetch of tool results for a conversation's first turn.
+
+First interactions almost always end up calling imagenes_menu and, once the
+customer identifies themselves, consulta_clientes. When a conversation starts,
+those lookups (and the tool ID tokens) are started in the background while
+the model makes its first call. When the model then asks for the same tool
+with a matching key, the tool claims the prefetched result instead of
+calling the backend (waiting for it if it is still in flight).
+
+Prefetched results belong to the session they were started for. A result
+claimed by that session's model counts as a hit. One left unclaimed for
+PREFETCH_TTL seconds counts as waste.
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import registry, span
+from token_accounting import current_turn_usage
+
+logger = logging.getLogger("prefetch")
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+# Seconds a prefetched result waits to be claimed before it counts as wasted
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL", "300"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "8"))
+
+prefetch_total = registry.counter(
+    "agent_prefetch_total", "Speculative tool prefetches by tool and outcome (hit/wasted/failed)")
+
+
+def phone_key(phone) -> str:
+    """Match key for a phone number: its last eight digits, so "+503 7777-8888" matches "77778888"."""
+    return "".join(ch for ch in str(phone or "") if ch.isdigit())[-8:]
+
+
+class _Prefetch:
+    __slots__ = ("future", "created")
+
+    def __init__(self, future, created: float):
+        self.future = future
+        self.created = created
+
+
+class Prefetcher:
+    """
+    Background fetches waiting to be claimed by the session they were started for.
+
+    Args:
+        workers: Prefetches running at once.
+        ttl: Seconds an unclaimed result is kept.
+    """
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, ttl: float = PREFETCH_TTL_SECONDS):
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.failed = 0
+
+    def submit(self, session_id: str, tool: str, key: str, fn, *args) -> None:
+        """
+        Start fetching a tool result in the background for a session.
+
+        Args:
+            session_id: Session whose model is expected to ask for it.
+            tool: Tool name.
+            key: Match key the tool will claim it with (e.g. phone_key()).
+            fn: Callable returning the tool's raw result.
+        """
+        self._expire()
+        entry_key = (session_id, tool, key)
+        with self._lock:
+            if entry_key in self._entries:
+                return
+            future = self._pool.submit(contextvars.copy_context().run, self._fetch, tool, fn, *args)
+            self._entries[entry_key] = _Prefetch(future, time.monotonic())
+            self.started += 1
+
+    def run(self, fn, *args) -> None:
+        """Fire-and-forget background work that isn't claimed (e.g. token refreshes)."""
+        self._pool.submit(contextvars.copy_context().run, fn, *args)
+
+    def _fetch(self, tool: str, fn, *args):
+        with span(f"prefetch.{tool}", tool=tool):
+            try:
+                return fn(*args)
+            except Exception as e:
+                logger.warning(f"Prefetch of {tool} failed: {str(e)}")
+                raise
+
+    def claim(self, session_id: str, tool: str, key: str):
+        """
+        Take the prefetched result of a tool for a session, waiting for it if still in flight.
+
+        Returns:
+            The prefetched result, or None when nothing matching was prefetched,
+            it expired, or the prefetch failed (the tool then makes the call itself).
+        """
+        self._expire()
+        with self._lock:
+            entry = self._entries.pop((session_id, tool, key), None)
+        if entry is None:
+            return None
+        try:
+            result = entry.future.result()
+        except Exception:
+            outcome, result = "failed", None
+        else:
+            outcome = "hit"
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+            else:
+                self.failed += 1
+        prefetch_total.inc(tool=tool, outcome=outcome)
+        return result
+
+    def claim_current(self, tool: str, key: str = ""):
+        """claim() for the session of the agent turn running in this context."""
+        usage = current_turn_usage()
+        if usage is None or usage.session_id is None:
+            return None
+        return self.claim(usage.session_id, tool, key)
+
+    def stats(self) -> dict:
+        self._expire()
+        with self._lock:
+            settled = self.hits + self.wasted + self.failed
+            return {
+                "started": self.started,
+                "pending": len(self._entries),
+                "hits": self.hits,
+                "wasted": self.wasted,
+                "failed": self.failed,
+                "hit_rate": self.hits / settled if settled else 0.0,
+                "waste_rate": self.wasted / settled if settled else 0.0,
+            }
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        expired = []
+        with self._lock:
+            for entry_key, entry in list(self._entries.items()):
+                if entry.created < cutoff:
+                    del self._entries[entry_key]
+                    expired.append(entry_key[1])
+            self.wasted += len(expired)
+        for tool in expired:
+            prefetch_total.inc(tool=tool, outcome="wasted")
+
+
+prefetcher = Prefetcher()
+
+
+def claim_prefetched(tool: str, key: str = ""):
+    """Result prefetched for the current session's call of a tool, or None (see Prefetcher.claim)."""
+    if not PREFETCH_ENABLED:
+        return None
+    return prefetcher.claim_current(tool, key)
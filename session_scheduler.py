@@ -0,0 +1,301 @@
+"""
+Per-session serialization and fair scheduling of agent turns.
+
+When a customer sends several messages in a row, each request would otherwise
+run its own agent turn concurrently against the same session history, wasting
+model calls and interleaving the stored messages. SessionScheduler keeps one
+queue per session so turns of a session run strictly in order, one at a time,
+and hands sessions to its worker threads round-robin so a chatty session can't
+starve the others. With SESSION_MERGE_MESSAGES=true, messages that queue up
+behind a running turn (or arrive within the merge window) are merged into a
+single turn; only the latest message's response carries the answer.
+
+Streamed turns run outside the worker threads but still take their place in
+the session's queue through reserve().
+
+The queues are per process. Turns of one session arriving at different
+gunicorn workers or instances are only serialized when a session_lock is
+given: get_session_scheduler() in index.py uses RedisSessionLock when
+SESSION_LOCK_REDIS_URL is set. Without it, routing a session's requests to
+one process (sticky sessions) is what keeps them in order.
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("session_scheduler")
+
+WORKERS = int(os.getenv("AGENT_WORKER_THREADS", "200"))
+MERGE_MESSAGES = os.getenv("SESSION_MERGE_MESSAGES", "false").lower() == "true"
+# Seconds to wait after a session's first queued message for more to merge
+MERGE_WINDOW_SECONDS = float(os.getenv("SESSION_MERGE_WINDOW", "0"))
+MAX_MERGED_MESSAGES = int(os.getenv("SESSION_MAX_MERGED_MESSAGES", "5"))
+# Seconds a reserved (streamed) turn may hold its session before the next turn runs anyway
+RESERVE_TIMEOUT_SECONDS = float(os.getenv("SESSION_RESERVE_TIMEOUT", "300"))
+# Seconds a turn holds its session's cross-process lock at most, and waits for it
+SESSION_LOCK_TIMEOUT_SECONDS = float(os.getenv("SESSION_LOCK_TIMEOUT", "120"))
+
+
+class RedisSessionLock:
+    """
+    Per-session lock shared by every process using the same Redis.
+
+    Called with a session id, returns a context manager held around the turn.
+    The lock expires after `timeout` seconds so a crashed worker can't block
+    its session; a turn that can't get it within `timeout` runs anyway (and
+    logs a warning) rather than failing the request.
+    """
+
+    def __init__(self, url: str, timeout: float = SESSION_LOCK_TIMEOUT_SECONDS, namespace: str = "sessionlock"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.timeout = timeout
+        self.namespace = namespace
+
+    @contextmanager
+    def __call__(self, session_id: str):
+        lock = self.client.lock(f"{self.namespace}:{session_id}", timeout=self.timeout,
+                                blocking_timeout=self.timeout)
+        try:
+            acquired = lock.acquire()
+        except Exception as e:
+            logger.warning(f"Session lock unavailable for {session_id}: {str(e)}")
+            acquired = False
+        if not acquired:
+            logger.warning(f"Running turn for session {session_id} without its session lock")
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except Exception as e:
+                    # Expired meanwhile, or Redis went away
+                    logger.warning(f"Session lock release failed for {session_id}: {str(e)}")
+
+
+class _Turn:
+    __slots__ = ("message", "format_input", "future", "context", "enqueued_at", "released")
+
+    def __init__(self, message: str, format_input, reserved: bool = False):
+        self.message = message
+        self.format_input = format_input
+        self.future = Future()
+        # Run the turn in the submitter's context (trace, budgets)
+        self.context = contextvars.copy_context()
+        self.enqueued_at = time.monotonic()
+        # Set by Reservation.release(); None for turns the scheduler runs itself
+        self.released = threading.Event() if reserved else None
+
+
+class Reservation:
+    """
+    A session's turn run by the caller instead of the scheduler (e.g. a streamed turn).
+
+    Wait for `ready` (a Future resolving once earlier turns of the session
+    have finished), run the turn, then call release(). Releasing before
+    `ready` resolves gives the place up.
+    """
+
+    def __init__(self, turn: _Turn):
+        self._turn = turn
+        self.ready = turn.future
+
+    def release(self) -> None:
+        self._turn.released.set()
+
+
+class SessionScheduler:
+    """
+    Runs agent turns one at a time per session, round-robin across sessions.
+
+    Args:
+        run_turn: Callable (user_input, session_id, question) -> response,
+                  normally index.query_agent.
+        workers: Turns running at once across all sessions.
+        merge_messages: Merge messages queued behind a running turn into one turn.
+        merge_window: Seconds to hold a session's first message for follow-ups.
+        max_merged: Most messages merged into one turn.
+        session_lock: Callable (session_id) -> context manager held around each
+                      turn, to serialize a session across processes (see
+                      RedisSessionLock).
+        reserve_timeout: Seconds a reservation may hold its session.
+    """
+
+    def __init__(self, run_turn, workers: int = WORKERS, merge_messages: bool = MERGE_MESSAGES,
+                 merge_window: float = MERGE_WINDOW_SECONDS, max_merged: int = MAX_MERGED_MESSAGES,
+                 session_lock=None, reserve_timeout: float = RESERVE_TIMEOUT_SECONDS):
+        self.run_turn = run_turn
+        self.session_lock = session_lock
+        self.reserve_timeout = reserve_timeout
+        self.workers = workers
+        self.merge_messages = merge_messages
+        self.merge_window = merge_window
+        self.max_merged = max(max_merged, 1)
+        self._pending = {}
+        self._ready = deque()
+        self._ready_set = set()
+        self._running = set()
+        self._threads = []
+        self._idle = 0
+        self._cond = threading.Condition()
+        self.turns = 0
+        self.merged_messages = 0
+        self.max_queue_seconds = 0.0
+
+    def submit(self, session_id: str, message: str, format_input=None) -> Future:
+        """
+        Queue a user message for its session.
+
+        Args:
+            session_id: Conversation the message belongs to.
+            message: The user's raw message.
+            format_input: Callable turning the (possibly merged) message into
+                          the agent input.
+
+        Returns:
+            Future: Resolves to the agent response of the turn that handled the message.
+        """
+        turn = _Turn(message, format_input)
+        self._enqueue(session_id, turn)
+        return turn.future
+
+    def reserve(self, session_id: str) -> Reservation:
+        """
+        Take a place in the session's queue for a turn the caller runs itself.
+
+        The reservation holds one worker thread while the session is its, and
+        is never merged with queued messages.
+        """
+        turn = _Turn(None, None, reserved=True)
+        self._enqueue(session_id, turn)
+        return Reservation(turn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": len(self._threads),
+                "idle_workers": self._idle,
+                "running_sessions": len(self._running),
+                "waiting_sessions": len(self._ready),
+                "pending_messages": sum(len(q) for q in self._pending.values()),
+                "turns": self.turns,
+                "merged_messages": self.merged_messages,
+                "max_queue_seconds": self.max_queue_seconds,
+            }
+
+    def _enqueue(self, session_id: str, turn: _Turn) -> None:
+        with self._cond:
+            self._pending.setdefault(session_id, deque()).append(turn)
+            if session_id not in self._running and session_id not in self._ready_set:
+                self._ready.append(session_id)
+                self._ready_set.add(session_id)
+            if len(self._ready) > self._idle and len(self._threads) < self.workers:
+                self._spawn()
+            self._cond.notify()
+
+    def _spawn(self) -> None:
+        thread = threading.Thread(target=self._work, name=f"agent-turn-{len(self._threads)}", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _take(self, session_id: str) -> list:
+        queue = self._pending[session_id]
+        turns = [queue.popleft()]
+        self._merge(queue, turns)
+        return turns
+
+    def _merge(self, queue: deque, turns: list) -> None:
+        # Caller must hold self._cond; reserved turns are never merged
+        while (self.merge_messages and queue and len(turns) < self.max_merged
+               and turns[0].released is None and queue[0].released is None):
+            turns.append(queue.popleft())
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                self._idle += 1
+                while not self._ready:
+                    self._cond.wait()
+                self._idle -= 1
+                session_id = self._ready.popleft()
+                self._ready_set.discard(session_id)
+                self._running.add(session_id)
+                turns = self._take(session_id)
+
+            if self.merge_messages and self.merge_window > 0 and len(turns) < self.max_merged \
+                    and turns[0].released is None:
+                wait = turns[0].enqueued_at + self.merge_window - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                with self._cond:
+                    self._merge(self._pending[session_id], turns)
+
+            try:
+                with self.session_lock(session_id) if self.session_lock else nullcontext():
+                    if turns[0].released is not None:
+                        self._hold(session_id, turns[0])
+                    else:
+                        self._run(session_id, turns)
+            finally:
+                with self._cond:
+                    self._running.discard(session_id)
+                    if self._pending.get(session_id):
+                        # Back of the line: other sessions get a turn first
+                        self._ready.append(session_id)
+                        self._ready_set.add(session_id)
+                        self._cond.notify()
+                    else:
+                        self._pending.pop(session_id, None)
+
+    def _hold(self, session_id: str, turn: _Turn) -> None:
+        if not turn.future.set_running_or_notify_cancel():
+            # The caller stopped waiting for its place
+            return
+        with self._cond:
+            self.turns += 1
+            self.max_queue_seconds = max(self.max_queue_seconds, time.monotonic() - turn.enqueued_at)
+        turn.future.set_result(None)
+        if not turn.released.wait(self.reserve_timeout):
+            logger.warning(f"Reserved turn for session {session_id} still running after "
+                           f"{self.reserve_timeout:g}s; letting the next turn start")
+
+    def _run(self, session_id: str, turns: list) -> None:
+        started = time.monotonic()
+        queued = started - turns[0].enqueued_at
+        with self._cond:
+            self.turns += 1
+            self.merged_messages += len(turns) - 1
+            self.max_queue_seconds = max(self.max_queue_seconds, queued)
+        message = "\n".join(turn.message for turn in turns)
+        last = turns[-1]
+        format_input = next((turn.format_input for turn in reversed(turns) if turn.format_input), None)
+        user_input = format_input(message) if format_input else message
+        if len(turns) > 1:
+            logger.info(f"Merged {len(turns)} messages into one turn for session {session_id}")
+        try:
+            # Merged turns aren't a single question, so they bypass the answer cache
+            response = turns[0].context.run(
+                self.run_turn, user_input, session_id, message if len(turns) == 1 else None
+            )
+        except BaseException as e:
+            for turn in turns:
+                turn.future.set_exception(e)
+            return
+        for turn in turns:
+            result = response
+            if isinstance(response, dict) and len(turns) > 1:
+                result = {**response, "session_turn": {
+                    "merged_messages": len(turns),
+                    # Only the latest message's response needs to be delivered
+                    "primary": turn is last,
+                    "queued_ms": round((started - turn.enqueued_at) * 1000, 1),
+                }}
+            turn.future.set_result(result)
@@ -0,0 +1,114 @@
+"""
+Request coalescing for identical concurrent tool calls.
+
+At peak time many conversations call the same tool with the same arguments
+within the same second (consulta_productos_menu("pizza"), imagenes_menu()).
+SingleFlight lets the first caller (the leader) run the call while identical
+calls arriving before it finishes wait for its result instead of issuing
+their own backend request. Calls are identical when they share the tool name
+and the tool cache's normalized argument key.
+"""
+
+import functools
+import inspect
+import os
+import threading
+
+from telemetry import registry
+from tool_cache import cache_key
+
+SINGLE_FLIGHT_ENABLED = os.getenv("TOOL_SINGLE_FLIGHT", "true").lower() == "true"
+
+coalesced_calls_total = registry.counter(
+    "agent_tool_coalesced_calls_total", "Tool calls answered by another caller's in-flight request")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls sharing a key into one execution."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs), or wait for the identical call already in flight.
+
+        Returns:
+            tuple: (result, shared) where shared is True when the result came
+                   from another caller's execution. Exceptions raised by the
+                   leader are re-raised in every waiter.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "coalesced_ratio": self.coalesced / total if total else 0.0,
+            }
+
+
+tool_flights = SingleFlight()
+
+
+def coalesced(func):
+    """
+    Share one execution among identical concurrent calls of a tool function.
+
+    Like traced_tool, the wrapper keeps the function's name, docstring and
+    signature for the agent's tool description.
+    """
+    if not SINGLE_FLIGHT_ENABLED:
+        return func
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        result, shared = tool_flights.do(cache_key(func.__name__, dict(bound.arguments)), func, *args, **kwargs)
+        if shared:
+            coalesced_calls_total.inc(tool=func.__name__)
+        return result
+
+    return wrapper
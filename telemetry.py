@@ -0,0 +1,443 @@
+"""
+Per-request latency tracing and Prometheus metrics for the agent API.
+
+Spans cover request parsing, history load/write, every LLM call (with prompt
+and completion token counts) and every tool invocation (args hash, status,
+response bytes). Finished spans are:
+
+- aggregated into Prometheus histograms rendered by render_prometheus() and
+  served on /metrics,
+- handed to any registered span exporter (InMemorySpanExporter for tests),
+- mirrored as OpenTelemetry spans when opentelemetry-api is installed, so an
+  SDK TracerProvider (see configure_tracing) can export them anywhere.
+"""
+
+import bisect
+import contextvars
+import functools
+import hashlib
+import importlib.util
+import inspect
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import orjson
+
+logger = logging.getLogger("telemetry")
+
+OTEL_AVAILABLE = importlib.util.find_spec("opentelemetry") is not None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+TOKEN_BUCKETS = (64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with optional labels."""
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(float(bound))),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and stats collectors, and renders the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = {}
+
+    def histogram(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, component: str, collect) -> None:
+        """
+        Expose a component's stats() dict as gauges.
+
+        Numeric (and boolean) values are rendered as
+        agent_component_stat{component="...",stat="..."}; other values are skipped.
+        """
+        self.collectors[component] = collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.append("# HELP agent_component_stat Point-in-time stats reported by agent components")
+        lines.append("# TYPE agent_component_stat gauge")
+        for component, collect in sorted(self.collectors.items()):
+            try:
+                stats = collect() or {}
+            except Exception as e:
+                logger.warning(f"Stats collector {component} failed: {str(e)}")
+                continue
+            for stat, value in sorted(stats.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    lines.append(f"agent_component_stat{_format_labels((('component', component), ('stat', stat)))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "agent_request_duration_seconds", "End-to-end chat request latency")
+stage_duration = registry.histogram(
+    "agent_stage_duration_seconds", "Latency of each traced stage (parse, history, llm, tool.*)")
+tool_response_bytes = registry.histogram(
+    "agent_tool_response_bytes", "Serialized size of tool results", BYTES_BUCKETS)
+llm_tokens = registry.histogram(
+    "agent_llm_tokens", "Tokens per LLM call by kind (prompt/completion)", TOKEN_BUCKETS)
+llm_tokens_total = registry.counter(
+    "agent_llm_tokens_total", "Tokens used by LLM calls by kind (prompt/completion)")
+tool_calls_total = registry.counter(
+    "agent_tool_calls_total", "Tool invocations by tool and status")
+
+
+def render_prometheus() -> str:
+    return registry.render()
+
+
+# ---------------------------------------------------------------------------
+# Tracing
+# ---------------------------------------------------------------------------
+
+class Span:
+    """A timed unit of work; finished spans are exported and aggregated."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "status",
+                 "start_time", "end_time", "_started", "_otel")
+
+    def __init__(self, name: str, parent=None, attributes: dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self.end_time = None
+        self._started = time.perf_counter()
+        self._otel = _start_otel_span(name, parent, self.attributes)
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time - self.start_time) if self.end_time else time.perf_counter() - self._started
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+        if self._otel is not None:
+            self._otel.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+
+    def set_error(self, error) -> None:
+        self.status = "error"
+        self.set_attribute("error", str(error))
+
+    def end(self) -> None:
+        if self.end_time is not None:
+            return
+        elapsed = time.perf_counter() - self._started
+        self.end_time = self.start_time + elapsed
+        if self._otel is not None:
+            if self.status == "error":
+                from opentelemetry.trace import Status, StatusCode
+
+                self._otel.set_status(Status(StatusCode.ERROR))
+            self._otel.end()
+        stage_duration.observe(elapsed, stage=self.name)
+        for exporter in list(_exporters):
+            try:
+                exporter.export(self)
+            except Exception as e:
+                logger.warning(f"Span exporter failed: {str(e)}")
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class InMemorySpanExporter:
+    """Collects finished spans in memory, for tests and debugging."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def names(self) -> list:
+        with self._lock:
+            return [span.name for span in self.spans]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+_exporters = []
+
+
+def add_span_exporter(exporter) -> None:
+    _exporters.append(exporter)
+
+
+def remove_span_exporter(exporter) -> None:
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Trace a block as a child of the current span (or as a new trace)."""
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced_request(endpoint: str):
+    """
+    Decorator for view handlers (sync or async): traces the request as the root
+    span and records it in agent_request_duration_seconds.
+    """
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(*args, **kwargs):
+                with span("chat.request", endpoint=endpoint) as current:
+                    response = await handler(*args, **kwargs)
+                    current.set_attribute("status_code", getattr(response, "status_code", 0))
+                request_duration.observe(current.duration, endpoint=endpoint)
+                return response
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            with span("chat.request", endpoint=endpoint) as current:
+                response = handler(*args, **kwargs)
+                current.set_attribute("status_code", getattr(response, "status_code", 0))
+            request_duration.observe(current.duration, endpoint=endpoint)
+            return response
+        return wrapper
+
+    return decorator
+
+
+def start_span(name: str, parent=None, **attributes) -> Span:
+    """Start a span without making it current (for callback-style APIs)."""
+    return Span(name, parent if parent is not None else _current_span.get(), attributes)
+
+
+def _start_otel_span(name: str, parent, attributes: dict):
+    if not OTEL_AVAILABLE:
+        return None
+    from opentelemetry import trace
+
+    context = trace.set_span_in_context(parent._otel) if parent is not None and parent._otel is not None else None
+    otel_span = trace.get_tracer("vertex_agent").start_span(name, context=context)
+    for key, value in attributes.items():
+        otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+    return otel_span
+
+
+def configure_tracing(exporter) -> None:
+    """
+    Install an OpenTelemetry SDK TracerProvider exporting to the given exporter.
+
+    Pass e.g. an OTLPSpanExporter in production or the SDK's
+    InMemorySpanExporter in tests. Requires opentelemetry-sdk.
+    """
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider()
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+
+# ---------------------------------------------------------------------------
+# Tools and LLM calls
+# ---------------------------------------------------------------------------
+
+def args_hash(args: dict) -> str:
+    return hashlib.sha1(orjson.dumps(args, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()[:12]
+
+
+def traced_tool(func):
+    """
+    Trace every invocation of a tool function.
+
+    The wrapper keeps the function's name, docstring and signature, which the
+    agent uses to describe the tool to the model.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        with span(f"tool.{func.__name__}", tool=func.__name__, args_hash=args_hash(bound.arguments)) as current:
+            result = func(*args, **kwargs)
+            size = len(orjson.dumps(result, default=str))
+            status = "error" if isinstance(result, dict) and "error" in result else "ok"
+            current.set_attribute("bytes", size)
+            current.set_attribute("status", status)
+            if status == "error":
+                current.status = "error"
+            tool_response_bytes.observe(size, tool=func.__name__)
+            tool_calls_total.inc(tool=func.__name__, status=status)
+            return result
+
+    return wrapper
+
+
+def token_usage(response) -> tuple:
+    """(prompt_tokens, completion_tokens) reported for an LLMResult, or (None, None)."""
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens"), usage.get("output_tokens")
+    usage = (getattr(response, "llm_output", None) or {}).get("usage_metadata") or {}
+    if usage:
+        return (usage.get("prompt_token_count"), usage.get("candidates_token_count"))
+    return None, None
+
+
+def llm_callback_handler():
+    """LangChain callback handler that records a span per LLM call."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class LLMTracingHandler(BaseCallbackHandler):
+        def __init__(self):
+            self._spans = {}
+            self._parent = _current_span.get()
+
+        def _start(self, run_id, serialized):
+            name = (serialized or {}).get("name") or "llm"
+            self._spans[run_id] = start_span("llm", parent=self._parent, model=name)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._start(run_id, serialized)
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(run_id, serialized)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            current = self._spans.pop(run_id, None)
+            if current is None:
+                return
+            prompt_tokens, completion_tokens = token_usage(response)
+            if prompt_tokens is not None:
+                current.set_attribute("prompt_tokens", prompt_tokens)
+                llm_tokens.observe(prompt_tokens, kind="prompt")
+                llm_tokens_total.inc(prompt_tokens, kind="prompt")
+            if completion_tokens is not None:
+                current.set_attribute("completion_tokens", completion_tokens)
+                llm_tokens.observe(completion_tokens, kind="completion")
+                llm_tokens_total.inc(completion_tokens, kind="completion")
+            current.end()
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            current = self._spans.pop(run_id, None)
+            if current is not None:
+                current.set_error(error)
+                current.end()
+
+    return LLMTracingHandler()
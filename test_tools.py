@@ -10,7 +10,7 @@ from index import (
     imagenes_menu,
     consulta_atributos,
     consulta_productos_menu,
-    agent
+    get_agent
 )
 
 # Configure logging
@@ -146,7 +146,7 @@ def test_agent_queries():
             elif "atributos" in prompt.lower() or "extras" in prompt.lower():
                 logger.info("Expected tool: consulta_atributos")
             
-            response = agent.query(input=prompt)
+            response = get_agent().query(input=prompt)
             
             # Log the response
             if hasattr(response, 'text'):
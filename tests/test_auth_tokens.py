@@ -0,0 +1,48 @@
+import time
+
+from auth_tokens import FakeIssuer, TokenProvider, token_expiry
+
+
+def test_token_is_cached_per_audience():
+    issuer = FakeIssuer()
+    provider = TokenProvider(issuer, background_refresh=False)
+
+    first = provider.get_token("https://a.run.app")
+    assert provider.get_token("https://a.run.app") == first
+    provider.get_token("https://b.run.app")
+
+    assert issuer.calls == ["https://a.run.app", "https://b.run.app"]
+    assert provider.stats()["hits"] == 1
+
+
+def test_background_refresh_runs_before_the_token_goes_stale():
+    issuer = FakeIssuer(lifetime=3)
+    provider = TokenProvider(issuer, refresh_margin=1, background_margin=2)
+    try:
+        first = provider.get_token("https://a.run.app")
+        time.sleep(1.5)
+        # Refreshed by the timer while the first token was still fresh
+        assert len(issuer.calls) == 2
+        second = provider.get_token("https://a.run.app")
+        assert second != first
+        assert token_expiry(second) > token_expiry(first)
+        assert provider.stats()["misses"] == 1
+    finally:
+        provider.close()
+
+
+def test_failed_refresh_keeps_serving_a_token_that_has_not_expired():
+    issuer = FakeIssuer(lifetime=2)
+    provider = TokenProvider(issuer, refresh_margin=1.5, background_refresh=False)
+    token = provider.get_token("https://a.run.app")
+    time.sleep(0.6)
+
+    def failing(audience):
+        raise RuntimeError("metadata server unavailable")
+
+    provider.issuer = failing
+    assert provider.get_token("https://a.run.app") == token
+    assert provider.stats()["refresh_failures"] == 1
+    # Not retried again before REFRESH_RETRY_SECONDS
+    assert provider.get_token("https://a.run.app") == token
+    assert provider.stats()["refresh_failures"] == 1
@@ -0,0 +1,116 @@
+import pytest
+
+from backend_guard import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AdaptiveLimiter,
+    BackendGuard,
+    BackendUnavailableError,
+    CircuitBreaker,
+)
+
+
+def fail():
+    raise RuntimeError("503")
+
+
+def test_breaker_opens_after_consecutive_failures():
+    guard = BackendGuard("menu", breaker=CircuitBreaker(consecutive_failures=3, open_seconds=60))
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            guard.call(fail)
+
+    assert guard.breaker.state == OPEN
+    with pytest.raises(BackendUnavailableError) as rejected:
+        guard.call(lambda: {"success": True})
+    assert rejected.value.reason == "circuit_open"
+    assert rejected.value.retry_after > 0
+
+
+def test_breaker_opens_on_failure_rate():
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, consecutive_failures=10)
+    for success in (True, False, True, False):
+        breaker.record(success)
+
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_one_probe_and_closes_on_success():
+    breaker = CircuitBreaker(consecutive_failures=1, open_seconds=0)
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_with_longer_cooldown():
+    breaker = CircuitBreaker(consecutive_failures=1, open_seconds=0.01, max_open_seconds=1)
+    breaker.record(False)
+    breaker._opened_at -= 1
+
+    assert breaker.allow()
+    breaker.record(False)
+
+    assert breaker.state == OPEN
+    assert breaker.opens == 2
+    assert breaker._cooldown == pytest.approx(0.02)
+    assert not breaker.allow()
+
+
+def test_limiter_rejects_above_limit():
+    limiter = AdaptiveLimiter(initial=2)
+
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+
+def test_limiter_decreases_on_failure_and_slow_calls():
+    limiter = AdaptiveLimiter(initial=10, min_limit=2, latency_target=1.0, decrease=0.5)
+
+    limiter.try_acquire()
+    limiter.release(success=False, latency=0.1)
+    assert limiter.limit == 5
+
+    limiter.try_acquire()
+    limiter.release(success=True, latency=2.0)
+    assert limiter.limit == 2.5
+
+    limiter.try_acquire()
+    limiter.release(success=False, latency=0.1)
+    assert limiter.limit == 2
+
+
+def test_limiter_grows_about_one_per_round_of_fast_successes():
+    limiter = AdaptiveLimiter(initial=4, max_limit=5, latency_target=1.0)
+
+    for _ in range(4):
+        limiter.try_acquire()
+        limiter.release(success=True, latency=0.1)
+    assert 4.9 < limiter.limit < 5
+
+    for _ in range(10):
+        limiter.try_acquire()
+        limiter.release(success=True, latency=0.1)
+    assert limiter.limit == 5
+
+
+def test_overloaded_call_gives_back_the_probe():
+    breaker = CircuitBreaker(consecutive_failures=1, open_seconds=0)
+    breaker.record(False)
+    limiter = AdaptiveLimiter(initial=1)
+    limiter.try_acquire()
+    guard = BackendGuard("menu", breaker=breaker, limiter=limiter)
+
+    with pytest.raises(BackendUnavailableError) as rejected:
+        guard.call(lambda: {"success": True})
+
+    assert rejected.value.reason == "overloaded"
+    assert breaker.allow()
@@ -0,0 +1,116 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from history_store import (  # noqa: E402
+    HistoryStore,
+    MemoryHistoryBackend,
+    QueuedHistoryBackend,
+    commit_history_document,
+    set_history_store,
+)
+
+
+def test_flush_commits_all_dirty_sessions_in_one_batch():
+    backend = MemoryHistoryBackend()
+    store = HistoryStore(backend)
+    for session_id in ("s1", "s2", "s3"):
+        store.append(session_id, store.read(session_id), [{"n": 1}])
+        store.append(session_id, store.read(session_id), [{"n": 2}])
+
+    assert store.flush() == 3
+    assert backend.commits == 1
+    assert all(backend.documents[s]["messages"] == [{"n": 1}, {"n": 2}] for s in ("s1", "s2", "s3"))
+    assert store.flush() == 0
+
+
+def test_each_commit_bumps_the_version():
+    backend = MemoryHistoryBackend()
+    store = HistoryStore(backend)
+    store.append("s1", store.read("s1"), [{"n": 1}])
+    store.flush()
+    store.append("s1", store.read("s1"), [{"n": 2}])
+    store.flush()
+
+    assert backend.version("s1") == 2
+    assert store.read("s1")["version"] == 2
+
+
+def test_workers_sharing_a_session_keep_each_others_messages():
+    backend = MemoryHistoryBackend()
+    first, second = HistoryStore(backend), HistoryStore(backend)
+    first.append("s1", first.read("s1"), [{"from": "first"}])
+    second.append("s1", second.read("s1"), [{"from": "second"}])
+    first.flush()
+    second.flush()
+
+    assert backend.documents["s1"]["messages"] == [{"from": "first"}, {"from": "second"}]
+    assert backend.version("s1") == 2
+
+
+def test_failed_flush_is_retried_without_duplicating_messages():
+    backend = MemoryHistoryBackend()
+    store = HistoryStore(backend)
+    commit = backend.commit
+
+    def applied_then_failed(writes):
+        commit(writes)
+        raise ConnectionError("deadline exceeded")
+
+    backend.commit = applied_then_failed
+    store.append("s1", store.read("s1"), [{"n": 1}])
+    assert store.flush() == 0
+    backend.commit = commit
+    store.append("s1", store.read("s1"), [{"n": 2}])
+
+    assert store.flush() == 1
+    assert backend.documents["s1"]["messages"] == [{"n": 1}, {"n": 2}]
+
+
+class FakeJobQueue:
+    """enqueue() stand-in keeping one job per idempotency key, like agent_api.jobs."""
+
+    def __init__(self):
+        self.jobs = {}
+
+    def enqueue(self, task_name, payload, *, idempotency_key):
+        self.jobs.setdefault(idempotency_key, payload)
+
+    def run_all(self):
+        jobs, self.jobs = list(self.jobs.values()), {}
+        return [commit_history_document(**payload) for payload in jobs]
+
+
+@pytest.fixture
+def queued_store():
+    backend = MemoryHistoryBackend()
+    queue = FakeJobQueue()
+    store = HistoryStore(QueuedHistoryBackend(backend, queue.enqueue, "project", "chats"))
+    set_history_store(store)
+    yield store, backend, queue
+    set_history_store(None)
+
+
+def test_queued_flushes_after_a_reload_are_not_lost(queued_store):
+    store, backend, queue = queued_store
+    store.append("s1", store.read("s1"), [{"n": 1}])
+    store.flush()
+    # Evicted before the job ran: the reload sees the same stored version
+    store._drop("s1")
+    store.append("s1", store.read("s1"), [{"n": 2}])
+    store.flush()
+
+    assert len(queue.jobs) == 2
+    assert queue.run_all() == [True, True]
+    assert backend.documents["s1"]["messages"] == [{"n": 1}, {"n": 2}]
+
+
+def test_retried_history_job_is_applied_once(queued_store):
+    store, backend, queue = queued_store
+    store.append("s1", store.read("s1"), [{"n": 1}])
+    store.flush()
+    payload = next(iter(queue.jobs.values()))
+
+    assert commit_history_document(**payload) is True
+    assert commit_history_document(**payload) is False
+    assert backend.documents["s1"]["messages"] == [{"n": 1}]
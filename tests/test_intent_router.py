@@ -0,0 +1,62 @@
+import logging
+
+from intent_router import IntentRouter
+
+PIZZAS = {
+    "success": True,
+    "results": [
+        {"productName": "Pizza Hawaiana", "categoryName": "Pizzas", "price": 9.5},
+        {"productName": "Pizza Suprema", "categoryName": "Pizzas", "price": 11},
+    ],
+}
+
+
+def router(**tools):
+    return IntentRouter(tools, mode="on", threshold=0.0)
+
+
+def test_category_lookup_is_answered_from_the_template():
+    route = router(consulta_productos_menu=lambda *args: PIZZAS).route("que hay en la categoria pizzas")
+
+    assert route.intent == "category"
+    assert route.answer.splitlines() == [
+        "En Pizzas tenemos:", "- Pizza Hawaiana: $9.5", "- Pizza Suprema: $11", "¿Te gustaría ordenar alguno?"]
+
+
+def test_unexpected_product_schema_goes_to_the_agent_and_warns(caplog):
+    items = {"success": True, "items": PIZZAS["results"]}
+
+    with caplog.at_level(logging.WARNING, logger="intent_router"):
+        route = router(consulta_productos_menu=lambda *args: items).route("que hay en la categoria pizzas")
+
+    assert route is None
+    assert "no usable results for the category template" in caplog.text
+    assert caplog.records[-1].result_keys == ["items", "success"]
+
+
+def test_products_without_names_warn(caplog):
+    unnamed = {"success": True, "results": [{"name": "Pizza Hawaiana"}]}
+
+    with caplog.at_level(logging.WARNING, logger="intent_router"):
+        assert router(consulta_productos_menu=lambda *args: unnamed).route("que hay en la categoria pizzas") is None
+
+    assert "results[].productName" in caplog.text
+
+
+def test_empty_results_and_errors_go_to_the_agent_quietly(caplog):
+    with caplog.at_level(logging.WARNING, logger="intent_router"):
+        assert router(consulta_productos_menu=lambda *args: {"success": True, "results": []}).route(
+            "que hay en la categoria pizzas") is None
+        assert router(imagenes_menu=lambda: {"error": "timeout"}).route("quiero ver el menu") is None
+
+    assert not caplog.records
+
+
+def test_images_without_urls_warn(caplog):
+    with caplog.at_level(logging.WARNING, logger="intent_router"):
+        assert router(imagenes_menu=lambda: {"images": [{"link": "https://x/menu.png"}]}).route(
+            "quiero ver el menu") is None
+        assert router(imagenes_menu=lambda: {"data": []}).route("quiero ver el menu") is None
+
+    assert "images[].url" in caplog.records[0].getMessage()
+    assert "no usable images" in caplog.records[1].getMessage()
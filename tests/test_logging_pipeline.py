@@ -0,0 +1,39 @@
+import copy
+import logging
+import logging.config
+
+import orjson
+import pytest
+
+from agent_api.logging_pipeline import AsyncQueueHandler
+from vertex_api import settings
+
+
+@pytest.fixture
+def restore_root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    for handler in root.handlers:
+        if handler not in handlers:
+            handler.close()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_settings_logging_configures_queue_handler(tmp_path, restore_root_logger):
+    config = copy.deepcopy(settings.LOGGING)
+    config["handlers"]["queue"]["filename"] = str(tmp_path / "api.log")
+    config["handlers"]["queue"]["console"] = False
+
+    logging.config.dictConfig(config)
+
+    handler = next(h for h in restore_root_logger.handlers if isinstance(h, AsyncQueueHandler))
+    assert handler.queue.maxsize == config["handlers"]["queue"]["queue_size"]
+    logging.getLogger("agent_api.test").warning("hola %s", "mundo", extra={"session_id": "s1"})
+    handler.close()
+
+    record = orjson.loads((tmp_path / "api.log").read_text().splitlines()[-1])
+    assert record["message"] == "hola mundo"
+    assert record["level"] == "WARNING"
+    assert record["session_id"] == "s1"
@@ -0,0 +1,49 @@
+from menu_index import MenuEngine, MenuIndex
+
+CATALOG = {
+    "products": [
+        {"productName": "Pizza Hawaiana", "categoryName": "Pizzas", "price": "9.50"},
+        {"productName": "Pizza Suprema", "categoryName": "Pizzas", "price": 11},
+        {"productName": "Café Americano", "categoryName": "CAFES", "price": 2.25},
+    ],
+    "attributes": {"Pizzas": {"success": True, "attributes": [{"name": "Tamaño", "values": ["Mediana", "Grande"]}]}},
+}
+
+
+def test_search_modes():
+    index = MenuIndex(CATALOG)
+
+    assert [p["productName"] for p in index.search("pizza")["results"]] == ["Pizza Hawaiana", "Pizza Suprema"]
+    assert index.search("cafe", "categories")["results"][0]["productName"] == "Café Americano"
+    assert [p["productName"] for p in index.search("10", "price")["results"]] == ["Pizza Hawaiana", "Café Americano"]
+    assert index.search("", "categories")["results"] == []
+
+
+def test_total_results_counts_matches_before_the_limit():
+    result = MenuIndex(CATALOG).search("pizza", max_results=1)
+
+    assert result["totalResults"] == 2
+    assert len(result["results"]) == 1
+
+
+def test_attributes_by_category():
+    index = MenuIndex(CATALOG)
+
+    assert index.attributes_for("pizzas") == CATALOG["attributes"]["Pizzas"]
+    assert index.attributes_for("Bebidas") is None
+
+
+def test_failed_refresh_keeps_the_previous_snapshot():
+    catalogs = [CATALOG]
+
+    def loader():
+        if not catalogs:
+            raise RuntimeError("503")
+        return catalogs.pop()
+
+    engine = MenuEngine(loader)
+    assert engine.refresh()
+    assert not engine.refresh()
+    assert engine.ready
+    assert engine.search("suprema")["results"][0]["price"] == 11
+    assert engine.stats()["refresh_failures"] == 1
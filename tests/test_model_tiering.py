@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+from model_tiering import ModelTiering, is_complex_order, tool_rounds
+
+
+def step(observation, message=None):
+    action = SimpleNamespace(tool="consulta_productos_menu", message_log=[message] if message else [])
+    return action, observation
+
+
+def test_routine_calls_use_the_fast_tier():
+    tiering = ModelTiering(models={}, step_params={})
+
+    assert tiering.select({"input": "¿Qué pizzas tienen?"}) == ("fast", "tool_selection", "default")
+    assert tiering.select({"input": "¿Qué pizzas tienen?", "intermediate_steps": [step({"success": True})]}) == (
+        "fast", "answer", "default")
+
+
+def test_complex_orders_escalate():
+    tiering = ModelTiering(models={}, step_params={})
+
+    assert is_complex_order("Quiero 2 pizzas hawaianas y una soda para llevar")
+    assert not is_complex_order("¿Tienen 2 tamaños de pizza?")
+    assert tiering.select({"input": "Quiero 2 pizzas y tres cafés"}) == ("strong", "tool_selection", "complex_order")
+    assert tiering.select({"input": "x" * 300})[2] == "complex_order"
+
+
+def test_tool_errors_escalate():
+    tiering = ModelTiering(models={}, step_params={})
+
+    assert tiering.select({"input": "hola", "intermediate_steps": [step({"error": "timeout"})]})[::2] == (
+        "strong", "tool_error")
+    assert tiering.select({"input": "hola", "intermediate_steps": [step('{"error": "timeout"}')]})[2] == "tool_error"
+
+
+def test_many_tool_rounds_escalate():
+    tiering = ModelTiering(models={}, step_params={}, escalate_after_steps=2)
+    shared = object()
+    parallel = [step({"success": True}, shared), step({"success": True}, shared)]
+
+    assert tool_rounds(parallel) == 1
+    assert tiering.select({"input": "hola", "intermediate_steps": parallel})[0] == "fast"
+    rounds = parallel + [step({"success": True}, object())]
+    assert tiering.select({"input": "hola", "intermediate_steps": rounds}) == ("strong", "answer", "many_steps")
+
+
+def test_agent_routes_calls_to_the_selected_fake_model():
+    pytest.importorskip("langchain_core")
+    from langchain_core.messages import HumanMessage
+    from langchain_core.runnables import RunnableLambda
+
+    from benchmarks.fake_model import ScriptedChatModel
+
+    def scripted(reply):
+        return ScriptedChatModel(traces=[{"prompt": "hola", "steps": [{"content": reply}]}],
+                                 latency_ms=0, latency_sigma=0)
+
+    tiering = ModelTiering(models={"fast": scripted("rápido")}, step_params={})
+    agent = tiering.build_agent(
+        scripted("completo"),
+        prompt=RunnableLambda(lambda inputs: [HumanMessage(inputs["input"])]),
+        output_parser=RunnableLambda(lambda message: message.content),
+    )
+
+    assert agent.invoke({"input": "hola", "intermediate_steps": []}) == "rápido"
+    assert agent.invoke({"input": "hola", "intermediate_steps": [step({"error": "timeout"})]}) == "completo"
+
+    stats = tiering.stats()
+    assert (stats["fast_calls"], stats["strong_calls"], stats["escalations"]) == (1, 1, 1)
+    assert stats["fast_prompt_tokens"] > 0
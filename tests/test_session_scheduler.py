@@ -0,0 +1,76 @@
+import threading
+import time
+
+from session_scheduler import SessionScheduler
+
+
+def test_turns_of_a_session_run_in_order_one_at_a_time():
+    running = []
+    order = []
+    lock = threading.Lock()
+
+    def run_turn(user_input, session_id, question):
+        with lock:
+            running.append(session_id)
+            assert running.count(session_id) == 1
+        time.sleep(0.01)
+        with lock:
+            running.remove(session_id)
+            order.append(user_input)
+        return {"output": user_input}
+
+    scheduler = SessionScheduler(run_turn, workers=4)
+    futures = [scheduler.submit("s1", f"m{i}") for i in range(5)]
+
+    assert [f.result(timeout=5)["output"] for f in futures] == [f"m{i}" for i in range(5)]
+    assert order == [f"m{i}" for i in range(5)]
+
+
+def test_messages_are_not_merged_by_default():
+    release = threading.Event()
+
+    def run_turn(user_input, session_id, question):
+        release.wait(5)
+        return {"output": user_input}
+
+    scheduler = SessionScheduler(run_turn, workers=2)
+    first = scheduler.submit("s1", "hola")
+    rest = [scheduler.submit("s1", "una pizza"), scheduler.submit("s1", "grande")]
+    release.set()
+
+    assert first.result(timeout=5)["output"] == "hola"
+    assert [f.result(timeout=5) for f in rest] == [{"output": "una pizza"}, {"output": "grande"}]
+
+
+def test_merged_messages_mark_only_the_latest_as_primary():
+    started = threading.Event()
+    release = threading.Event()
+
+    def run_turn(user_input, session_id, question):
+        started.set()
+        release.wait(5)
+        return {"output": f"re: {user_input}"}
+
+    scheduler = SessionScheduler(run_turn, workers=2, merge_messages=True)
+    first = scheduler.submit("s1", "hola")
+    started.wait(5)
+    merged = [scheduler.submit("s1", "una pizza"), scheduler.submit("s1", "grande")]
+    release.set()
+    first.result(timeout=5)
+
+    results = [f.result(timeout=5) for f in merged]
+    assert [r["session_turn"]["primary"] for r in results] == [False, True]
+    assert results[1]["output"] == "re: una pizza\ngrande"
+
+
+def test_reserved_turn_holds_its_session():
+    ran = threading.Event()
+    scheduler = SessionScheduler(lambda user_input, session_id, question: ran.set() or {}, workers=2)
+    reservation = scheduler.reserve("s1")
+    reservation.ready.result(timeout=5)
+    queued = scheduler.submit("s1", "hola")
+
+    assert not ran.wait(0.1)
+    reservation.release()
+    queued.result(timeout=5)
+    assert ran.is_set()
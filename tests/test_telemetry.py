@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from telemetry import (
+    InMemorySpanExporter,
+    add_span_exporter,
+    remove_span_exporter,
+    render_prometheus,
+    span,
+    traced_request,
+    traced_tool,
+)
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemorySpanExporter()
+    add_span_exporter(exporter)
+    yield exporter
+    remove_span_exporter(exporter)
+
+
+class FakeResponse:
+    status_code = 201
+
+
+def test_nested_spans_share_the_trace(exporter):
+    with span("chat.request", endpoint="chat") as root:
+        with span("history.load", session_id="s1") as child:
+            child.set_attribute("messages", 4)
+
+    assert exporter.names() == ["history.load", "chat.request"]
+    assert child.trace_id == root.trace_id
+    assert child.parent_id == root.span_id
+    assert child.attributes == {"session_id": "s1", "messages": 4}
+    assert root.attributes == {"endpoint": "chat"}
+
+
+def test_span_records_errors(exporter):
+    with pytest.raises(ValueError):
+        with span("llm"):
+            raise ValueError("quota")
+
+    [failed] = exporter.spans
+    assert failed.status == "error"
+    assert failed.attributes["error"] == "quota"
+
+
+def test_traced_tool_span_attributes(exporter):
+    @traced_tool
+    def consulta_atributos(category_name: str) -> dict:
+        return {"success": True, "categoryName": category_name}
+
+    @traced_tool
+    def imagenes_menu() -> dict:
+        return {"error": "timeout"}
+
+    consulta_atributos("Pizzas")
+    imagenes_menu()
+
+    ok, failed = exporter.spans
+    assert ok.name == "tool.consulta_atributos"
+    assert ok.attributes["tool"] == "consulta_atributos"
+    assert ok.attributes["status"] == "ok"
+    assert ok.attributes["bytes"] > 0
+    assert len(ok.attributes["args_hash"]) == 12
+    assert failed.name == "tool.imagenes_menu"
+    assert failed.status == "error"
+    assert 'agent_tool_calls_total{status="error",tool="imagenes_menu"}' in render_prometheus()
+
+
+def test_traced_request_wraps_sync_and_async_handlers(exporter):
+    @traced_request("chat-sync")
+    def sync_handler():
+        with span("request.parse"):
+            return FakeResponse()
+
+    @traced_request("chat")
+    async def async_handler():
+        return FakeResponse()
+
+    sync_handler()
+    asyncio.run(async_handler())
+
+    parse, sync_root, async_root = exporter.spans
+    assert parse.parent_id == sync_root.span_id
+    assert (sync_root.name, sync_root.attributes) == ("chat.request", {"endpoint": "chat-sync", "status_code": 201})
+    assert (async_root.name, async_root.attributes) == ("chat.request", {"endpoint": "chat", "status_code": 201})
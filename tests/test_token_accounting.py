@@ -0,0 +1,69 @@
+import orjson
+import pytest
+
+import token_accounting
+from token_accounting import TurnUsage, fit_tool_messages, trim_tool_payload, turn_accounting
+
+PRODUCTS = {
+    "success": True,
+    "results": [{"productName": f"Pizza {i}", "price": 9.5, "description": "Queso y salsa " * 5} for i in range(40)],
+}
+
+
+def test_prompt_budget_is_off_by_default():
+    usage = TurnUsage()
+
+    assert token_accounting.PROMPT_TOKEN_BUDGET == 0
+    assert usage.prompt_budget == 0
+    assert usage.history_budget(3000) == 3000
+    assert not usage.actions
+
+
+def test_lists_keep_whole_leading_items():
+    trimmed, omitted = trim_tool_payload(PRODUCTS["results"], 1000)
+
+    assert len(orjson.dumps(trimmed)) <= 1000
+    assert trimmed == PRODUCTS["results"][:len(trimmed)]
+    assert omitted == 40 - len(trimmed)
+
+
+def test_objects_trim_their_largest_field():
+    trimmed, omitted = trim_tool_payload(PRODUCTS, 1000)
+
+    assert len(orjson.dumps(trimmed)) <= 1000
+    assert trimmed["success"] is True
+    assert trimmed["results"] == PRODUCTS["results"][:len(trimmed["results"])]
+    assert omitted == 40 - len(trimmed["results"])
+
+
+def test_large_scalar_fields_are_dropped_whole():
+    trimmed, omitted = trim_tool_payload({"id": 1, "notes": "x" * 2000}, 200)
+
+    assert trimmed == {"id": 1}
+    assert omitted == 1
+
+
+def test_tool_messages_stay_valid_json(monkeypatch):
+    pytest.importorskip("langchain_core")
+    from langchain_core.messages import AIMessage, ToolMessage
+
+    monkeypatch.setattr(token_accounting, "PROMPT_TOKEN_BUDGET", 500)
+    content = orjson.dumps(PRODUCTS).decode()
+    messages = [AIMessage(content=""), ToolMessage(content=content, tool_call_id="call_1")]
+
+    with turn_accounting() as usage:
+        fitted = fit_tool_messages(messages, reserved_tokens=100)
+
+    payload, note = fitted[1].content.split("\n")
+    assert orjson.loads(payload)["results"][0] == PRODUCTS["results"][0]
+    assert "se omitieron" in note
+    assert usage.truncated_chars > 0
+
+
+def test_nothing_is_trimmed_without_a_budget():
+    pytest.importorskip("langchain_core")
+    from langchain_core.messages import ToolMessage
+
+    messages = [ToolMessage(content=orjson.dumps(PRODUCTS).decode(), tool_call_id="call_1")]
+
+    assert fit_tool_messages(messages, reserved_tokens=100_000) is messages
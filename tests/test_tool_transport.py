@@ -0,0 +1,79 @@
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+import tool_transport  # noqa: E402
+from tool_transport import ToolTransport  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(tool_transport, "backoff_delay", lambda attempt: 0)
+
+
+def stub(statuses):
+    """MockTransport answering with the given statuses in turn (an exception is raised instead)."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        if isinstance(status, Exception):
+            raise status
+        return httpx.Response(status, json={"ok": status == 200})
+
+    return httpx.MockTransport(handler), calls
+
+
+def test_one_pooled_client_per_origin():
+    mock, calls = stub([200])
+    transport = ToolTransport(transport=mock)
+
+    transport.post("https://fn-a.run.app/x", json={})
+    transport.post("https://fn-a.run.app/y", json={})
+    transport.post("https://fn-b.run.app", json={})
+
+    assert len(calls) == 3
+    assert set(transport._clients) == {"https://fn-a.run.app", "https://fn-b.run.app"}
+    assert transport._client("https://fn-a.run.app/z") is transport._clients["https://fn-a.run.app"]
+    assert transport.stats_snapshot()["pools"] == 2
+
+
+def test_retryable_status_is_retried_until_success():
+    mock, calls = stub([503, 502, 200])
+    transport = ToolTransport(transport=mock, max_retries=2)
+
+    response = transport.post("https://fn-a.run.app", json={"q": 1})
+
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert transport.stats.snapshot()["retries"] == 2
+
+
+def test_retries_are_bounded():
+    mock, calls = stub([503])
+    transport = ToolTransport(transport=mock, max_retries=2)
+
+    assert transport.post("https://fn-a.run.app").status_code == 503
+    assert len(calls) == 3
+
+
+def test_transport_errors_are_retried_and_raised_when_exhausted():
+    mock, calls = stub([httpx.ConnectError("refused"), 200])
+    transport = ToolTransport(transport=mock, max_retries=1)
+    assert transport.post("https://fn-a.run.app").status_code == 200
+
+    mock, calls = stub([httpx.ConnectError("refused")])
+    transport = ToolTransport(transport=mock, max_retries=1)
+    with pytest.raises(httpx.ConnectError):
+        transport.post("https://fn-a.run.app")
+    assert len(calls) == 2
+    assert transport.stats.snapshot()["errors"] == 2
+
+
+def test_non_idempotent_calls_are_not_retried():
+    mock, calls = stub([503, 200])
+    transport = ToolTransport(transport=mock, max_retries=2)
+
+    assert transport.post("https://fn-a.run.app", idempotent=False).status_code == 503
+    assert len(calls) == 1
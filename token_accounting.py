@@ -0,0 +1,388 @@
+"""
+Token and cost accounting per LLM call, per turn and per session.
+
+max_output_tokens bounds the answers, but prompt size grows with the session
+history and with the tool results format_to_tool_messages puts back into the
+scratchpad. A TurnUsage, current for the duration of an agent turn, records:
+
+- input/output tokens of every LLM call (as reported by the model, or
+  estimated from the prompt when it reports nothing),
+- the size of every tool result fed back into the context,
+- the budget actions taken for the turn.
+
+Cumulative totals are stored with the session (the "usage" field of its
+history document). Budgets are off by default. With PROMPT_TOKEN_BUDGET set,
+they are enforced before each call is made: the history block is compacted to
+a share of the prompt budget, and tool results in the scratchpad are trimmed
+until the prompt fits, dropping whole results or fields so what the model
+reads is still valid JSON. With SESSION_TOKEN_BUDGET set, the prompt budget
+shrinks as a session uses up its budget, down to MIN_PROMPT_TOKEN_BUDGET;
+calls are never refused.
+"""
+
+import contextvars
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+import orjson
+
+from telemetry import TOKEN_BUCKETS, registry, token_usage
+
+# Estimated tokens allowed in the prompt of a single LLM call; 0 disables the prompt budget
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+# Tokens (input plus output) a session may use in total; 0 disables the session budget
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+MIN_PROMPT_TOKEN_BUDGET = int(os.getenv("MIN_PROMPT_TOKEN_BUDGET", "1500"))
+# Share of the prompt budget the history block may take
+HISTORY_BUDGET_SHARE = float(os.getenv("HISTORY_BUDGET_SHARE", "0.5"))
+# Tool results are never trimmed below this many characters
+TOOL_RESULT_MIN_CHARS = int(os.getenv("TOOL_RESULT_MIN_CHARS", "400"))
+# USD per million tokens (gemini-2.0-flash list prices by default)
+INPUT_PRICE_PER_MILLION = float(os.getenv("LLM_INPUT_PRICE_PER_MILLION", "0.10"))
+OUTPUT_PRICE_PER_MILLION = float(os.getenv("LLM_OUTPUT_PRICE_PER_MILLION", "0.40"))
+
+TRIMMED_TOOL_RESULT = "[se omitieron {omitted} elementos de este resultado para ajustarse al límite de tokens]"
+TRUNCATED_TOOL_RESULT = "… [resultado truncado para ajustarse al límite de tokens]"
+
+_current_turn = contextvars.ContextVar("turn_usage", default=None)
+
+turn_tokens = registry.histogram(
+    "agent_turn_tokens", "Tokens used by one agent turn by kind (input/output)", TOKEN_BUCKETS)
+tool_result_tokens_total = registry.counter(
+    "agent_tool_result_tokens_total", "Estimated tokens of tool results fed back to the model")
+budget_actions_total = registry.counter(
+    "agent_token_budget_actions_total", "Turns whose prompt was reduced to fit a budget, by action")
+llm_cost_total = registry.counter(
+    "agent_llm_cost_usd_total", "Estimated model cost in USD")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough token count of a string (about four characters per token)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def cost_usd(input_tokens: int, output_tokens: int) -> float:
+    return (input_tokens * INPUT_PRICE_PER_MILLION + output_tokens * OUTPUT_PRICE_PER_MILLION) / 1_000_000
+
+
+class TurnUsage:
+    """
+    Token usage and budget state of one agent turn.
+
+    Args:
+        session_id: Session the turn belongs to, if any.
+    """
+
+    def __init__(self, session_id: str = None):
+        self.session_id = session_id
+        self.calls = []
+        self.tool_results = []
+        self.actions = set()
+        self.history_tokens = None
+        self.truncated_chars = 0
+        # Session totals before this turn; read with the session history
+        self.session_before = {}
+        self._lock = threading.Lock()
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(call["input_tokens"] for call in self.calls)
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(call["output_tokens"] for call in self.calls)
+
+    @property
+    def prompt_budget(self) -> int:
+        """Estimated prompt tokens allowed for the next LLM call of the turn; 0 when there is no budget."""
+        if SESSION_TOKEN_BUDGET <= 0:
+            return max(PROMPT_TOKEN_BUDGET, 0)
+        used = (self.session_before.get("input_tokens", 0) + self.session_before.get("output_tokens", 0)
+                + self.input_tokens + self.output_tokens)
+        remaining = SESSION_TOKEN_BUDGET - used
+        if PROMPT_TOKEN_BUDGET > 0:
+            remaining = min(PROMPT_TOKEN_BUDGET, remaining)
+        return max(remaining, MIN_PROMPT_TOKEN_BUDGET)
+
+    def load_session(self, session_usage: dict = None) -> None:
+        """Take the cumulative usage stored with the session into account for the budget."""
+        self.session_before = dict(session_usage or {})
+
+    def history_budget(self, default_budget: int) -> int:
+        """
+        Token budget for the history block of this turn's prompt.
+
+        Args:
+            default_budget: The memory manager's own budget.
+
+        Returns:
+            int: default_budget, or less when the prompt budget requires it.
+        """
+        prompt_budget = self.prompt_budget
+        if prompt_budget <= 0:
+            return default_budget
+        budget = int(prompt_budget * HISTORY_BUDGET_SHARE)
+        if budget >= default_budget:
+            return default_budget
+        self._act("history_compaction")
+        return budget
+
+    def record_history(self, messages) -> None:
+        from conversation_memory import estimate_tokens
+
+        self.history_tokens = estimate_tokens(messages)
+
+    def record_call(self, input_tokens: int, output_tokens: int, estimated: bool = False, tier: str = None) -> None:
+        call = {"input_tokens": input_tokens, "output_tokens": output_tokens, "estimated": estimated}
+        if tier:
+            call["tier"] = tier
+        with self._lock:
+            self.calls.append(call)
+
+    def record_tool_result(self, tool: str, text: str) -> None:
+        tokens = estimate_text_tokens(text)
+        with self._lock:
+            self.tool_results.append({"tool": tool, "chars": len(text), "tokens": tokens})
+        tool_result_tokens_total.inc(tokens, tool=tool)
+
+    def record_truncation(self, chars: int) -> None:
+        with self._lock:
+            self.truncated_chars += chars
+        self._act("tool_truncation")
+
+    def finish(self) -> None:
+        """Record the turn's totals in the metrics."""
+        turn_tokens.observe(self.input_tokens, kind="input")
+        turn_tokens.observe(self.output_tokens, kind="output")
+        llm_cost_total.inc(cost_usd(self.input_tokens, self.output_tokens))
+
+    def session_totals(self, before: dict = None) -> dict:
+        """Cumulative session usage after this turn, given the stored totals."""
+        before = before or {}
+        input_tokens = before.get("input_tokens", 0) + self.input_tokens
+        output_tokens = before.get("output_tokens", 0) + self.output_tokens
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "llm_calls": before.get("llm_calls", 0) + len(self.calls),
+            "turns": before.get("turns", 0) + 1,
+            "cost_usd": round(cost_usd(input_tokens, output_tokens), 6),
+        }
+
+    def to_dict(self, session: dict = None) -> dict:
+        """Usage summary returned with the agent response."""
+        with self._lock:
+            calls = list(self.calls)
+            tool_results = list(self.tool_results)
+            actions = sorted(self.actions)
+        input_tokens = sum(call["input_tokens"] for call in calls)
+        output_tokens = sum(call["output_tokens"] for call in calls)
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "llm_calls": calls,
+            "estimated": any(call["estimated"] for call in calls),
+            "cost_usd": round(cost_usd(input_tokens, output_tokens), 6),
+            "tool_results": tool_results,
+            "tool_result_tokens": sum(result["tokens"] for result in tool_results),
+            "history_tokens": self.history_tokens,
+            "prompt_budget": self.prompt_budget,
+            "budget_actions": actions,
+            "truncated_chars": self.truncated_chars,
+        }
+        if session is not None:
+            usage["session"] = {**session, "budget": SESSION_TOKEN_BUDGET or None}
+        return usage
+
+    def _act(self, action: str) -> None:
+        with self._lock:
+            first = action not in self.actions
+            self.actions.add(action)
+        if first:
+            budget_actions_total.inc(action=action)
+
+
+def current_turn_usage():
+    """TurnUsage of the agent turn running in this context, or None."""
+    return _current_turn.get()
+
+
+@contextmanager
+def turn_accounting(session_id: str = None):
+    """Make a new TurnUsage current for the duration of an agent turn."""
+    usage = TurnUsage(session_id)
+    token = _current_turn.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_turn.reset(token)
+
+
+def _trim_list(items: list, max_chars: int) -> list:
+    """Leading items of a list whose serialized form fits in max_chars."""
+    size, kept = 2, 0
+    for item in items:
+        item_size = len(orjson.dumps(item)) + (1 if kept else 0)
+        if size + item_size > max_chars:
+            break
+        size += item_size
+        kept += 1
+    return items[:kept]
+
+
+def trim_tool_payload(value, max_chars: int) -> tuple:
+    """
+    Shrink a decoded tool result by whole items or fields until it serializes to max_chars.
+
+    Lists keep their leading items. In objects the largest fields go first:
+    list and object fields are trimmed recursively, other fields are dropped.
+
+    Args:
+        value: The decoded JSON tool result.
+        max_chars: Target size of its compact serialization.
+
+    Returns:
+        tuple: (trimmed value, number of items and fields left out)
+    """
+    if isinstance(value, list):
+        kept = _trim_list(value, max_chars)
+        return kept, len(value) - len(kept)
+    if not isinstance(value, dict):
+        return value, 0
+    trimmed, omitted = dict(value), 0
+    for key in sorted(trimmed, key=lambda k: len(orjson.dumps(trimmed[k])), reverse=True):
+        excess = len(orjson.dumps(trimmed)) - max_chars
+        if excess <= 0:
+            break
+        field = trimmed[key]
+        field_budget = len(orjson.dumps(field)) - excess
+        if isinstance(field, (list, dict)) and field_budget > 2:
+            trimmed[key], field_omitted = trim_tool_payload(field, field_budget)
+            omitted += field_omitted
+        else:
+            del trimmed[key]
+            omitted += 1
+    return trimmed, omitted
+
+
+def _trim_tool_content(content: str, max_chars: int) -> str:
+    """A tool message's content shortened to about max_chars without cutting through JSON."""
+    try:
+        payload = orjson.loads(content)
+    except orjson.JSONDecodeError:
+        # Plain text: cut at the last line or word boundary
+        cut = content[:max_chars]
+        boundary = max(cut.rfind("\n"), cut.rfind(" "))
+        return (cut[:boundary] if boundary > 0 else cut) + TRUNCATED_TOOL_RESULT
+    trimmed, omitted = trim_tool_payload(payload, max_chars)
+    if not omitted:
+        return content
+    return orjson.dumps(trimmed).decode() + "\n" + TRIMMED_TOOL_RESULT.format(omitted=omitted)
+
+
+def fit_tool_messages(messages, reserved_tokens: int) -> list:
+    """
+    Trim tool results in the scratchpad so the prompt fits the turn's budget.
+
+    The available space is shared fairly: results shorter than their share
+    are kept whole, the longer ones are trimmed to about the same length
+    (never below TOOL_RESULT_MIN_CHARS). JSON results lose whole items or
+    fields (see trim_tool_payload) and are never cut mid-value. Nothing is
+    trimmed when the turn has no prompt budget.
+
+    Args:
+        messages: Scratchpad messages from format_to_tool_messages.
+        reserved_tokens: Estimated tokens of the rest of the prompt (system
+                         instruction, history and user input).
+
+    Returns:
+        list: The messages, with long tool results trimmed when needed.
+    """
+    usage = current_turn_usage()
+    budget = usage.prompt_budget if usage is not None else PROMPT_TOKEN_BUDGET
+    if budget <= 0:
+        return messages
+    tool_indexes = [i for i, m in enumerate(messages) if m.type == "tool" and isinstance(m.content, str)]
+    available = max(budget - reserved_tokens, 0) * 4 - sum(
+        len(str(m.content)) for i, m in enumerate(messages) if i not in tool_indexes
+    )
+    lengths = sorted(len(messages[i].content) for i in tool_indexes)
+    if sum(lengths) <= available:
+        return messages
+
+    cap, remaining = 0, available
+    for position, length in enumerate(lengths):
+        share = remaining // (len(lengths) - position)
+        if length > share:
+            cap = share
+            break
+        remaining -= length
+    cap = max(cap, TOOL_RESULT_MIN_CHARS)
+
+    fitted, cut = list(messages), 0
+    for i in tool_indexes:
+        content = messages[i].content
+        if len(content) > cap:
+            trimmed = _trim_tool_content(content, cap)
+            if trimmed is not content:
+                cut += max(len(content) - len(trimmed), 0)
+                fitted[i] = messages[i].model_copy(update={"content": trimmed})
+    if cut and usage is not None:
+        usage.record_truncation(cut)
+    return fitted
+
+
+def usage_callback_handler(usage: TurnUsage):
+    """LangChain callback handler recording LLM calls and tool results into a TurnUsage."""
+    from langchain_core.callbacks import BaseCallbackHandler
+    from conversation_memory import estimate_tokens
+
+    class UsageRecorder(BaseCallbackHandler):
+        def __init__(self):
+            self._prompt_estimates = {}
+            self._tiers = {}
+            self._tools = {}
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            self._prompt_estimates[run_id] = sum(estimate_tokens(batch) for batch in messages)
+            # Set by model_tiering on tiered model calls
+            self._tiers[run_id] = (metadata or {}).get("model_tier")
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._prompt_estimates[run_id] = sum(estimate_text_tokens(prompt) for prompt in prompts)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            estimate = self._prompt_estimates.pop(run_id, 0)
+            tier = self._tiers.pop(run_id, None)
+            input_tokens, output_tokens = token_usage(response)
+            if input_tokens is None:
+                # The model reported nothing: estimate both sides
+                output_text = "".join(
+                    generation.text for generations in response.generations for generation in generations
+                )
+                usage.record_call(estimate, estimate_text_tokens(output_text), estimated=True, tier=tier)
+                return
+            usage.record_call(input_tokens, output_tokens or 0, tier=tier)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._prompt_estimates.pop(run_id, None)
+            self._tiers.pop(run_id, None)
+
+        def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+            self._tools[run_id] = (serialized or {}).get("name") or "tool"
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            name = self._tools.pop(run_id, "tool")
+            # Serialized the way build_scratchpad puts it in the prompt
+            content = getattr(output, "content", output)
+            if not isinstance(content, str):
+                content = orjson.dumps(content, default=str).decode()
+            usage.record_tool_result(name, content)
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            self._tools.pop(run_id, None)
+
+    return UsageRecorder()
@@ -0,0 +1,314 @@
+"""
+TTL + LRU response cache for the read-mostly menu tools.
+
+Menu data changes a few times per day, so imagenes_menu, consulta_atributos and
+consulta_productos_menu results are cached per tool and normalized arguments.
+Entries past their TTL are still served for a short stale window while a single
+background refresh replaces them. The cache lives in process memory by default,
+or in a Redis-compatible store (TOOL_CACHE_REDIS_URL) shared by all workers.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+
+logger = logging.getLogger("tool_cache")
+
+# Seconds a result is considered fresh, per tool. Tools not listed are not cached.
+TOOL_CACHE_TTLS = {
+    "imagenes_menu": int(os.getenv("TOOL_CACHE_TTL_IMAGENES_MENU", "1800")),
+    "consulta_atributos": int(os.getenv("TOOL_CACHE_TTL_CONSULTA_ATRIBUTOS", "1800")),
+    "consulta_productos_menu": int(os.getenv("TOOL_CACHE_TTL_CONSULTA_PRODUCTOS_MENU", "600")),
+}
+# Seconds past the TTL during which a stale result is served while it refreshes
+STALE_WHILE_REVALIDATE = int(os.getenv("TOOL_CACHE_STALE_SECONDS", "300"))
+MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Free-text arguments folded to lowercase without accents before keying
+FOLDED_ARGUMENTS = ("product_name", "category_name")
+
+
+def fold_text(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace ("Café  Latte" -> "cafe latte")."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def cache_key(tool: str, args: dict) -> str:
+    """Build the cache key for a tool call from its normalized arguments."""
+    normalized = {
+        name: fold_text(value) if name in FOLDED_ARGUMENTS and value is not None else value
+        for name, value in args.items()
+    }
+    digest = hashlib.sha1(orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return f"{tool}:{digest}"
+
+
+def is_cacheable(value) -> bool:
+    """Only successful backend payloads are cached; error dicts are not."""
+    if isinstance(value, dict):
+        return "error" not in value
+    return isinstance(value, list)
+
+
+class CacheEntry:
+    __slots__ = ("value", "expires_at", "stale_until", "size")
+
+    def __init__(self, value, expires_at: float, stale_until: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.size = size
+
+
+class MemoryBackend:
+    """Per-process LRU store bounded by entry count and serialized size."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                self._bytes -= self._entries.pop(key).size
+            return len(keys)
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class RedisBackend:
+    """
+    Redis-compatible store shared by every worker.
+
+    Entries expire in Redis at the end of their stale window. MAX_ENTRIES and
+    MAX_BYTES don't apply here: size bounds are left to the server's maxmemory
+    / allkeys-lru policy. Usage comes from DBSIZE and INFO (memory held and
+    evicted keys of the whole Redis database, not only this cache's
+    namespace), which are cheap enough to run on every metrics scrape.
+    """
+
+    def __init__(self, url: str, namespace: str = "toolcache"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str):
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return None
+        data = orjson.loads(raw)
+        return CacheEntry(data["value"], data["expires_at"], data["stale_until"], len(raw))
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        raw = orjson.dumps({"value": entry.value, "expires_at": entry.expires_at,
+                            "stale_until": entry.stale_until})
+        ttl = max(int(entry.stale_until - time.time()), 1)
+        self.client.set(self._key(key), raw, ex=ttl)
+
+    def delete_prefix(self, prefix: str) -> int:
+        keys = list(self.client.scan_iter(match=f"{self._key(prefix)}*"))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+    def usage(self) -> dict:
+        try:
+            memory = self.client.info("memory")
+            stats = self.client.info("stats")
+            entries = self.client.dbsize()
+        except Exception as e:
+            logger.warning(f"Tool cache usage unavailable from Redis: {str(e)}")
+            return {"entries": None, "bytes": None, "evictions": None}
+        return {"entries": entries, "bytes": memory.get("used_memory"), "evictions": stats.get("evicted_keys")}
+
+
+class ToolCache:
+    """
+    Cache in front of the tool backends.
+
+    Args:
+        backend: MemoryBackend (default) or RedisBackend.
+        ttls: Fresh lifetime in seconds per tool name.
+        stale_while_revalidate: Extra seconds a stale entry may be served while
+                                a background refresh is running.
+    """
+
+    def __init__(self, backend=None, ttls: dict = None, stale_while_revalidate: int = STALE_WHILE_REVALIDATE):
+        self.backend = backend or MemoryBackend()
+        self.ttls = dict(TOOL_CACHE_TTLS if ttls is None else ttls)
+        self.stale_while_revalidate = stale_while_revalidate
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tool-cache-refresh")
+        self._listeners = []
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get_or_load(self, tool: str, args: dict, loader):
+        """
+        Return the cached result for a tool call, loading it on a miss.
+
+        Args:
+            tool: Tool name, used to look up its TTL.
+            args: The tool's arguments; free-text ones are folded before keying.
+            loader: Zero-argument callable returning the backend result.
+
+        Returns:
+            The cached or freshly loaded result.
+        """
+        ttl = self.ttls.get(tool)
+        if not ttl:
+            return loader()
+        key = cache_key(tool, args)
+        now = time.time()
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Tool cache read failed for {tool}: {str(e)}")
+            entry = None
+        if entry is not None and now < entry.expires_at:
+            self._count("hits")
+            return entry.value
+        if entry is not None and now < entry.stale_until:
+            self._count("stale_hits")
+            self._refresh_in_background(tool, key, ttl, loader)
+            return entry.value
+        self._count("misses")
+        value = loader()
+        self._store(tool, key, ttl, value)
+        return value
+
+    def invalidate(self, tool: str = None, args: dict = None) -> int:
+        """
+        Drop cached results: one call, every call of a tool, or everything.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        if tool is None:
+            prefix = ""
+        elif args is None:
+            prefix = f"{tool}:"
+        else:
+            prefix = cache_key(tool, args)
+        removed = self.backend.delete_prefix(prefix)
+        for listener in list(self._listeners):
+            try:
+                listener(tool, args)
+            except Exception as e:
+                logger.warning(f"Tool cache invalidation listener failed: {str(e)}")
+        return removed
+
+    def on_invalidate(self, listener) -> None:
+        """Register listener(tool, args) to run after every invalidate() call."""
+        self._listeners.append(listener)
+
+    def stats(self) -> dict:
+        """Hit ratio and memory footprint, for sizing the cache."""
+        with self._stats_lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+        stats.update(self.backend.usage())
+        return stats
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _store(self, tool: str, key: str, ttl: int, value) -> None:
+        if not is_cacheable(value):
+            return
+        now = time.time()
+        entry = CacheEntry(value, now + ttl, now + ttl + self.stale_while_revalidate, len(orjson.dumps(value)))
+        try:
+            self.backend.set(key, entry)
+        except Exception as e:
+            logger.warning(f"Tool cache write failed for {tool}: {str(e)}")
+
+    def _refresh_in_background(self, tool: str, key: str, ttl: int, loader) -> None:
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(tool, key, ttl, loader())
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {tool}: {str(e)}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(refresh)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tool_cache() -> ToolCache:
+    """Process-wide tool cache, backed by Redis when TOOL_CACHE_REDIS_URL is set."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                redis_url = os.getenv("TOOL_CACHE_REDIS_URL")
+                backend = RedisBackend(redis_url) if redis_url else MemoryBackend()
+                ttls = TOOL_CACHE_TTLS if os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true" else {}
+                _cache = ToolCache(backend=backend, ttls=ttls)
+    return _cache
+
+
+def set_tool_cache(cache: ToolCache) -> None:
+    """Replace the process-wide tool cache."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
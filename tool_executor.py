@@ -0,0 +1,153 @@
+"""
+Concurrent execution of the tool calls the model requests in a single step.
+
+LangChain's AgentExecutor runs the tool calls of one step one after another on
+the sync path. ParallelAgentExecutor dispatches them to a thread pool instead,
+capped per step, with per-tool timeouts (single-call steps included), and
+yields the resulting AgentSteps in the order the model requested them so
+format_to_tool_messages sees the same sequence as before. A step with N independent lookups then costs roughly the
+slowest lookup rather than the sum of all of them.
+"""
+
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+
+MAX_PARALLEL_TOOLS = int(os.getenv("MAX_PARALLEL_TOOLS", "4"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "25"))
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that runs the tool calls of one step concurrently.
+
+    Attributes:
+        max_parallel_tools: Most tool calls running at once within a step.
+        tool_timeout: Seconds to wait for a tool before answering the model
+                      with a timeout error.
+        tool_timeouts: Per-tool overrides of tool_timeout, keyed by tool name.
+    """
+
+    max_parallel_tools: int = MAX_PARALLEL_TOOLS
+    tool_timeout: Optional[float] = TOOL_TIMEOUT_SECONDS
+    tool_timeouts: Dict[str, float] = {}
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        if self.handle_parsing_errors:
+            # Parsing-error recovery lives in the base implementation
+            yield from super()._iter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+            )
+            return
+
+        intermediate_steps = self._prepare_intermediate_steps(intermediate_steps)
+        output = self._action_agent.plan(
+            intermediate_steps,
+            callbacks=run_manager.get_child() if run_manager else None,
+            **inputs,
+        )
+        if isinstance(output, AgentFinish):
+            yield output
+            return
+
+        actions = [output] if isinstance(output, AgentAction) else list(output)
+        for agent_action in actions:
+            yield agent_action
+        if self.max_parallel_tools <= 1:
+            for agent_action in actions:
+                yield from self._perform_with_timeouts(name_to_tool_map, color_mapping, [agent_action], run_manager)
+            return
+        yield from self._perform_with_timeouts(name_to_tool_map, color_mapping, actions, run_manager)
+
+    def _perform_with_timeouts(self, name_to_tool_map, color_mapping, actions, run_manager):
+        if len(actions) == 1 and self._timeout_for(actions[0].tool) == float("inf"):
+            # Nothing to enforce, so skip the thread hop
+            yield self._perform_agent_action(name_to_tool_map, color_mapping, actions[0], run_manager)
+            return
+        pool = ThreadPoolExecutor(
+            max_workers=min(self.max_parallel_tools, len(actions)),
+            thread_name_prefix="agent-tool",
+        )
+        try:
+            dispatched = []
+            for agent_action in actions:
+                # Copy the context so per-turn state (tracing, budgets) follows the call
+                future = pool.submit(
+                    contextvars.copy_context().run,
+                    self._perform_agent_action,
+                    name_to_tool_map, color_mapping, agent_action, run_manager,
+                )
+                dispatched.append((agent_action, future, time.monotonic() + self._timeout_for(agent_action.tool)))
+            for agent_action, future, deadline in dispatched:
+                try:
+                    yield future.result(timeout=max(deadline - time.monotonic(), 0))
+                except FutureTimeoutError:
+                    future.cancel()
+                    yield AgentStep(action=agent_action, observation=self._timeout_observation(agent_action.tool))
+        finally:
+            # Don't wait for timed-out tools; their threads finish in the background
+            pool.shutdown(wait=False)
+
+    def _timeout_for(self, tool_name: str) -> float:
+        timeout = self.tool_timeouts.get(tool_name, self.tool_timeout)
+        return float("inf") if timeout is None else timeout
+
+    def _timeout_observation(self, tool_name: str) -> dict:
+        return {
+            "error": f"La herramienta {tool_name} no respondió dentro de {self._timeout_for(tool_name):g} segundos."
+        }
+
+
+def build_agent_runnable(model, *, tools=None, prompt=None, output_parser=None, chat_history=None,
+                         model_tool_kwargs=None, agent_executor_kwargs=None, runnable_kwargs=None,
+                         executor_class: Callable = ParallelAgentExecutor, tiering=None, **kwargs):
+    """
+    runnable_builder for LangchainAgent that uses ParallelAgentExecutor.
+
+    Mirrors the default builder of vertexai's LangchainAgent (tool-bound model,
+    tool-calling output parser, optional RunnableWithMessageHistory) with the
+    executor class swapped. With a ModelTiering (bind it with functools.partial),
+    each model call of the agent goes to the tier it picks, `model` being the
+    strong tier.
+    """
+    from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
+    from langchain.tools.base import StructuredTool
+    from langchain_core import tools as lc_tools
+
+    tools = tools or []
+    output_parser = output_parser or ToolsAgentOutputParser()
+    if tiering is not None:
+        agent = tiering.build_agent(
+            model, tools=tools, prompt=prompt, output_parser=output_parser, model_tool_kwargs=model_tool_kwargs
+        )
+    else:
+        if tools:
+            model = model.bind_tools(tools=tools, **(model_tool_kwargs or {}))
+        agent = prompt | model | output_parser
+    executor = executor_class(
+        agent=agent,
+        tools=[
+            tool if isinstance(tool, lc_tools.BaseTool) else StructuredTool.from_function(tool)
+            for tool in tools
+        ],
+        **(agent_executor_kwargs or {}),
+    )
+    if chat_history is None:
+        return executor
+
+    from langchain_core.runnables.history import RunnableWithMessageHistory
+
+    return RunnableWithMessageHistory(
+        runnable=executor,
+        get_session_history=chat_history,
+        **(runnable_kwargs or {
+            "input_messages_key": "input",
+            "output_messages_key": "output",
+            "history_messages_key": "history",
+        }),
+    )
@@ -0,0 +1,134 @@
+"""
+Per-tool projection of backend payloads before they reach the model.
+
+The tool backends return whole documents: image records and menu products
+carry fields the model never uses, and lists can be longer than anything worth
+putting in a prompt. Every tool result is serialized into the scratchpad, so
+each unused field costs prompt tokens on every later call of the turn.
+
+A projection schema lists the fields to keep. Nested objects (and each element
+of a list of objects) are projected with their own schema, and lists are
+capped; when items are cut, "<field>Omitted" tells the model how many. Error
+payloads ("error", "message") always pass through. A payload whose shape
+matches nothing in its schema is returned unchanged rather than emptied.
+
+The field names below are unverified: they were not taken from recorded
+responses of the Cloud Run backends, and a field a schema doesn't list is
+dropped. Projection is therefore off unless TOOL_PROJECTION=true; check the
+schemas against real payloads before turning it on. consulta_clientes has no
+schema, since its reply is small and losing customer fields would be costly.
+"""
+
+import functools
+import os
+
+from telemetry import registry
+from menu_index import CATEGORY_FIELD, PRICE_FIELD, PRODUCT_NAME_FIELD
+
+PROJECTION_ENABLED = os.getenv("TOOL_PROJECTION", "false").lower() == "true"
+# Most list items handed to the model from one tool result
+MAX_LIST_ITEMS = int(os.getenv("TOOL_PROJECTION_MAX_ITEMS", "10"))
+
+ALWAYS_KEPT = ("error", "message")
+
+projected_fields_total = registry.counter(
+    "agent_tool_projected_fields_total", "Fields and list items dropped from tool results before the model saw them")
+
+
+class ListOf:
+    """Schema of a list: each item is projected with `item`; at most `limit` items are kept."""
+
+    __slots__ = ("item", "limit")
+
+    def __init__(self, item=True, limit: int = None):
+        self.item = item
+        self.limit = limit
+
+
+PRODUCT = {PRODUCT_NAME_FIELD: True, CATEGORY_FIELD: True, PRICE_FIELD: True, "description": True, "available": True}
+
+TOOL_SCHEMAS = {
+    "imagenes_menu": {
+        "success": True,
+        "images": ListOf({"name": True, "url": True, "description": True}),
+    },
+    "consulta_atributos": {
+        "success": True, "categoryName": True, "attributes": True,
+    },
+    "consulta_productos_menu": {
+        "success": True, "searchMode": True, "query": True, "totalResults": True,
+        "results": ListOf(PRODUCT),
+    },
+}
+
+
+def project(value, schema, max_items: int = MAX_LIST_ITEMS):
+    """
+    Project a value with a schema.
+
+    Args:
+        value: Parsed JSON value.
+        schema: True (keep as is), a dict of field -> schema, or a ListOf.
+        max_items: List cap used when a ListOf sets none.
+
+    Returns:
+        tuple: (projected value, number of fields and list items dropped)
+    """
+    if schema is True:
+        return value, 0
+    if isinstance(schema, ListOf):
+        if not isinstance(value, list):
+            return value, 0
+        limit = schema.limit if schema.limit is not None else max_items
+        dropped = max(len(value) - limit, 0)
+        items = []
+        for item in value[:limit]:
+            projected, item_dropped = project(item, schema.item, max_items)
+            items.append(projected)
+            dropped += item_dropped
+        return items, dropped
+    if not isinstance(value, dict):
+        return value, 0
+    projected, dropped = {}, 0
+    for key, item in value.items():
+        if key in schema:
+            projected[key], item_dropped = project(item, schema[key], max_items)
+            dropped += item_dropped
+            if isinstance(schema[key], ListOf) and isinstance(item, list) and len(item) > len(projected[key]):
+                projected[f"{key}Omitted"] = len(item) - len(projected[key])
+        elif key in ALWAYS_KEPT:
+            projected[key] = item
+        else:
+            dropped += 1
+    if value and not any(key in schema for key in value):
+        # Unknown shape: better too much context than none
+        return value, 0
+    return projected, dropped
+
+
+def project_tool_result(tool: str, result):
+    """Projection of a tool's result with its schema; tools without one pass through."""
+    schema = TOOL_SCHEMAS.get(tool)
+    if schema is None or not PROJECTION_ENABLED:
+        return result
+    projected, dropped = project(result, schema)
+    if dropped:
+        projected_fields_total.inc(dropped, tool=tool)
+    return projected
+
+
+def projected(func):
+    """
+    Return a tool function's results projected with its schema.
+
+    Like traced_tool, the wrapper keeps the function's name, docstring and
+    signature for the agent's tool description.
+    """
+    if not PROJECTION_ENABLED or func.__name__ not in TOOL_SCHEMAS:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return project_tool_result(func.__name__, func(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,258 @@
+"""
+Shared, connection-pooled HTTP transport for the Cloud Run tool backends.
+
+One httpx client is kept per backend origin so every tool call reuses a warm
+keep-alive (and, when the "h2" package is installed, HTTP/2) connection instead
+of paying a new TCP + TLS handshake. Calls have connect/read timeouts, and
+idempotent lookups are retried a bounded number of times with jittered backoff.
+"""
+
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+CONNECT_TIMEOUT = float(os.getenv("TOOL_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("TOOL_READ_TIMEOUT", "20"))
+POOL_SIZE = int(os.getenv("TOOL_POOL_SIZE", "20"))
+MAX_RETRIES = int(os.getenv("TOOL_MAX_RETRIES", "2"))
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2.0
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class TransportStats:
+    """Request, retry and connection counters shared by a transport's clients."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def on_trace(self, event_name: str, info: dict) -> None:
+        # httpcore reports every new connection and TLS handshake through the
+        # "trace" request extension; a reused connection emits neither.
+        if event_name in ("connection.connect_tcp.complete", "connection.connect_unix_socket.complete"):
+            self.incr("connections_opened")
+        elif event_name == "connection.start_tls.complete":
+            self.incr("tls_handshakes")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "errors": self.errors,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "connection_reuse_ratio": (
+                    1 - self.connections_opened / self.requests if self.requests else 0.0
+                ),
+            }
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class _BaseTransport:
+    """
+    Settings shared by the sync and async transports.
+
+    Args:
+        pool_size: Default max connections kept per backend origin.
+        pool_sizes: Per-origin overrides, e.g. {"https://fn-x.run.app": 50}.
+        connect_timeout: Seconds to wait for a connection to be established.
+        read_timeout: Seconds to wait for response data.
+        max_retries: Retries for idempotent calls on transport errors and
+                     429/502/503/504 responses.
+        http2: Negotiate HTTP/2 when the server supports it (needs "h2").
+        transport: Optional httpx transport (e.g. httpx.MockTransport) used for
+                   every client instead of the network.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, pool_sizes: dict = None,
+                 connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, http2: bool = HTTP2_AVAILABLE, transport=None):
+        self.pool_size = pool_size
+        self.pool_sizes = {_origin(url): size for url, size in (pool_sizes or {}).items()}
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.transport = transport
+        self.stats = TransportStats()
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def _client_kwargs(self, origin: str) -> dict:
+        size = self.pool_sizes.get(origin, self.pool_size)
+        kwargs = {
+            "timeout": self.timeout,
+            "limits": httpx.Limits(max_connections=size, max_keepalive_connections=size),
+            "http2": self.http2,
+        }
+        if self.transport is not None:
+            kwargs["transport"] = self.transport
+        return kwargs
+
+    def _should_retry(self, attempt: int, idempotent: bool) -> bool:
+        return idempotent and attempt < self.max_retries
+
+    def stats_snapshot(self) -> dict:
+        snapshot = self.stats.snapshot()
+        snapshot["pools"] = len(self._clients)
+        snapshot["http2"] = self.http2
+        return snapshot
+
+
+class ToolTransport(_BaseTransport):
+    """Blocking transport used by the tool functions in index.py."""
+
+    def _client(self, url: str) -> httpx.Client:
+        origin = _origin(url)
+        client = self._clients.get(origin)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(origin)
+                if client is None:
+                    client = self._clients[origin] = httpx.Client(**self._client_kwargs(origin))
+        return client
+
+    def post(self, url: str, headers: dict = None, json=None, idempotent: bool = True) -> httpx.Response:
+        """
+        POST to a tool backend over a pooled connection.
+
+        Args:
+            url: Full backend URL.
+            headers: Request headers.
+            json: JSON-serializable payload, or None for an empty body.
+            idempotent: Whether the call may be retried on failure.
+
+        Returns:
+            httpx.Response: The final response (possibly a retryable status once
+                            retries are exhausted).
+        """
+        client = self._client(url)
+        attempt = 0
+        while True:
+            self.stats.incr("requests")
+            try:
+                response = client.post(url, headers=headers, json=json,
+                                       extensions={"trace": self.stats.on_trace})
+            except httpx.TransportError:
+                self.stats.incr("errors")
+                if not self._should_retry(attempt, idempotent):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or not self._should_retry(attempt, idempotent):
+                    return response
+                response.close()
+            self.stats.incr("retries")
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+    def close(self) -> None:
+        with self._clients_lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+class AsyncToolTransport(_BaseTransport):
+    """Non-blocking counterpart of ToolTransport for async views."""
+
+    def _client(self, url: str) -> httpx.AsyncClient:
+        origin = _origin(url)
+        client = self._clients.get(origin)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(origin)
+                if client is None:
+                    client = self._clients[origin] = httpx.AsyncClient(**self._client_kwargs(origin))
+        return client
+
+    async def _on_trace(self, event_name: str, info: dict) -> None:
+        self.stats.on_trace(event_name, info)
+
+    async def post(self, url: str, headers: dict = None, json=None, idempotent: bool = True) -> httpx.Response:
+        """Async version of ToolTransport.post."""
+        client = self._client(url)
+        attempt = 0
+        while True:
+            self.stats.incr("requests")
+            try:
+                response = await client.post(url, headers=headers, json=json,
+                                             extensions={"trace": self._on_trace})
+            except httpx.TransportError:
+                self.stats.incr("errors")
+                if not self._should_retry(attempt, idempotent):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or not self._should_retry(attempt, idempotent):
+                    return response
+                await response.aclose()
+            self.stats.incr("retries")
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+
+    async def aclose(self) -> None:
+        with self._clients_lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+_transport = None
+_async_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_tool_transport() -> ToolTransport:
+    """Process-wide blocking transport."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = ToolTransport()
+    return _transport
+
+
+def get_async_tool_transport() -> AsyncToolTransport:
+    """Process-wide async transport."""
+    global _async_transport
+    if _async_transport is None:
+        with _transport_lock:
+            if _async_transport is None:
+                _async_transport = AsyncToolTransport()
+    return _async_transport
+
+
+def set_tool_transport(transport: ToolTransport = None, async_transport: AsyncToolTransport = None) -> None:
+    """Swap the process-wide transports, e.g. for ones pointed at a stub server."""
+    global _transport, _async_transport
+    with _transport_lock:
+        if transport is not None:
+            _transport = transport
+        if async_transport is not None:
+            _async_transport = async_transport
@@ -59,6 +59,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # The API processes and the job workers (manage.py run_jobs) write to the
+        # job queue concurrently: WAL lets reads proceed during writes, and
+        # IMMEDIATE transactions wait for the write lock (up to `timeout`
+        # seconds) instead of failing when upgrading from a read
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
     }
 }
 
@@ -76,7 +85,64 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    # orjson encoding/decoding (agent_api.renderers)
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'agent_api.renderers.ORJSONRenderer',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'agent_api.renderers.ORJSONParser',
+    ],
+}
+
+# Agent concurrency (async chat endpoint, per process)
+# Maximum agent turns in flight at once
+AGENT_MAX_CONCURRENCY = int(os.getenv('AGENT_MAX_CONCURRENCY', '200'))
+# Seconds a request may wait for a free slot before getting a 429
+AGENT_QUEUE_TIMEOUT = float(os.getenv('AGENT_QUEUE_TIMEOUT', '5'))
+# Value of the Retry-After header sent with 429 responses
+AGENT_RETRY_AFTER = int(os.getenv('AGENT_RETRY_AFTER', '2'))
+
+# Logging: records are queued on the request thread and written as JSON lines by
+# a background listener (agent_api.logging_pipeline), to a rotating file and stderr
+LOG_FILE = os.getenv('LOG_FILE', str(BASE_DIR / 'api_logs.log'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        # Fraction of user message / agent answer records that are kept
+        'payload_sampling': {
+            '()': 'agent_api.logging_pipeline.PayloadSampler',
+            'rate': float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.1')),
+        },
+        'trace_context': {
+            '()': 'agent_api.logging_pipeline.TraceContextFilter',
+        },
+    },
+    'handlers': {
+        'queue': {
+            # Built through a factory: from Python 3.12 dictConfig passes a queue
+            # as the first argument to any QueueHandler subclass given as 'class'
+            '()': 'agent_api.logging_pipeline.AsyncQueueHandler',
+            'filters': ['payload_sampling', 'trace_context'],
+            'filename': LOG_FILE,
+            'max_bytes': int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            'backup_count': int(os.getenv('LOG_BACKUP_COUNT', '5')),
+            # Rotate by time instead of size, e.g. "midnight"
+            'when': os.getenv('LOG_ROTATE_WHEN') or None,
+            'max_chars': int(os.getenv('LOG_MAX_MESSAGE_CHARS', '2000')),
+            'queue_size': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
 }
+
+# Batch chat endpoint (/api/chat/batch/)
+# Sessions processed at once within one batch
+BATCH_MAX_PARALLEL = int(os.getenv('BATCH_MAX_PARALLEL', '8'))
+# Largest number of items accepted in one batch
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from agent_api.views import MetricsEndpoint
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('agent_api.urls')),
+    path('metrics', MetricsEndpoint.as_view(), name='metrics'),
 ]